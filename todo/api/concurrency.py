@@ -0,0 +1,60 @@
+"""
+Blocking work of async views.
+
+DRF handlers and the ORM are synchronous. Under ASGI an async view awaits
+them in a thread pool of ASYNC_VIEW_THREADS threads per process, shared
+with the blocking parts of the middleware, so a request waiting for the
+database holds a thread only while it queries and the requests beyond the
+pool wait as coroutines, without a thread or a database connection of
+their own. Together with the sync thread of Django the pool is not larger
+than the connection pool of a database, so its threads never wait for a
+connection.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.ASYNC_VIEW_THREADS,
+        thread_name_prefix='async-view',
+    )
+
+
+@receiver(setting_changed)
+def reset_executor(setting, **kwargs):
+    if setting == 'ASYNC_VIEW_THREADS':
+        get_executor.cache_clear()
+
+
+def call_closing_connections(func, *args, **kwargs):
+    """ Call the function and release the connections it opened to the pool. """
+
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(request, func, *args, **kwargs):
+    """
+    Run the blocking function for the request in the thread pool. Without
+    an ASGI server or with ASYNC_VIEW_THREADS set to 0 it runs in the
+    thread of the request, where its connections are closed when the
+    request finishes.
+    """
+    if not isinstance(request, ASGIRequest) or not settings.ASYNC_VIEW_THREADS:
+        return await sync_to_async(func)(*args, **kwargs)
+    return await sync_to_async(
+        call_closing_connections,
+        thread_sensitive=False,
+        executor=get_executor(),
+    )(func, *args, **kwargs)
@@ -0,0 +1,140 @@
+"""
+Request-scoped loading of tasks and the rows they are rendered with.
+
+A `DataLoader` collects the keys asked for and loads the ones it hasn't
+seen yet in one batch when they are read, so every key is loaded once
+per request however many objects refer to it. `TaskLoaders` loads the
+tasks and subtasks of a batch request with loaders for their categories,
+users and subtasks and puts the loaded rows into the relations of the
+tasks, which are then serialized without further queries.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+
+from main import sharding
+from main.models import Category, Subtask
+
+
+User = get_user_model()
+
+
+class DataLoader:
+    """ Loads values by key with `batch_load(keys)`, a mapping of the keys found. """
+
+    def __init__(self, batch_load):
+        self.batch_load = batch_load
+        self.loaded = {}
+        self.pending = {}
+
+    def want(self, keys):
+        """ Queue the keys for the next batch. """
+
+        for key in keys:
+            if key not in self.loaded:
+                self.pending[key] = None
+
+    def dispatch(self):
+        """ Load the queued keys in one batch. """
+
+        if not self.pending:
+            return
+        keys = list(self.pending)
+        self.pending.clear()
+        found = self.batch_load(keys)
+        for key in keys:
+            self.loaded[key] = found.get(key)
+
+    def get_many(self, keys):
+        """ Values of the keys found, in the order of the keys. """
+
+        self.want(keys)
+        self.dispatch()
+        return [self.loaded[key] for key in keys if self.loaded[key] is not None]
+
+
+def load_by_pk(queryset):
+    return lambda keys: queryset.in_bulk(keys)
+
+
+class TaskLoaders:
+    """
+    Loaders of a batch request for the tasks related to `user` by
+    `user_field` and the subtasks of those tasks. The permissions are a
+    part of the queries: tasks and subtasks of other users are not found.
+    """
+
+    def __init__(self, tasks, user_field, user):
+        self.tasks_queryset = tasks
+        self.user_field = user_field
+        self.user = user
+        self.tasks = DataLoader(self.load_tasks)
+        self.subtasks = DataLoader(self.load_subtasks)
+        self.subtasks_of = DataLoader(self.load_subtasks_of)
+        self.categories = DataLoader(load_by_pk(Category.objects.all()))
+        self.users = DataLoader(load_by_pk(User.objects.all()))
+
+    def load_tasks(self, keys):
+        found = {}
+        for queryset in sharding.split(self.tasks_queryset):
+            found.update(queryset.in_bulk(keys))
+        return found
+
+    def load_subtasks(self, keys):
+        found = {}
+        for queryset in sharding.split(self.tasks_queryset):
+            # The subtasks are on the shard of their task.
+            subtasks = Subtask.objects.using(queryset.db).filter(
+                parent_task__deleted_at__isnull=True,
+                **{f'parent_task__{self.user_field}': self.user},
+            )
+            found.update(subtasks.in_bulk(keys))
+        return found
+
+    def load_subtasks_of(self, keys):
+        shards = defaultdict(list)
+        for task_id in keys:
+            shards[self.tasks.loaded[task_id]._state.db].append(task_id)
+        found = defaultdict(list)
+        for shard, task_ids in shards.items():
+            for subtask in Subtask.objects.using(shard).filter(parent_task_id__in=task_ids):
+                found[subtask.parent_task_id].append(subtask)
+        return {task_id: found[task_id] for task_id in keys}
+
+    def load(self, task_ids, subtask_ids, with_subtasks=True):
+        """
+        Return the tasks and subtasks found, in the order of the ids, with
+        the relations of the tasks loaded.
+        """
+        self.tasks.want(task_ids)
+        self.subtasks.want(subtask_ids)
+        self.tasks.dispatch()
+        self.subtasks.dispatch()
+        tasks = self.tasks.get_many(task_ids)
+
+        for task in tasks:
+            self.categories.want([task.category_id])
+            self.users.want([task.creator_id, task.assigned_to_id])
+            if with_subtasks:
+                self.subtasks_of.want([task.pk])
+        for loader in (self.categories, self.users, self.subtasks_of):
+            loader.dispatch()
+
+        for task in tasks:
+            task.category = self.categories.loaded[task.category_id]
+            task.creator = self.users.loaded[task.creator_id]
+            task.assigned_to = self.users.loaded[task.assigned_to_id]
+            if with_subtasks:
+                set_prefetched(task, 'related_subtasks', self.subtasks_of.loaded[task.pk])
+        return tasks, self.subtasks.get_many(subtask_ids)
+
+
+def set_prefetched(instance, name, objects):
+    """ Use the objects as the prefetched rows of the related manager `name`. """
+
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[name] = queryset
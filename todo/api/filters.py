@@ -1,16 +1,70 @@
-from django_filters import filterset
+from django.db.models import F, Q
+from django.utils import timezone
+from django_filters import filters, filterset
 
-from main.models import Task
+from main.models import Priority, Task
 
 
 class TaskFilter(filterset.FilterSet):
-    """ Class that allow filter tasks by category name. """
+    """
+    Class that allow filter tasks by category name, dates, completion,
+    priorities, assignee and progress of their subtasks. The progress is
+    read from the counters of the task row.
+    """
 
     category = filterset.CharFilter(
         field_name='category__name',
         lookup_expr='exact',
     )
+    due_date = filters.IsoDateTimeFromToRangeFilter()
+    created_at = filters.IsoDateTimeFromToRangeFilter()
+    is_completed = filterset.BooleanFilter()
+    priority = filters.TypedMultipleChoiceFilter(
+        choices=Priority.PRIORITY_CHOICES,
+        coerce=int,
+    )
+    assigned_to = filterset.NumberFilter(
+        field_name='assigned_to_id',
+    )
+    overdue = filterset.BooleanFilter(
+        method='filter_overdue',
+    )
+    has_subtasks = filterset.BooleanFilter(
+        method='filter_has_subtasks',
+    )
+    subtasks_done = filterset.BooleanFilter(
+        method='filter_subtasks_done',
+    )
+    subtasks_completed_min = filterset.NumberFilter(
+        field_name='subtasks_completed',
+        lookup_expr='gte',
+    )
+    subtasks_remaining_max = filterset.NumberFilter(
+        method='filter_subtasks_remaining_max',
+    )
 
     class Meta:
         model = Task
         fields = ('category',)
+
+    def filter_overdue(self, queryset, name, value):
+        overdue = Q(is_completed=False, due_date__lt=timezone.now())
+        if value:
+            return queryset.filter(overdue)
+        return queryset.exclude(overdue)
+
+    def filter_has_subtasks(self, queryset, name, value):
+        if value:
+            return queryset.filter(subtasks_total__gt=0)
+        return queryset.filter(subtasks_total=0)
+
+    def filter_subtasks_done(self, queryset, name, value):
+        done = Q(subtasks_total__gt=0, subtasks_completed=F('subtasks_total'))
+        if value:
+            return queryset.filter(done)
+        return queryset.exclude(done)
+
+    def filter_subtasks_remaining_max(self, queryset, name, value):
+        return queryset.filter(
+            subtasks_total__lte=F('subtasks_completed') + value,
+        )
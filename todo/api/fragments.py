@@ -0,0 +1,157 @@
+"""
+Cache of tasks rendered to JSON.
+
+The fragment of a task is its `TaskReadSerializer` representation rendered
+to JSON, stored with the generations of the task, its category and users,
+see `main.generations`. A page of tasks reads the fragments of all of them
+together with the current generations in one round-trip, loads and
+serializes only the tasks without a valid fragment, and the renderer
+splices the fragments into the response as they are.
+"""
+import hashlib
+import re
+from collections.abc import Mapping
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import json
+
+from main import generations
+from main.metrics import COUNTER, register
+
+
+# Changed together with the representation of tasks.
+VERSION = 1
+
+register(
+    'task_fragments_total',
+    COUNTER,
+    'Tasks of lists read from the fragment cache or rendered, per result.',
+)
+
+
+class Fragment(Mapping):
+    """ JSON of a task, decoded only when it is read as a mapping. """
+
+    def __init__(self, content):
+        self.content = content
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.content)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f'Fragment({self.content!r})'
+
+
+class FragmentJSONRenderer(JSONRenderer):
+    """ JSON renderer writing `Fragment` values without encoding them again. """
+
+    PLACEHOLDER = '\x00fragment:{0}\x00'
+    RENDERED_PLACEHOLDER = re.compile(rb'"\\u0000fragment:(\d+)\\u0000"')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        fragments = []
+        data = self.replace_fragments(data, fragments)
+        content = super().render(data, accepted_media_type, renderer_context)
+        if not fragments:
+            return content
+        return self.RENDERED_PLACEHOLDER.sub(
+            lambda match: fragments[int(match.group(1))],
+            content,
+        )
+
+    def replace_fragments(self, data, fragments):
+        if isinstance(data, Fragment):
+            fragments.append(data.content)
+            return self.PLACEHOLDER.format(len(fragments) - 1)
+        if isinstance(data, dict):
+            return {key: self.replace_fragments(value, fragments) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self.replace_fragments(value, fragments) for value in data]
+        return data
+
+
+def get_dependencies(task):
+    return [
+        generations.key('task', task.pk),
+        generations.key('category', task.category_id),
+        generations.key('user', task.creator_id),
+        generations.key('user', task.assigned_to_id),
+    ]
+
+
+def get_variant(serializer_class, context):
+    """ Hash of what the representation depends on besides the task. """
+
+    request = context.get('request')
+    base = request.build_absolute_uri('/') if request else ''
+    fields = ','.join(serializer_class(context=context).fields)
+    return hashlib.md5(f'{VERSION}:{base}:{fields}'.encode()).hexdigest()[:12]
+
+
+def get_fragments(page, queryset, serializer_class, context):
+    """
+    Return fragments of the tasks of the page by id. The tasks without
+    a valid fragment are loaded again from `queryset`, after the
+    generations are read, and rendered with the serializer. Tasks that
+    are gone by then are left out.
+    """
+    variant = get_variant(serializer_class, context)
+    keys = {task.pk: f'fragment:task:{variant}:{task.pk}' for task in page}
+    dependencies = {task.pk: get_dependencies(task) for task in page}
+    current, found = generations.read(
+        [name for names in dependencies.values() for name in names],
+        keys.values(),
+    )
+
+    fragments = {}
+    for task in page:
+        stored = found.get(keys[task.pk])
+        if stored is None:
+            continue
+        versions, content = stored.split(b'\n', 1)
+        if versions.decode() == get_versions(dependencies[task.pk], current):
+            fragments[task.pk] = Fragment(content)
+
+    missing = [task.pk for task in page if task.pk not in fragments]
+    if missing:
+        tasks = list(queryset.filter(pk__in=missing))
+        renderer = JSONRenderer()
+        rendered = {}
+        for task, data in zip(tasks, serializer_class(tasks, many=True, context=context).data):
+            content = renderer.render(data)
+            fragments[task.pk] = Fragment(content)
+            # The loaded task may have moved to another category or user.
+            versions = get_versions(get_dependencies(task), current)
+            if versions is not None:
+                rendered[keys[task.pk]] = versions.encode() + b'\n' + content
+        generations.store(rendered, settings.TASK_FRAGMENT_TTL)
+
+    request = context.get('request')
+    batch = getattr(request, 'metrics', None)
+    if batch is not None:
+        batch.inc('task_fragments_total', len(page) - len(missing), result='hit')
+        batch.inc('task_fragments_total', len(missing), result='miss')
+    return fragments
+
+
+def get_versions(dependencies, current):
+    """ Generations of the dependencies as stored with a fragment, None when one isn't known. """
+
+    versions = [current.get(name) for name in dependencies]
+    if None in versions:
+        return None
+    return ','.join(versions)
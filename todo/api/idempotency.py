@@ -0,0 +1,240 @@
+"""
+Replay of responses to retried requests with an `Idempotency-Key` header.
+
+The first response of a key is stored for IDEMPOTENCY_TTL together with a
+fingerprint of the request and returned again for every repeat of it.
+While a request is in progress the key is locked, a concurrent duplicate
+waits for the stored response instead of running the request once more.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from main.utils import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def describe(value):
+    if isinstance(value, UploadedFile):
+        return f'{value.name}:{value.size}'
+    return str(value)
+
+
+def get_fingerprint(request):
+    """ Hash of the method, path and parsed data of the request. """
+
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(
+        [request.method, request.path, data],
+        sort_keys=True,
+        default=describe,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_key(request, key):
+    return f'{request.user.pk}:{request.path}:{key}'
+
+
+def dump(fingerprint, response):
+    return json.dumps(
+        {
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'data': response.data,
+        },
+        cls=JSONEncoder,
+    )
+
+
+class LocalBackend:
+    """ Responses and locks in the current process, used for development and tests. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.locks = {}
+
+    def get(self, key):
+        with self.lock:
+            value, expires_at = self.responses.get(key, (None, 0))
+            return value if expires_at > time.monotonic() else None
+
+    def set(self, key, value):
+        with self.lock:
+            self.responses[key] = (value, time.monotonic() + settings.IDEMPOTENCY_TTL)
+
+    def acquire(self, key):
+        with self.lock:
+            token, expires_at = self.locks.get(key, (None, 0))
+            if expires_at > time.monotonic():
+                return None
+            token = uuid.uuid4().hex
+            self.locks[key] = (token, time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            return token
+
+    def release(self, key, token):
+        with self.lock:
+            if self.locks.get(key, (None, 0))[0] == token:
+                del self.locks[key]
+
+    def clear(self):
+        with self.lock:
+            self.responses.clear()
+            self.locks.clear()
+
+
+class RedisBackend:
+    """ Responses and locks shared by all workers in Redis keys with expiry. """
+
+    # Deletes the lock only when it is still held by the same request.
+    RELEASE = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self):
+        self.prefix = settings.IDEMPOTENCY_REDIS_PREFIX
+        self.release_script = get_redis().register_script(self.RELEASE)
+
+    def get(self, key):
+        return get_redis().get(f'{self.prefix}:{key}')
+
+    def set(self, key, value):
+        get_redis().set(f'{self.prefix}:{key}', value, ex=settings.IDEMPOTENCY_TTL)
+
+    def acquire(self, key):
+        token = uuid.uuid4().hex
+        acquired = get_redis().set(
+            f'{self.prefix}:lock:{key}',
+            token,
+            nx=True,
+            px=int(settings.IDEMPOTENCY_LOCK_TIMEOUT * 1000),
+        )
+        return token if acquired else None
+
+    def release(self, key, token):
+        self.release_script(keys=[f'{self.prefix}:lock:{key}'], args=[token])
+
+    def clear(self):
+        client = get_redis()
+        for key in client.scan_iter(f'{self.prefix}:*'):
+            client.delete(key)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.IDEMPOTENCY_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting.startswith('IDEMPOTENCY_') or setting.startswith('REDIS_'):
+        get_backend.cache_clear()
+
+
+class KeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Запрос с этим ключом идемпотентности еще выполняется.'
+    default_code = 'idempotency_key_in_use'
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'Ключ идемпотентности уже использован для другого запроса.'
+    default_code = 'idempotency_key_reused'
+
+
+def claim(backend, key):
+    """
+    Return `(stored, token)`, the stored response of the key or the token of
+    its lock. Waits up to IDEMPOTENCY_WAIT while another request holds it.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while True:
+        stored = backend.get(key)
+        if stored is not None:
+            return stored, None
+        token = backend.acquire(key)
+        if token is not None:
+            # The response may have been stored right before the lock was free.
+            stored = backend.get(key)
+            if stored is None:
+                return None, token
+            backend.release(key, token)
+            return stored, None
+        if time.monotonic() >= deadline:
+            raise KeyInUse()
+        time.sleep(0.05)
+
+
+def replay(stored, fingerprint):
+    stored = json.loads(stored)
+    if stored['fingerprint'] != fingerprint:
+        raise KeyReused()
+    return Response(
+        stored['data'],
+        status=stored['status'],
+        headers={REPLAYED_HEADER: 'true'},
+    )
+
+
+def execute(request, key, handler):
+    """
+    Return the stored response of the idempotency key or the response of
+    the handler, which is stored unless it is a server error.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValidationError(
+            {HEADER: [f'Ключ не может быть длиннее {MAX_KEY_LENGTH} символов.']}
+        )
+    backend = get_backend()
+    key = get_key(request, key)
+    fingerprint = get_fingerprint(request)
+    try:
+        stored, token = claim(backend, key)
+    except redis.RedisError:
+        logger.warning('Idempotency key %s was not checked.', key, exc_info=True)
+        return handler()
+    if stored is not None:
+        return replay(stored, fingerprint)
+
+    try:
+        response = handler()
+        if response.status_code < 500:
+            try:
+                backend.set(key, dump(fingerprint, response))
+            except redis.RedisError:
+                logger.warning('Response of idempotency key %s was not stored.', key, exc_info=True)
+        return response
+    finally:
+        try:
+            backend.release(key, token)
+        except redis.RedisError:
+            # Expires after IDEMPOTENCY_LOCK_TIMEOUT.
+            logger.warning('Idempotency key %s was not released.', key, exc_info=True)
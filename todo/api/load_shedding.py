@@ -0,0 +1,156 @@
+"""
+Load shedding of API requests.
+
+A request that waited in front of the workers longer than
+LOAD_SHEDDING_MAX_QUEUE_TIME, measured from the `X-Request-Start` header
+set by nginx, is answered with 503 at once: its client has most likely
+timed out already and running it would only make the queue longer. With
+LOAD_SHEDDING_MAX_IN_FLIGHT set, requests beyond that number in progress
+across all workers are rejected the same way.
+"""
+import logging
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+
+from main.metrics import COUNTER, HISTOGRAM, LATENCY_BUCKETS, register
+from main.utils import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE_TIME = 'queue_time'
+IN_FLIGHT = 'in_flight'
+
+register(
+    'http_queue_time_seconds',
+    HISTOGRAM,
+    'Time requests waited between the proxy and a worker.',
+    LATENCY_BUCKETS,
+)
+register(
+    'http_shed_requests_total',
+    COUNTER,
+    'Requests rejected by the load shedder per reason.',
+)
+
+
+def get_queue_time(request):
+    """ Seconds since the proxy received the request or None without the header. """
+
+    value = request.headers.get('X-Request-Start', '')
+    try:
+        started = float(value.replace('t=', '', 1))
+    except ValueError:
+        return None
+    # Seconds, milliseconds or microseconds, as proxies disagree.
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, time.time() - started)
+
+
+class LocalBackend:
+    """ Requests in progress in the current process, used for development and tests. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def enter(self, request_id, now):
+        """ Register the request and return the number of requests in progress. """
+
+        with self.lock:
+            stale = now - settings.LOAD_SHEDDING_REQUEST_TIMEOUT
+            self.requests = {
+                key: started for key, started in self.requests.items()
+                if started > stale
+            }
+            self.requests[request_id] = now
+            return len(self.requests)
+
+    def leave(self, request_id):
+        with self.lock:
+            self.requests.pop(request_id, None)
+
+
+class RedisBackend:
+    """
+    Requests in progress of all workers in a sorted set by start time.
+    Entries of requests whose worker died expire after
+    LOAD_SHEDDING_REQUEST_TIMEOUT.
+    """
+
+    def __init__(self):
+        self.key = settings.LOAD_SHEDDING_REDIS_KEY
+
+    def enter(self, request_id, now):
+        timeout = settings.LOAD_SHEDDING_REQUEST_TIMEOUT
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.zremrangebyscore(self.key, '-inf', now - timeout)
+        pipeline.zadd(self.key, {request_id: now})
+        pipeline.zcard(self.key)
+        pipeline.expire(self.key, int(timeout) + 1)
+        return pipeline.execute()[2]
+
+    def leave(self, request_id):
+        get_redis().zrem(self.key, request_id)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.LOAD_SHEDDING_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting.startswith('LOAD_SHEDDING_') or setting.startswith('REDIS_'):
+        get_backend.cache_clear()
+
+
+def reject(request, reason):
+    batch = getattr(request, 'metrics', None)
+    if batch is not None:
+        batch.inc('http_shed_requests_total', reason=reason)
+    return JsonResponse(
+        {'detail': 'Сервер перегружен, повторите запрос позже.'},
+        status=503,
+        headers={'Retry-After': str(settings.LOAD_SHEDDING_RETRY_AFTER)},
+    )
+
+
+class InFlight:
+    """ Registration of a request among the requests in progress. """
+
+    def __init__(self):
+        self.request_id = None
+
+    def enter(self):
+        """ Register the request, return False when too many are in progress. """
+
+        request_id = uuid.uuid4().hex
+        try:
+            count = get_backend().enter(request_id, time.time())
+        except redis.RedisError:
+            logger.warning('Requests in progress were not counted.', exc_info=True)
+            return True
+        self.request_id = request_id
+        return count <= settings.LOAD_SHEDDING_MAX_IN_FLIGHT
+
+    def leave(self):
+        if self.request_id is None:
+            return
+        try:
+            get_backend().leave(self.request_id)
+        except redis.RedisError:
+            # Expires after LOAD_SHEDDING_REQUEST_TIMEOUT.
+            logger.warning('Request %s was not unregistered.', self.request_id, exc_info=True)
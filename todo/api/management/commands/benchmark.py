@@ -0,0 +1,334 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from main.models import Category, Task, Subtask
+from main.tasks import send_notification
+
+
+User = get_user_model()
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, percent):
+    """ Nearest-rank percentile of already sorted values. """
+
+    index = max(0, round(percent / 100 * len(values) + 0.5) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+class Rollback(Exception):
+    """ Raised to undo the writes of a benchmarked request. """
+
+
+class Command(BaseCommand):
+    """
+    Measure latency percentiles, query counts and allocations
+    for every API endpoint and store the results as JSON.
+    """
+
+    help = 'Benchmark API endpoints against the current database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user',
+            help='Username to benchmark with, defaults to the busiest user.',
+        )
+        parser.add_argument(
+            '--only',
+            nargs='*',
+            default=(),
+            help='Names of the cases to run.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Path of the JSON report, defaults to BENCHMARK_RESULTS_DIR.',
+        )
+        parser.add_argument(
+            '--compare',
+            help='Previous JSON report to compare the results with.',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Allowed relative p95 regression when comparing.',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.user = self.get_user(options['user'])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        cases = self.get_cases()
+        if options['only']:
+            cases = {
+                name: case for name, case in cases.items()
+                if name in options['only']
+            }
+        if not cases:
+            raise CommandError('Nothing to benchmark.')
+
+        results = {}
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            TESTING=True,
+            # The iterations would use up the buckets of the user.
+            THROTTLE_ENABLED=False,
+        ):
+            for name, case in cases.items():
+                results[name] = self.measure(case)
+                self.stdout.write(self.format_result(name, results[name]))
+
+        report = {
+            'meta': self.get_meta(),
+            'results': results,
+        }
+        path = self.save(report)
+        self.stdout.write(self.style.SUCCESS(f'Report saved to {path}'))
+
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.annotate(
+                tasks_count=Count('assigned_tasks'),
+            ).order_by('-tasks_count').first()
+        if user is None:
+            raise CommandError('No user found, run `seed_data` first.')
+        return user
+
+    def get_cases(self):
+        """ Return a mapping of case names to callables making one request. """
+
+        client = self.client
+        created = Task.objects.filter(creator=self.user).first()
+        assigned = Task.objects.filter(assigned_to=self.user).first()
+        subtask = Subtask.objects.filter(parent_task=created).first()
+        category = Category.objects.first()
+        due_date = (timezone.now() + timedelta(days=1)).strftime(
+            '%Y-%m-%d %H:%M:%S'
+        )
+
+        cases = {
+            'category-list': lambda: client.get(reverse('category-list')),
+            'category-statistics': lambda: client.get(
+                reverse('category-statistics')
+            ),
+            'users-list': lambda: client.get(reverse('customuser-list')),
+            'users-detail': lambda: client.get(
+                reverse('customuser-detail', args=(self.user.id,))
+            ),
+            'tasks-update-list': lambda: client.get(
+                reverse('tasks-update-list')
+            ),
+            'tasks-update-statistics': lambda: client.get(
+                reverse('tasks-update-statistics')
+            ),
+            'creation-tasks-list': lambda: client.get(
+                reverse('creation-tasks-list')
+            ),
+        }
+        if not connection.in_atomic_block:
+            # Cost of a connection at the start of a request, Django
+            # closes it when the request is finished.
+            cases['db-connection'] = self.reconnect
+        if category:
+            cases['category-create'] = self.rolled_back(
+                lambda: client.post(
+                    reverse('category-list'), {'name': 'Benchmark'}
+                )
+            )
+            cases['creation-tasks-create'] = self.rolled_back(
+                lambda: client.post(
+                    reverse('creation-tasks-list'),
+                    {
+                        'title': 'Benchmark',
+                        'due_date': due_date,
+                        'category': category.id,
+                        'assigned_to': self.user.id,
+                    },
+                )
+            )
+        if assigned:
+            cases['tasks-update-detail'] = lambda: client.get(
+                reverse('tasks-update-detail', args=(assigned.id,))
+            )
+            cases['tasks-update-partial-update'] = self.rolled_back(
+                lambda: client.patch(
+                    reverse('tasks-update-detail', args=(assigned.id,)),
+                    {'due_date': due_date},
+                )
+            )
+            cases['notification-task'] = lambda: send_notification(assigned.id)
+        if created:
+            cases['creation-tasks-detail'] = lambda: client.get(
+                reverse('creation-tasks-detail', args=(created.id,))
+            )
+            cases['subtasks-list'] = lambda: client.get(
+                reverse('subtasks-list', args=(created.id,))
+            )
+            cases['subtasks-create'] = self.rolled_back(
+                lambda: client.post(
+                    reverse('subtasks-list', args=(created.id,)),
+                    {'title': 'Benchmark', 'parent_task': created.id},
+                )
+            )
+        if subtask:
+            cases['subtasks-detail'] = lambda: client.get(
+                reverse('subtasks-detail', args=(created.id, subtask.id))
+            )
+        return cases
+
+    @staticmethod
+    def reconnect():
+        connection.close()
+        connection.ensure_connection()
+
+    @staticmethod
+    def rolled_back(case):
+        """ Wrap a writing case so the database stays the same between runs. """
+
+        def wrapper():
+            try:
+                with transaction.atomic():
+                    response = case()
+                    raise Rollback
+            except Rollback:
+                return response
+        return wrapper
+
+    def measure(self, case):
+        for _ in range(self.options['warmup']):
+            self.check_response(case())
+
+        timings = []
+        queries = []
+        for _ in range(self.options['iterations']):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                case()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            case()
+            allocated = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        result = {
+            f'p{percent}_ms': round(percentile(timings, percent), 3)
+            for percent in PERCENTILES
+        }
+        result.update({
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries': max(queries),
+            'peak_allocated_bytes': allocated,
+        })
+        return result
+
+    @staticmethod
+    def check_response(response):
+        status_code = getattr(response, 'status_code', 200)
+        if status_code >= 400:
+            raise CommandError(
+                f'Benchmarked request failed with status {status_code}.'
+            )
+
+    @staticmethod
+    def format_result(name, result):
+        return (
+            f'{name:32} p50={result["p50_ms"]:8.2f}ms '
+            f'p95={result["p95_ms"]:8.2f}ms '
+            f'queries={result["queries"]:3} '
+            f'alloc={result["peak_allocated_bytes"] // 1024}KiB'
+        )
+
+    def get_meta(self):
+        try:
+            commit = subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'),
+                capture_output=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': self.options['iterations'],
+            'user': self.user.username,
+            'rows': {
+                'users': User.objects.count(),
+                'categories': Category.objects.count(),
+                'tasks': Task.objects.count(),
+                'subtasks': Subtask.objects.count(),
+            },
+        }
+
+    def save(self, report):
+        if self.options['output']:
+            path = self.options['output']
+        else:
+            directory = settings.BENCHMARK_RESULTS_DIR
+            directory.mkdir(parents=True, exist_ok=True)
+            stamp = timezone.now().strftime('%Y%m%d%H%M%S')
+            path = directory / f'{stamp}-{report["meta"]["commit"] or "local"}.json'
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+        return path
+
+    def compare(self, report, path):
+        with open(path) as file:
+            previous = json.load(file)['results']
+
+        regressions = []
+        for name, result in report['results'].items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            change = (result['p95_ms'] - before['p95_ms']) / max(before['p95_ms'], 1e-9)
+            line = (
+                f'{name:32} p95 {before["p95_ms"]:8.2f} -> {result["p95_ms"]:8.2f}ms '
+                f'({change:+.0%}), queries {before["queries"]} -> {result["queries"]}'
+            )
+            if change > self.options['threshold'] or result['queries'] > before['queries']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f'Regressions found: {", ".join(regressions)}.')
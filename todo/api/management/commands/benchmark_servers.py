@@ -0,0 +1,277 @@
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .benchmark import PERCENTILES, Command as BenchmarkCommand, percentile
+
+
+SERVERS = {
+    'wsgi': ('todo.wsgi:application',),
+    'asgi': (
+        'todo.asgi:application',
+        '--worker-class', 'uvicorn.workers.UvicornWorker',
+    ),
+}
+
+
+def get_children(pid):
+    """ Process ids of the direct children of the process. """
+
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                # The name of the command in parentheses may contain spaces.
+                fields = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def get_rss(pids):
+    """ Resident memory of the processes in bytes. """
+
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+class MemorySampler(threading.Thread):
+    """ Samples the resident memory of the workers until stopped. """
+
+    def __init__(self, pids, interval=0.05):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, get_rss(self.pids))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, get_rss(self.pids))
+        return self.peak
+
+
+class Command(BaseCommand):
+    """
+    Compare sync gunicorn workers with uvicorn workers serving the async
+    views: throughput, latency percentiles and worker memory per request
+    in flight at several levels of concurrency.
+    """
+
+    help = 'Benchmark the WSGI and ASGI servers under concurrent requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='*',
+            default=(1, 10, 50),
+            help='Numbers of concurrent clients.',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Requests per endpoint and concurrency.',
+        )
+        parser.add_argument(
+            '--servers',
+            nargs='*',
+            choices=tuple(SERVERS),
+            default=tuple(SERVERS),
+        )
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--user',
+            help='Username to benchmark with, defaults to the busiest user.',
+        )
+        parser.add_argument(
+            '--output',
+            help='Path of the JSON report, defaults to BENCHMARK_RESULTS_DIR.',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        user = BenchmarkCommand().get_user(options['user'])
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        self.base_url = f'http://127.0.0.1:{options["port"]}'
+        paths = {
+            name: reverse(name)
+            for name in (
+                'tasks-update-list',
+                'tasks-update-statistics',
+                'creation-tasks-list',
+            )
+        }
+
+        results = {}
+        for server in options['servers']:
+            results[server] = self.run_server(server, paths)
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': sys.version.split()[0],
+                'workers': options['workers'],
+                'requests': options['requests'],
+                'async_view_threads': settings.ASYNC_VIEW_THREADS,
+                'user': user.username,
+            },
+            'results': results,
+        }
+        path = self.save(report)
+        self.stdout.write(self.style.SUCCESS(f'Report saved to {path}'))
+
+    def run_server(self, server, paths):
+        process = subprocess.Popen(
+            (
+                'gunicorn', *SERVERS[server],
+                '--workers', str(self.options['workers']),
+                '--bind', f'127.0.0.1:{self.options["port"]}',
+            ),
+            cwd=settings.BASE_DIR,
+            env={
+                **os.environ,
+                'DEBUG': 'False',
+                'THROTTLE_ENABLED': 'false',
+            },
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_until_ready(process, next(iter(paths.values())))
+            workers = get_children(process.pid)
+            results = {}
+            for name, path in paths.items():
+                for concurrency in self.options['concurrency']:
+                    result = self.measure(path, concurrency, workers)
+                    results[f'{name}@{concurrency}'] = result
+                    self.stdout.write(self.format_result(server, name, concurrency, result))
+            return results
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def wait_until_ready(self, process, path, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited with code {process.returncode}.')
+            try:
+                self.request(path)
+            except OSError:
+                time.sleep(0.2)
+                continue
+            # Every worker imports the project before it accepts requests.
+            for _ in range(self.options['workers'] * 2):
+                self.request(path)
+            return
+        raise CommandError('Server did not start in time.')
+
+    def request(self, path):
+        """ Return the latency of the request in milliseconds, None when it failed. """
+
+        request = urllib.request.Request(self.base_url + path, headers=self.headers)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+        except urllib.error.HTTPError as error:
+            error.read()
+            return None
+        return (time.perf_counter() - started) * 1000
+
+    def measure(self, path, concurrency, workers):
+        before = get_rss(workers)
+        sampler = MemorySampler(workers)
+        sampler.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            timings = list(executor.map(
+                lambda _: self.safe_request(path),
+                range(self.options['requests']),
+            ))
+        elapsed = time.perf_counter() - started
+        peak = sampler.stop()
+
+        errors = timings.count(None)
+        timings = sorted(timing for timing in timings if timing is not None)
+        if not timings:
+            raise CommandError(f'All requests to {path} failed.')
+        result = {
+            f'p{percent}_ms': round(percentile(timings, percent), 3)
+            for percent in PERCENTILES
+        }
+        result.update({
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'requests_per_second': round(len(timings) / elapsed, 1),
+            'errors': errors,
+            'peak_rss_bytes': peak,
+            # Memory the workers took during the run for every request
+            # the clients kept in flight.
+            'rss_per_in_flight_bytes': max(0, peak - before) // concurrency,
+        })
+        return result
+
+    def safe_request(self, path):
+        try:
+            return self.request(path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def format_result(server, name, concurrency, result):
+        return (
+            f'{server:5} {name:24} c={concurrency:<4} '
+            f'rps={result["requests_per_second"]:8.1f} '
+            f'p50={result["p50_ms"]:8.2f}ms p99={result["p99_ms"]:8.2f}ms '
+            f'errors={result["errors"]:<4} '
+            f'rss/req={result["rss_per_in_flight_bytes"] // 1024}KiB'
+        )
+
+    def save(self, report):
+        if self.options['output']:
+            path = self.options['output']
+        else:
+            directory = settings.BENCHMARK_RESULTS_DIR
+            directory.mkdir(parents=True, exist_ok=True)
+            stamp = timezone.now().strftime('%Y%m%d%H%M%S')
+            path = directory / f'{stamp}-servers.json'
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+        return path
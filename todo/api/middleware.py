@@ -0,0 +1,242 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+
+from main.db import router
+from main.db.wrappers import execute_wrappers
+from main.metrics import Batch
+from . import load_shedding
+from .concurrency import run_blocking
+from .slow_queries import QueryInspector
+from .utils import get_view_name
+
+
+class QueryCounter:
+    """ Execute wrapper that counts queries and the time spent in them. """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class AsyncCapableMiddleware(ABC):
+    """
+    Middleware working in the mode of the handler. Behind the async one,
+    under ASGI, `__call__()` returns the coroutine of `acall()` and the
+    blocking parts of it run in the thread pool of the async views.
+
+    Subclasses implement both `call()` and `acall()` with the same behaviour.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        return self.call(request)
+
+    @abstractmethod
+    def call(self, request):
+        """ Handle the request behind the sync handler and return the response. """
+
+    @abstractmethod
+    async def acall(self, request):
+        """
+        Handle the request behind the async handler: await `get_response()`
+        and run blocking code with `run_blocking()`.
+        """
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """ Record request count, latency, database usage and response size per view action. """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        # Storing a batch takes a Redis round-trip, its duration is only
+        # known afterwards and gets reported with the next request.
+        self.pending_overhead = 0.0
+
+    def call(self, request):
+        started = time.perf_counter()
+        queries = QueryCounter()
+        # Other parts of the request add their samples to the same batch.
+        request.metrics = Batch()
+        with execute_wrappers(queries):
+            handled = time.perf_counter()
+            response = self.get_response(request)
+            duration = time.perf_counter() - handled
+        self.record(request, response, queries, started, duration)
+        return response
+
+    async def acall(self, request):
+        started = time.perf_counter()
+        queries = QueryCounter()
+        request.metrics = Batch()
+        with execute_wrappers(queries):
+            handled = time.perf_counter()
+            response = await self.get_response(request)
+            duration = time.perf_counter() - handled
+        await run_blocking(request, self.record, request, response, queries, started, duration)
+        return response
+
+    def record(self, request, response, queries, started, duration):
+        batch = request.metrics
+        view, action = get_view_name(request)
+        labels = {'view': view, 'action': action}
+        batch.inc(
+            'http_requests_total',
+            method=request.method,
+            status=response.status_code,
+            **labels,
+        )
+        batch.observe('http_request_duration_seconds', duration, **labels)
+        batch.inc('http_db_queries_total', queries.count, **labels)
+        batch.inc('http_db_duration_seconds_total', queries.duration, **labels)
+        if not response.streaming:
+            batch.inc('http_response_size_bytes_total', len(response.content), **labels)
+        batch.inc(
+            'metrics_overhead_seconds_total',
+            time.perf_counter() - started - duration + self.pending_overhead,
+        )
+        flushed = time.perf_counter()
+        batch.flush()
+        self.pending_overhead = time.perf_counter() - flushed
+
+
+class LoadSheddingMiddleware(AsyncCapableMiddleware):
+    """ Reject API requests with 503 before handling them when the workers are overloaded. """
+
+    def admit(self, request):
+        """ Return the rejection of the request or its registration among those in progress. """
+
+        queue_time = load_shedding.get_queue_time(request)
+        if queue_time is not None:
+            batch = getattr(request, 'metrics', None)
+            if batch is not None:
+                batch.observe('http_queue_time_seconds', queue_time)
+            if queue_time > settings.LOAD_SHEDDING_MAX_QUEUE_TIME:
+                return load_shedding.reject(request, load_shedding.QUEUE_TIME), None
+
+        if settings.LOAD_SHEDDING_MAX_IN_FLIGHT is None:
+            return None, None
+        in_flight = load_shedding.InFlight()
+        if not in_flight.enter():
+            in_flight.leave()
+            return load_shedding.reject(request, load_shedding.IN_FLIGHT), None
+        return None, in_flight
+
+    def call(self, request):
+        if not request.path.startswith(settings.LOAD_SHEDDING_PATH_PREFIX):
+            return self.get_response(request)
+
+        rejection, in_flight = self.admit(request)
+        if rejection is not None:
+            return rejection
+        try:
+            return self.get_response(request)
+        finally:
+            if in_flight is not None:
+                in_flight.leave()
+
+    async def acall(self, request):
+        if not request.path.startswith(settings.LOAD_SHEDDING_PATH_PREFIX):
+            return await self.get_response(request)
+
+        rejection, in_flight = await run_blocking(request, self.admit, request)
+        if rejection is not None:
+            return rejection
+        try:
+            return await self.get_response(request)
+        finally:
+            if in_flight is not None:
+                await run_blocking(request, in_flight.leave)
+
+
+class ReplicaMiddleware(AsyncCapableMiddleware):
+    """
+    Read from a replica in safe requests. A client that sent a request
+    which may have written reads from the primary for the next
+    REPLICA_STICKY_SECONDS, so it sees its own changes.
+    """
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES[settings.REPLICA_STICKY_COOKIE]) > time.time()
+        except (KeyError, ValueError):
+            return False
+
+    def pin(self, response):
+        response.set_cookie(
+            settings.REPLICA_STICKY_COOKIE,
+            f'{time.time() + settings.REPLICA_STICKY_SECONDS:.3f}',
+            max_age=settings.REPLICA_STICKY_SECONDS,
+            httponly=True,
+            samesite='Lax',
+        )
+        return response
+
+    def get_replica(self, request):
+        if settings.REPLICA_DATABASES and not self.is_pinned(request):
+            return router.choose_replica()
+        return None
+
+    def call(self, request):
+        if request.method not in self.SAFE_METHODS:
+            return self.pin(self.get_response(request))
+
+        alias = self.get_replica(request)
+        if alias is None:
+            return self.get_response(request)
+        with router.use_replica(alias):
+            return self.get_response(request)
+
+    async def acall(self, request):
+        if request.method not in self.SAFE_METHODS:
+            return self.pin(await self.get_response(request))
+
+        # Measuring the lag of a replica queries it.
+        alias = await run_blocking(request, self.get_replica, request)
+        if alias is None:
+            return await self.get_response(request)
+        with router.use_replica(alias):
+            return await self.get_response(request)
+
+
+class SlowQueryMiddleware(AsyncCapableMiddleware):
+    """ Capture slow and repeated queries together with their call sites. """
+
+    def call(self, request):
+        inspector = QueryInspector(request)
+        try:
+            with execute_wrappers(inspector):
+                return self.get_response(request)
+        finally:
+            inspector.report_repeated()
+
+    async def acall(self, request):
+        inspector = QueryInspector(request)
+        try:
+            with execute_wrappers(inspector):
+                return await self.get_response(request)
+        finally:
+            await run_blocking(request, inspector.report_repeated)
@@ -1,4 +1,33 @@
-from rest_framework import mixins, viewsets
+import functools
+from collections import defaultdict
+
+from django.db.models import BooleanField, CharField, Value
+from django.http import Http404
+from rest_framework import filters, mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.fields import BooleanField as BooleanParameter
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.response import Response
+
+from main import board, completion, history, sharding
+from main.models import ArchivedTask, Category, CompletionRollup, Task, TaskChange
+from main.rollups import get_timeline
+from . import fragments, idempotency
+from .concurrency import run_blocking
+from .dataloader import TaskLoaders
+from .filters import TaskFilter
+from .serializers import (
+    BatchQuerySerializer,
+    BoardCursorField,
+    BoardQuerySerializer,
+    CategorySerializer,
+    SubtaskReadSerializer,
+    TaskChangeSerializer,
+    TaskCompletionSerializer,
+    TaskReadSerializer,
+    TimelineQuerySerializer,
+)
 
 
 class ListCreateViewSet(mixins.CreateModelMixin,
@@ -14,3 +43,356 @@ class ListRetrieveUpdateViewSet(mixins.ListModelMixin,
                                 viewsets.GenericViewSet):
     """ A viewset that provides default `list()`, `retrieve()`, `update()` and `partial_update()` actions. """
     pass
+
+
+class AsyncViewSetMixin:
+    """
+    A viewset mixin that serves its actions from an async view. The DRF
+    dispatch of a request runs in the thread pool of `run_blocking()`,
+    while the request waits for it, its body and its client in the event
+    loop.
+    """
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await run_blocking(request, view, request, *args, **kwargs)
+
+        # Keeps `cls`, `actions` and `csrf_exempt` of the view for the router.
+        return functools.update_wrapper(async_view, view)
+
+
+class IdempotentCreateMixin:
+    """
+    A viewset mixin that replays the response of `create()` for requests
+    repeating the `Idempotency-Key` header of an earlier one.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(idempotency.HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        return idempotency.execute(
+            request,
+            key,
+            lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs),
+        )
+
+
+class ShardedTasksMixin:
+    """
+    A viewset mixin that reads the tasks related to the user by
+    `shard_user_field` from their shards, see `main.sharding`.
+    """
+
+    shard_user_field = None
+
+    def get_shards(self):
+        user = self.request.user
+        if self.shard_user_field == 'creator':
+            return [sharding.get_shard(user)]
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is None:
+            return sharding.get_assigned_shards(user)
+        try:
+            shard = sharding.locate(lookup)
+        except ValueError:
+            return []
+        return [shard] if shard else []
+
+    def shard_queryset(self, queryset):
+        if not sharding.is_enabled():
+            return queryset
+        return sharding.on_shards(queryset, self.get_shards())
+
+    def filter_queryset(self, queryset):
+        queryset = self.shard_queryset(queryset)
+        if isinstance(queryset, sharding.ShardedQuerySet):
+            return queryset.map(super().filter_queryset)
+        return super().filter_queryset(queryset)
+
+
+class CompletionTimelineMixin:
+    """
+    A viewset mixin that provides the `statistics/timeline` action with
+    completion analytics of the tasks related to the user by `rollup_user_field`.
+    """
+
+    rollup_user_field = None
+
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='statistics/timeline',
+    )
+    def timeline(self, request):
+        query = TimelineQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        rollups = CompletionRollup.objects.filter(
+            **{self.rollup_user_field: request.user}
+        )
+        return Response(get_timeline(rollups, **query.validated_data))
+
+
+class TaskFragmentsMixin:
+    """
+    A viewset mixin that lists tasks from their fragments cached
+    by `api.fragments`.
+    """
+
+    renderer_classes = (fragments.FragmentJSONRenderer, BrowsableAPIRenderer)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        tasks = queryset if page is None else page
+        rendered = fragments.get_fragments(
+            tasks,
+            queryset,
+            TaskReadSerializer,
+            self.get_serializer_context(),
+        )
+        data = [rendered[task.pk] for task in tasks if task.pk in rendered]
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+
+class TaskBoardMixin:
+    """
+    A viewset mixin that provides the `board` action with the filtered
+    tasks grouped by category, the first `limit` tasks of every category
+    with a link to the next ones, see `main.board`. The next tasks of a
+    category are listed with `column` and `cursor`.
+    """
+
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='board',
+    )
+    def board(self, request):
+        query = BoardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        size = query.validated_data['limit']
+        tasks = self.filter_queryset(self.get_queryset())
+
+        if 'column' in query.validated_data:
+            category_id = query.validated_data['column']
+            column = board.get_column(
+                tasks,
+                category_id,
+                size + 1,
+                after=query.validated_data.get('cursor'),
+            )
+            columns = {category_id: column[:size]}
+            has_more = {category_id: len(column) > size}
+            counts = {}
+        else:
+            columns, counts = board.get_columns(tasks, size)
+            has_more = {
+                category_id: counts[category_id] > len(column)
+                for category_id, column in columns.items()
+            }
+
+        page = [task for column in columns.values() for task in column]
+        rendered = fragments.get_fragments(
+            page,
+            self.prefetch_board(tasks),
+            TaskReadSerializer,
+            self.get_serializer_context(),
+        )
+        categories = Category.objects.filter(id__in=columns).order_by('name', 'id')
+        results = []
+        for category in categories:
+            column = columns[category.id]
+            result = {
+                'category': CategorySerializer(category).data,
+                'tasks': [rendered[task.pk] for task in column if task.pk in rendered],
+                'next': self.get_board_link(category.id, column) if has_more[category.id] else None,
+            }
+            if category.id in counts:
+                result['count'] = counts[category.id]
+            results.append(result)
+        return Response({'results': results})
+
+    def prefetch_board(self, tasks):
+        if isinstance(tasks, sharding.ShardedQuerySet):
+            return tasks.map(self.prefetch_board)
+        return tasks.select_related(
+            'category', 'creator', 'assigned_to',
+        ).prefetch_related('related_subtasks')
+
+    def get_board_link(self, category_id, column):
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, 'column', category_id)
+        return replace_query_param(
+            url,
+            'cursor',
+            BoardCursorField().to_representation(board.get_position(column[-1])),
+        )
+
+
+class TaskBatchMixin:
+    """
+    A viewset mixin that provides the `batch` action with the tasks of
+    `ids` and the subtasks of `subtask_ids` in one response. Only the
+    tasks related to the user by `shard_user_field` and their subtasks
+    are found, the others are left out. The tasks are loaded with
+    `api.dataloader.TaskLoaders`.
+    """
+
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='batch',
+    )
+    def batch(self, request):
+        query = BatchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        context = self.get_serializer_context()
+        with_subtasks = 'subtasks' in TaskReadSerializer(context=context).fields
+        loaders = TaskLoaders(
+            self.shard_queryset(self.get_queryset()),
+            self.shard_user_field,
+            request.user,
+        )
+        tasks, subtasks = loaders.load(
+            query.validated_data['ids'],
+            query.validated_data['subtask_ids'],
+            with_subtasks=with_subtasks,
+        )
+        return Response({
+            'tasks': TaskReadSerializer(tasks, many=True, context=context).data,
+            'subtasks': SubtaskReadSerializer(subtasks, many=True).data,
+        })
+
+
+class TaskHistoryMixin:
+    """
+    A viewset mixin that provides the `history` action with the changes
+    of the task and its subtasks recorded by `main.history`, newest first.
+    """
+
+    @action(
+        detail=True,
+        methods=('get',),
+        url_path='history',
+    )
+    def history(self, request, pk=None):
+        task = self.get_object()
+        changes = TaskChange.objects.filter(task_id=task.pk).select_related('changed_by')
+        page = self.paginate_queryset(changes)
+        return self.get_paginated_response(TaskChangeSerializer(page, many=True).data)
+
+
+class TaskCompletionMixin:
+    """
+    A viewset mixin that provides the `complete` and `reopen` actions,
+    toggling the task with one conditional UPDATE of `main.completion`.
+    The task is found in the queryset of the viewset, toggling a task that
+    is already in the state changes nothing.
+    """
+
+    @action(
+        detail=True,
+        methods=('post',),
+        url_path='complete',
+    )
+    def complete(self, request, pk=None):
+        return self.toggle_completion(completion.complete)
+
+    @action(
+        detail=True,
+        methods=('post',),
+        url_path='reopen',
+    )
+    def reopen(self, request, pk=None):
+        return self.toggle_completion(completion.reopen)
+
+    def toggle_completion(self, toggle):
+        try:
+            task_id = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        with history.recording(self.request.user):
+            task, _ = toggle(self.shard_queryset(self.get_queryset()), task_id)
+        if task is None:
+            raise Http404
+        return Response(TaskCompletionSerializer(task).data)
+
+
+class IncludeArchivedMixin:
+    """
+    A viewset mixin that lists archived tasks of the user related to them
+    by `archived_user_field` together with the current ones when
+    `?include_archived=true` is passed.
+    """
+
+    archived_user_field = None
+
+    def include_archived(self):
+        value = self.request.query_params.get('include_archived', '')
+        return value.lower() in BooleanParameter.TRUE_VALUES
+
+    def get_archived_queryset(self):
+        queryset = ArchivedTask.objects.filter(
+            **{self.archived_user_field: self.request.user}
+        )
+        return TaskFilter(
+            self.request.query_params,
+            queryset=queryset,
+            request=self.request,
+        ).qs
+
+    def get_rows(self, tasks, columns, ordering):
+        """ Ids and sort keys of the current and archived tasks on the database of `tasks`. """
+
+        shard = Value(tasks.db, output_field=CharField())
+        return tasks.order_by().annotate(
+            archived=Value(False, output_field=BooleanField()),
+            shard=shard,
+        ).values(*columns, 'archived', 'shard').union(
+            self.get_archived_queryset().using(tasks.db).order_by().annotate(
+                archived=Value(True, output_field=BooleanField()),
+                shard=shard,
+            ).values(*columns, 'archived', 'shard'),
+            all=True,
+        ).order_by(*ordering, '-id')
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+
+        shards = sharding.split(self.filter_queryset(self.get_queryset()))
+        ordering = (
+            filters.OrderingFilter().get_ordering(request, shards[0], self)
+            or Task._meta.ordering
+        )
+        columns = ['id', *{field.lstrip('-') for field in ordering}]
+        # Only ids and sort keys of both tables are paginated, the page
+        # itself is loaded afterwards.
+        rows = [self.get_rows(tasks, columns, ordering) for tasks in shards]
+        page = self.paginate_queryset(
+            rows[0] if len(rows) == 1 else sharding.ShardedQuerySet(rows)
+        )
+
+        ids = defaultdict(list)
+        for row in page:
+            ids[row['archived'], row['shard']].append(row['id'])
+        instances = {}
+        for (archived, shard), shard_ids in ids.items():
+            model = ArchivedTask if archived else Task
+            queryset = model.objects.using(shard).filter(id__in=shard_ids).select_related(
+                'category', 'creator', 'assigned_to',
+            ).prefetch_related('related_subtasks')
+            instances.update(
+                ((archived, instance.id), instance) for instance in queryset
+            )
+        serializer = self.get_serializer(
+            [instances[row['archived'], row['id']] for row in page],
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
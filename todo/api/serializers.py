@@ -1,14 +1,46 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator
-from django.db.models import Avg, F
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
 from django.utils import timezone
 from rest_framework import serializers
 
-from main.models import Category, Task, Subtask
+from main import history
+from main.models import (
+    ArchivedTask,
+    Category,
+    CategoryStats,
+    DeletionJob,
+    Task,
+    TaskChange,
+    TaskTemplate,
+    Subtask,
+)
 
 
 User = get_user_model()
 
+TIMELINE_DEFAULT_RANGE = timedelta(days=30)
+
+
+class TaskRelatedField(serializers.PrimaryKeyRelatedField):
+    """ Primary key field of a task looked up on its shard. """
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            return self.get_queryset().on_shard_of(data).get(pk=data)
+        except ObjectDoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
 
 class UserSerializer(serializers.ModelSerializer):
     """ User serializer. """
@@ -44,9 +76,17 @@ class UserTaskAnaliseSerializer(serializers.ModelSerializer):
         return obj.count()
 
     def get_average_time(self, obj):
-        return obj.filter(is_completed=True).aggregate(
-                average_time=Avg(F('finish_date') - F('created_at'))
-            )['average_time']
+        # A sum and a count, unlike an average, add up across shards.
+        result = obj.filter(is_completed=True).aggregate(
+            total_time=Sum(ExpressionWrapper(
+                F('finish_date') - F('created_at'),
+                output_field=DurationField(),
+            )),
+            finished=Count('finish_date'),
+        )
+        if not result['finished']:
+            return None
+        return result['total_time'] / result['finished']
 
     def get_completed_tasks_count(self, obj):
         return obj.filter(is_completed=True).count()
@@ -69,6 +109,28 @@ class CategorySerializer(serializers.ModelSerializer):
         )
 
 
+class CategoryStatsSerializer(serializers.ModelSerializer):
+    """ Category analytics serializer. """
+
+    id = serializers.IntegerField(source='category_id')
+    name = serializers.CharField(source='category.name')
+    median_cycle_time = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CategoryStats
+        fields = (
+            'id',
+            'name',
+            'open_count',
+            'completed_count',
+            'overdue_count',
+            'median_cycle_time',
+        )
+
+    def get_median_cycle_time(self, obj):
+        return obj.median_cycle_time
+
+
 class TaskReadSerializer(serializers.ModelSerializer):
     """ Task serializer for reading. """
 
@@ -78,6 +140,7 @@ class TaskReadSerializer(serializers.ModelSerializer):
     assigned_to = UserSerializer()
     subtasks = serializers.SerializerMethodField()
     priority = serializers.SerializerMethodField()
+    is_archived = serializers.SerializerMethodField()
 
     class Meta:
         model = Task
@@ -93,9 +156,21 @@ class TaskReadSerializer(serializers.ModelSerializer):
             'assigned_to',
             'priority',
             'subtasks',
+            'subtasks_total',
+            'subtasks_completed',
             'is_completed',
+            'is_archived',
         )
 
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        value = request.query_params.get('include_subtasks', '') if request else ''
+        if value.lower() in serializers.BooleanField.FALSE_VALUES:
+            # The counters are enough for the progress of every task.
+            fields.pop('subtasks')
+        return fields
+
     def get_file(self, obj):
         if obj.file:
             request = self.context.get('request')
@@ -108,15 +183,27 @@ class TaskReadSerializer(serializers.ModelSerializer):
     def get_priority(self, obj):
         return obj.get_priority_display()
 
+    def get_is_archived(self, obj):
+        return isinstance(obj, ArchivedTask)
+
+
+class RecordedUpdateMixin:
+    """ A serializer mixin recording the changes made by `update()` in the task history. """
 
-class SubtaskCreateSerializer(serializers.ModelSerializer):
+    def update(self, instance, validated_data):
+        request = self.context.get('request')
+        with history.recording(getattr(request, 'user', None)):
+            return super().update(instance, validated_data)
+
+
+class SubtaskCreateSerializer(RecordedUpdateMixin, serializers.ModelSerializer):
     """ Subtask serializer. """
 
     creator = serializers.HiddenField(
         default=serializers.CurrentUserDefault(),
     )
-    parent_task = serializers.PrimaryKeyRelatedField(
-        queryset=Task.objects.all(),
+    parent_task = TaskRelatedField(
+        queryset=Task.objects.visible(),
     )
 
     class Meta:
@@ -149,11 +236,11 @@ class SubtaskCreateSerializer(serializers.ModelSerializer):
         return SubtaskReadSerializer(instance).data
 
 
-class TaskCreateSerializer(serializers.ModelSerializer):
+class TaskCreateSerializer(RecordedUpdateMixin, serializers.ModelSerializer):
     """ Task serializer for creation. """
 
     category = serializers.PrimaryKeyRelatedField(
-        queryset=Category.objects.all(),
+        queryset=Category.objects.filter(deleted_at__isnull=True),
     )
     creator = serializers.HiddenField(
         default=serializers.CurrentUserDefault(),
@@ -165,7 +252,7 @@ class TaskCreateSerializer(serializers.ModelSerializer):
         )]
     )
     assigned_to = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all(),
+        queryset=User.objects.filter(deleted_at__isnull=True),
     )
 
     class Meta:
@@ -186,7 +273,7 @@ class TaskCreateSerializer(serializers.ModelSerializer):
         return TaskReadSerializer(instance, context=self.context).data
 
 
-class TaskUpdateSerializer(serializers.ModelSerializer):
+class TaskUpdateSerializer(RecordedUpdateMixin, serializers.ModelSerializer):
     """ Serializer for update tasks by assigned user. """
 
     due_date = serializers.DateTimeField(
@@ -208,6 +295,18 @@ class TaskUpdateSerializer(serializers.ModelSerializer):
         return TaskReadSerializer(instance, context=self.context).data
 
 
+class TaskCompletionSerializer(serializers.ModelSerializer):
+    """ Completion state of a task. """
+
+    class Meta:
+        model = Task
+        fields = (
+            'id',
+            'is_completed',
+            'finish_date',
+        )
+
+
 class SubtaskReadSerializer(serializers.ModelSerializer):
     """ Subtask serializer. """
 
@@ -221,4 +320,228 @@ class SubtaskReadSerializer(serializers.ModelSerializer):
         )
 
 
+class TaskTemplateSerializer(serializers.ModelSerializer):
+    """ Serializer of recurring task templates. """
+
+    category = serializers.PrimaryKeyRelatedField(
+        queryset=Category.objects.filter(deleted_at__isnull=True),
+    )
+    creator = serializers.HiddenField(
+        default=serializers.CurrentUserDefault(),
+    )
+    assigned_to = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.filter(deleted_at__isnull=True),
+    )
+    interval = serializers.IntegerField(
+        min_value=1,
+        required=False,
+    )
+
+    class Meta:
+        model = TaskTemplate
+        fields = (
+            'id',
+            'title',
+            'description',
+            'category',
+            'creator',
+            'assigned_to',
+            'priority',
+            'frequency',
+            'interval',
+            'weekdays',
+            'starts_at',
+            'until',
+            'generated_until',
+            'is_active',
+        )
+        read_only_fields = (
+            'generated_until',
+        )
+
+    def validate_weekdays(self, value):
+        try:
+            weekdays = {int(day) for day in value.split(',')} if value else set()
+        except ValueError:
+            weekdays = {-1}
+        if not weekdays <= set(range(7)):
+            raise serializers.ValidationError(
+                'Дни недели указываются числами от 0 (понедельник) '
+                'до 6 (воскресенье) через запятую.'
+            )
+        return ','.join(str(day) for day in sorted(weekdays))
+
+    def validate(self, attrs):
+        starts_at = attrs.get('starts_at', getattr(self.instance, 'starts_at', None))
+        until = attrs.get('until', getattr(self.instance, 'until', None))
+        if until and starts_at and until < starts_at:
+            raise serializers.ValidationError(
+                {'until': 'Дата окончания повторений не может быть меньше даты начала.'}
+            )
+        return attrs
+
+
+class TimelineQuerySerializer(serializers.Serializer):
+    """ Query parameters of the completion timeline. """
 
+    period = serializers.ChoiceField(
+        choices=('day', 'week', 'month'),
+        default='day',
+    )
+    date_from = serializers.DateField(
+        required=False,
+    )
+    date_to = serializers.DateField(
+        required=False,
+    )
+    category = serializers.IntegerField(
+        required=False,
+    )
+    group_by = serializers.MultipleChoiceField(
+        choices=('category', 'assigned_to', 'creator'),
+        required=False,
+    )
+
+    def validate(self, attrs):
+        attrs.setdefault('date_to', timezone.localdate())
+        attrs.setdefault('date_from', attrs['date_to'] - TIMELINE_DEFAULT_RANGE)
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError(
+                {'date_from': 'Начало периода не может быть позже его окончания.'}
+            )
+        attrs['group_by'] = sorted(attrs.get('group_by', ()))
+        return attrs
+
+
+class CalendarQuerySerializer(serializers.Serializer):
+    """ Query parameters of the calendar feed. """
+
+    date_from = serializers.DateField(
+        required=False,
+    )
+    date_to = serializers.DateField(
+        required=False,
+    )
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError(
+                {'date_from': 'Начало периода не может быть позже его окончания.'}
+            )
+        return attrs
+
+
+class BatchQuerySerializer(serializers.Serializer):
+    """ Query parameters of the batch retrieval of tasks and subtasks. """
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        default=list,
+    )
+    subtask_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        default=list,
+    )
+
+    def validate(self, attrs):
+        attrs['ids'] = list(dict.fromkeys(attrs['ids']))
+        attrs['subtask_ids'] = list(dict.fromkeys(attrs['subtask_ids']))
+        total = len(attrs['ids']) + len(attrs['subtask_ids'])
+        if not total:
+            raise serializers.ValidationError(
+                {'ids': 'Укажите хотя бы одну задачу или подзадачу.'}
+            )
+        if total > settings.BATCH_RETRIEVE_MAX_IDS:
+            raise serializers.ValidationError(
+                {'ids': f'Можно запросить не больше {settings.BATCH_RETRIEVE_MAX_IDS} задач и подзадач.'}
+            )
+        return attrs
+
+
+class BoardCursorField(serializers.Field):
+    """ Opaque position of the last task shown in a board column. """
+
+    default_error_messages = {
+        'invalid': 'Неверный курсор.',
+    }
+
+    def to_internal_value(self, data):
+        try:
+            priority, due_date, pk = json.loads(base64.urlsafe_b64decode(data.encode()))
+            return int(priority), datetime.fromisoformat(due_date), int(pk)
+        except (TypeError, ValueError):
+            self.fail('invalid')
+
+    def to_representation(self, value):
+        priority, due_date, pk = value
+        payload = json.dumps([priority, due_date.isoformat(), pk])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+class BoardQuerySerializer(serializers.Serializer):
+    """ Query parameters of the task board. """
+
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.BOARD_MAX_COLUMN_SIZE,
+        default=settings.BOARD_COLUMN_SIZE,
+    )
+    column = serializers.IntegerField(
+        required=False,
+    )
+    cursor = BoardCursorField(
+        required=False,
+    )
+
+    def validate(self, attrs):
+        if 'cursor' in attrs and 'column' not in attrs:
+            raise serializers.ValidationError(
+                {'column': 'Курсор задается вместе с категорией.'}
+            )
+        return attrs
+
+
+class TaskChangeSerializer(serializers.ModelSerializer):
+    """ Change of a task or of one of its subtasks. """
+
+    subtask = serializers.IntegerField(
+        source='subtask_id',
+    )
+    changed_by = UserSerializer()
+
+    class Meta:
+        model = TaskChange
+        fields = (
+            'id',
+            'subtask',
+            'field',
+            'old_value',
+            'new_value',
+            'changed_by',
+            'changed_at',
+        )
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    """ Background deletion serializer. """
+
+    model = serializers.CharField(source='content_type.model')
+    progress = serializers.FloatField()
+
+    class Meta:
+        model = DeletionJob
+        fields = (
+            'id',
+            'model',
+            'object_id',
+            'object_repr',
+            'status',
+            'total',
+            'deleted',
+            'progress',
+            'error',
+            'created_at',
+            'finished_at',
+        )
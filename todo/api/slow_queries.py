@@ -0,0 +1,218 @@
+"""
+Capture of slow and repeated (N+1) queries.
+
+Queries are attributed to the first stack frame inside the project and to
+the DRF view action that issued them. EXPLAIN output of slow queries is
+collected in a background thread, so the request doesn't wait for it.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from main.db import wrappers
+from main.utils import get_redis
+from .utils import get_view_name
+
+
+logger = logging.getLogger(__name__)
+
+SLOW = 'slow'
+N_PLUS_ONE = 'n_plus_one'
+
+IN_LIST = re.compile(r'IN \(%s(?:, %s)*\)')
+WHITESPACE = re.compile(r'\s+')
+
+IGNORED_FILES = {
+    __file__,
+    os.path.join(os.path.dirname(__file__), 'middleware.py'),
+    wrappers.__file__,
+}
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+
+
+def get_shape(sql):
+    """ Return the query without the variable length parts of it. """
+
+    return IN_LIST.sub('IN (...)', WHITESPACE.sub(' ', sql))
+
+
+def get_call_site():
+    """ Return the innermost frame of the project code as `path:line in function`. """
+
+    project = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+                filename.startswith(project)
+                and filename not in IGNORED_FILES
+                and 'site-packages' not in filename
+        ):
+            return '{0}:{1} in {2}'.format(
+                os.path.relpath(filename, project),
+                frame.f_lineno,
+                frame.f_code.co_name,
+            )
+        frame = frame.f_back
+    return None
+
+
+def explain(alias, sql, params):
+    connection = connections[alias]
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}',
+                params,
+            )
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
+    except Exception as error:
+        return f'EXPLAIN failed: {error}'
+    finally:
+        connection.close()
+
+
+def record_slow_query(entry, alias, sql, params):
+    entry['plan'] = explain(alias, sql, params)
+    store(entry)
+
+
+def store(entry):
+    try:
+        get_backend().push(entry)
+    except redis.RedisError:
+        logger.warning('Slow query was not stored.', exc_info=True)
+
+
+class QueryInspector:
+    """ Execute wrapper collecting slow and repeated queries of one request on all databases. """
+
+    def __init__(self, request):
+        self.request = request
+        self.threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        self.repeat_threshold = settings.SLOW_QUERY_REPEAT_THRESHOLD
+        self.shapes = defaultdict(lambda: {'count': 0, 'duration': 0.0})
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            alias = context['connection'].alias
+            shape = self.shapes[alias, get_shape(sql)]
+            shape['count'] += 1
+            shape['duration'] += duration
+            if shape['count'] == self.repeat_threshold:
+                shape['call_site'] = get_call_site()
+            if duration >= self.threshold:
+                self.slow_query(alias, sql, params, many, duration)
+
+    def get_entry(self, kind, alias, sql, **kwargs):
+        view, action = get_view_name(self.request)
+        return {
+            'kind': kind,
+            'sql': sql,
+            'view': f'{view}.{action}',
+            'path': self.request.path,
+            'database': alias,
+            'created_at': timezone.now().isoformat(),
+            **kwargs,
+        }
+
+    def slow_query(self, alias, sql, params, many, duration):
+        entry = self.get_entry(
+            SLOW,
+            alias,
+            sql,
+            duration_ms=round(duration * 1000, 3),
+            call_site=get_call_site(),
+        )
+        if many:
+            store(entry)
+            return
+        executor.submit(record_slow_query, entry, alias, sql, params)
+
+    def report_repeated(self):
+        for (alias, sql), shape in self.shapes.items():
+            if shape['count'] >= self.repeat_threshold:
+                store(self.get_entry(
+                    N_PLUS_ONE,
+                    alias,
+                    sql,
+                    count=shape['count'],
+                    duration_ms=round(shape['duration'] * 1000, 3),
+                    call_site=shape['call_site'],
+                ))
+
+
+class LocalBackend:
+    """ Ring buffer in the current process, used for development and tests. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=settings.SLOW_QUERY_BUFFER_SIZE)
+
+    def push(self, entry):
+        with self.lock:
+            self.entries.appendleft(entry)
+
+    def get(self):
+        with self.lock:
+            return list(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisBackend:
+    """ Ring buffer shared by all workers in a capped Redis list. """
+
+    def __init__(self):
+        self.key = settings.SLOW_QUERY_REDIS_KEY
+        self.size = settings.SLOW_QUERY_BUFFER_SIZE
+
+    def push(self, entry):
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.lpush(self.key, json.dumps(entry))
+        pipeline.ltrim(self.key, 0, self.size - 1)
+        pipeline.execute()
+
+    def get(self):
+        return [json.loads(entry) for entry in get_redis().lrange(self.key, 0, -1)]
+
+    def clear(self):
+        get_redis().delete(self.key)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.SLOW_QUERY_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting.startswith('SLOW_QUERY_'):
+        get_backend.cache_clear()
@@ -0,0 +1,183 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main.archive import archive
+from main.models import (
+    ArchivedSubtask,
+    ArchivedTask,
+    Category,
+    CompletionRollup,
+    Subtask,
+    Task,
+)
+
+User = get_user_model()
+
+
+class TestArchive(APITestCase):
+    """ Test archival of old completed tasks. """
+
+    CREATOR_URL = '/api/v1/creation-tasks/'
+    ASSIGNED_URL = '/api/v1/tasks/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestArchive, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.first_category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.second_category = Category.objects.create(
+            name='Вторая категория',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.first_user)
+        now = timezone.now()
+        self.old_tasks = [
+            self.create_task(
+                f'Старая {number}',
+                finish_date=now - timedelta(days=400 + number),
+                is_completed=True,
+                priority=Task.HIGH_INDEX if number else Task.LOW_INDEX,
+            )
+            for number in range(3)
+        ]
+        Subtask.objects.create(
+            title='Подзадача',
+            parent_task=self.old_tasks[0],
+            creator=self.first_user,
+        )
+        self.recent_task = self.create_task(
+            'Недавняя',
+            finish_date=now - timedelta(days=1),
+            is_completed=True,
+        )
+        self.open_task = self.create_task(
+            'Открытая',
+            category=self.second_category,
+        )
+        self.other_task = self.create_task(
+            'Чужая',
+            finish_date=now - timedelta(days=400),
+            is_completed=True,
+            creator=self.second_user,
+            assigned_to=self.second_user,
+        )
+
+    def create_task(self, title, **kwargs):
+        return Task.objects.create(**{
+            'title': title,
+            'category': self.first_category,
+            'creator': self.first_user,
+            'assigned_to': self.first_user,
+            **kwargs,
+        })
+
+    def test_archive_moves_tasks_with_subtasks(self):
+        rollups = list(CompletionRollup.objects.values_list('completed_count', flat=True))
+
+        self.assertEqual(archive(batch_size=2), 4)
+
+        self.assertEqual(
+            set(ArchivedTask.objects.values_list('id', flat=True)),
+            {task.id for task in self.old_tasks} | {self.other_task.id},
+        )
+        self.assertEqual(
+            set(Task.objects.values_list('id', flat=True)),
+            {self.recent_task.id, self.open_task.id},
+        )
+        self.assertFalse(Subtask.objects.exists())
+        archived_subtask = ArchivedSubtask.objects.get()
+        self.assertEqual(archived_subtask.parent_task_id, self.old_tasks[0].id)
+        archived = ArchivedTask.objects.get(id=self.old_tasks[0].id)
+        self.assertEqual(archived.finish_date, self.old_tasks[0].finish_date)
+        self.assertEqual(archived.created_at, self.old_tasks[0].created_at)
+        self.assertEqual(
+            list(CompletionRollup.objects.values_list('completed_count', flat=True)),
+            rollups,
+        )
+
+        self.assertEqual(archive(), 0)
+
+    def test_list_excludes_archived_by_default(self):
+        archive()
+
+        response = self.client.get(self.CREATOR_URL)
+
+        self.assertEqual(response.data['count'], 2)
+        self.assertFalse(any(task['is_archived'] for task in response.data['results']))
+
+    def test_list_includes_archived(self):
+        archive()
+
+        response = self.client.get(self.CREATOR_URL, {'include_archived': 'true'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5)
+        results = response.data['results']
+        expected = sorted(
+            [*self.old_tasks, self.recent_task, self.open_task],
+            key=lambda task: (task.created_at, task.id),
+            reverse=True,
+        )
+        self.assertEqual(
+            [task['id'] for task in results],
+            [task.id for task in expected],
+        )
+        archived = {task['id']: task for task in results if task['is_archived']}
+        self.assertEqual(set(archived), {task.id for task in self.old_tasks})
+        self.assertEqual(len(archived[self.old_tasks[0].id]['subtasks']), 1)
+        self.assertEqual(
+            archived[self.old_tasks[0].id]['category']['name'],
+            self.first_category.name,
+        )
+
+    def test_include_archived_with_filter_ordering_and_pages(self):
+        archive()
+
+        response = self.client.get(
+            self.ASSIGNED_URL,
+            {
+                'include_archived': '1',
+                'category': self.first_category.name,
+                'ordering': '-priority',
+            },
+        )
+
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(
+            [task['priority'] for task in response.data['results']][:2],
+            [Task.HIGH_STATUS, Task.HIGH_STATUS],
+        )
+
+        response = self.client.get(
+            self.ASSIGNED_URL,
+            {'include_archived': 'true', 'page': 2},
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_command_reports_before_and_after(self):
+        output = StringIO()
+
+        call_command('archive_tasks', iterations=1, stdout=output)
+
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('Before: 6 tasks'))
+        self.assertTrue(lines[1].startswith('Archived 4 tasks'))
+        self.assertTrue(lines[2].startswith('After: 2 tasks'))
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import slow_queries
+from api.concurrency import run_blocking
+from main.models import Category, Subtask, Task
+from todo.asgi import application
+
+User = get_user_model()
+
+
+async def call_application(path, headers=()):
+    """ Send a GET request to the ASGI application and return the response status. """
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), *headers],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+@override_settings(
+    # The queries of the views run in the thread of the test, which sees
+    # the data of its transaction.
+    ASYNC_VIEW_THREADS=0,
+    SLOW_QUERY_BACKEND='api.slow_queries.LocalBackend',
+    SLOW_QUERY_REPEAT_THRESHOLD=3,
+    THROTTLE_ENABLED=False,
+)
+class TestAsyncViews(APITestCase):
+    """ Test task endpoints served by async views. """
+
+    URL = '/api/v1/creation-tasks/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestAsyncViews, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.tasks = []
+        for number in range(4):
+            task = Task.objects.create(
+                title=f'Task {number}',
+                due_date=timezone.now()+timedelta(days=1),
+                category=cls.category,
+                creator=cls.user,
+                assigned_to=cls.user,
+            )
+            Subtask.objects.create(
+                title='Subtask',
+                parent_task=task,
+                creator=cls.user,
+            )
+            cls.tasks.append(task)
+
+    def setUp(self):
+        slow_queries.get_backend().clear()
+        self.authorization = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def test_task_views_are_async(self):
+        self.assertTrue(asyncio.iscoroutinefunction(resolve(self.URL).func))
+        self.assertTrue(asyncio.iscoroutinefunction(resolve('/api/v1/tasks/statistics/').func))
+        self.assertFalse(asyncio.iscoroutinefunction(resolve('/api/v1/users/').func))
+
+    async def test_list_through_asgi_handler(self):
+        response = await self.async_client.get(self.URL, authorization=self.authorization)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [task['id'] for task in response.json()['results']],
+            [task.id for task in reversed(self.tasks)],
+        )
+        # The middleware sees the queries made in the thread of the view.
+        entries = [
+            entry for entry in slow_queries.get_backend().get()
+            if entry['kind'] == slow_queries.N_PLUS_ONE and 'main_subtask' in entry['sql']
+        ]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['view'], 'TaskViewSet.list')
+        self.assertEqual(entries[0]['count'], 4)
+
+    async def test_statistics_through_asgi_handler(self):
+        response = await self.async_client.get(
+            '/api/v1/tasks/statistics/',
+            authorization=self.authorization,
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['tasks_count'], 4)
+
+    def test_sync_client_is_served(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 4)
+
+    @override_settings(ASYNC_VIEW_THREADS=2)
+    def test_blocking_calls_are_bounded(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+        threads = set()
+
+        def call():
+            with lock:
+                running.append(None)
+                peak.append(len(running))
+                threads.add(threading.get_ident())
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+        async def run():
+            request = AsyncRequestFactory().get(self.URL)
+            await asyncio.gather(*(run_blocking(request, call) for _ in range(6)))
+
+        async_to_sync(run)()
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(len(peak), 6)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    @override_settings(ASYNC_VIEW_THREADS=2)
+    def test_requests_beyond_pool_share_bounded_threads(self):
+        # A connection pool of 3 connections: 2 for the threads of the
+        # views and middleware, 1 for the sync thread of Django.
+        max_size = 3
+        lock = threading.Lock()
+        threads = set()
+
+        def release_connections(*args, **kwargs):
+            with lock:
+                threads.add(threading.get_ident())
+            close_old_connections()
+
+        async def run():
+            return await asyncio.gather(*(
+                call_application(self.URL) for _ in range(max_size * 3)
+            ))
+
+        # Every thread serving the requests releases its connections there.
+        request_started.connect(release_connections)
+        request_finished.connect(release_connections)
+        try:
+            with mock.patch('api.concurrency.close_old_connections', release_connections):
+                # Without an outer `async_to_sync()`, like under uvicorn.
+                statuses = asyncio.run(run())
+        finally:
+            request_started.disconnect(release_connections)
+            request_finished.disconnect(release_connections)
+
+        self.assertEqual(statuses, [status.HTTP_401_UNAUTHORIZED] * max_size * 3)
+        self.assertLessEqual(len(threads), max_size)
@@ -0,0 +1,140 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main.models import Category, Subtask, Task
+
+User = get_user_model()
+
+
+@override_settings(
+    ASYNC_VIEW_THREADS=0,
+    BATCH_RETRIEVE_MAX_IDS=8,
+    THROTTLE_ENABLED=False,
+)
+class TestTaskBatch(APITestCase):
+    """ Test the retrieval of many tasks and subtasks at once. """
+
+    CREATOR_URL = '/api/v1/creation-tasks/batch/'
+    ASSIGNED_URL = '/api/v1/tasks/batch/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestTaskBatch, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.other_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.first_category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.second_category = Category.objects.create(
+            name='Вторая категория',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.first = self.create_task('Первая', self.user, self.other_user, self.first_category)
+        self.second = self.create_task('Вторая', self.user, self.user, self.second_category)
+        self.assigned = self.create_task('Назначенная', self.other_user, self.user, self.first_category)
+        self.foreign = self.create_task('Чужая', self.other_user, self.other_user, self.first_category)
+        self.subtask = self.create_subtask('Подзадача', self.first)
+        self.assigned_subtask = self.create_subtask('Назначенная подзадача', self.assigned)
+        self.foreign_subtask = self.create_subtask('Чужая подзадача', self.foreign)
+
+    def create_task(self, title, creator, assigned_to, category):
+        return Task.objects.create(
+            title=title,
+            due_date=timezone.now() + timedelta(days=1),
+            category=category,
+            creator=creator,
+            assigned_to=assigned_to,
+        )
+
+    def create_subtask(self, title, task):
+        return Subtask.objects.create(
+            title=title,
+            parent_task=task,
+            creator=task.creator,
+        )
+
+    def get_batch(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_tasks_of_creator(self):
+        data = self.get_batch(
+            self.CREATOR_URL,
+            ids=[self.second.id, self.assigned.id, self.first.id, self.second.id],
+            subtask_ids=[self.assigned_subtask.id, self.subtask.id, self.foreign_subtask.id],
+        )
+
+        self.assertEqual(
+            [task['title'] for task in data['tasks']],
+            ['Вторая', 'Первая'],
+        )
+        first = data['tasks'][1]
+        self.assertEqual(first['category']['name'], 'Первая категория')
+        self.assertEqual(first['creator']['username'], 'first_test_user')
+        self.assertEqual(first['assigned_to']['username'], 'second_test_user')
+        self.assertEqual([subtask['title'] for subtask in first['subtasks']], ['Подзадача'])
+        self.assertEqual(data['tasks'][0]['subtasks'], [])
+        self.assertEqual(
+            [subtask['title'] for subtask in data['subtasks']],
+            ['Подзадача'],
+        )
+
+    def test_tasks_of_assignee(self):
+        data = self.get_batch(
+            self.ASSIGNED_URL,
+            ids=[self.first.id, self.assigned.id, self.second.id, self.foreign.id],
+            subtask_ids=[self.assigned_subtask.id, self.subtask.id],
+        )
+
+        self.assertEqual(
+            [task['title'] for task in data['tasks']],
+            ['Назначенная', 'Вторая'],
+        )
+        self.assertEqual(
+            [subtask['title'] for subtask in data['subtasks']],
+            ['Назначенная подзадача'],
+        )
+
+    def test_related_rows_are_loaded_once(self):
+        ids = [self.first.id, self.second.id]
+        # The tasks, subtasks, categories, users and subtasks of the tasks.
+        with self.assertNumQueries(5):
+            self.get_batch(self.CREATOR_URL, ids=ids, subtask_ids=[self.subtask.id])
+
+        ids += [
+            self.create_task(f'Задача {number}', self.user, self.other_user, self.first_category).id
+            for number in range(3)
+        ]
+        with self.assertNumQueries(4):
+            data = self.get_batch(self.CREATOR_URL, ids=ids)
+        self.assertEqual(len(data['tasks']), 5)
+
+        with self.assertNumQueries(3):
+            data = self.get_batch(self.CREATOR_URL, ids=ids, include_subtasks='false')
+        self.assertNotIn('subtasks', data['tasks'][0])
+
+    def test_invalid_batch(self):
+        response = self.client.get(self.CREATOR_URL)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.CREATOR_URL, {'ids': list(range(1, 10))})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.CREATOR_URL, {'ids': ['first']})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,81 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+
+from main.models import Category, CustomUser, Task, Subtask
+
+
+class TestBenchmark(APITestCase):
+    """ Test seed_data and benchmark commands. """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestBenchmark, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        call_command(
+            'seed_data',
+            users=3,
+            categories=2,
+            tasks=30,
+            batch_size=7,
+            seed=1,
+            stdout=StringIO(),
+        )
+
+    def test_seed_data(self):
+        self.assertEqual(
+            CustomUser.objects.filter(username__startswith='seed_user_').count(),
+            3
+        )
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Task.objects.count(), 30)
+        self.assertTrue(Subtask.objects.exists())
+        self.assertFalse(
+            Task.objects.filter(is_completed=True, finish_date=None).exists()
+        )
+        self.assertGreater(
+            Task.objects.values('created_at__date').distinct().count(),
+            1
+        )
+
+    def test_benchmark_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'report.json'
+            call_command(
+                'benchmark',
+                iterations=2,
+                warmup=1,
+                output=str(path),
+                stdout=StringIO(),
+            )
+            report = json.loads(path.read_text())
+
+            call_command(
+                'benchmark',
+                iterations=2,
+                warmup=0,
+                only=['category-list'],
+                output=str(Path(directory) / 'second.json'),
+                compare=str(path),
+                threshold=1000,
+                stdout=StringIO(),
+            )
+
+        self.assertEqual(report['meta']['rows']['tasks'], 30)
+        for name in (
+            'category-list',
+            'users-list',
+            'tasks-update-list',
+            'tasks-update-statistics',
+            'creation-tasks-list',
+            'notification-task',
+        ):
+            self.assertIn(name, report['results'])
+            self.assertIn('p95_ms', report['results'][name])
+            self.assertIn('queries', report['results'][name])
+        self.assertEqual(Task.objects.count(), 30)
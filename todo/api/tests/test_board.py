@@ -0,0 +1,189 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.utils.urls import replace_query_param
+
+from main import generations
+from main.models import Category, Task
+
+User = get_user_model()
+
+SHARD = 'shard_test'
+
+
+@override_settings(
+    GENERATIONS_BACKEND='main.generations.LocalBackend',
+    THROTTLE_ENABLED=False,
+)
+class TestBoard(APITestCase):
+    """ Test the task board grouped by category. """
+
+    URL = '/api/v1/tasks/board/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestBoard, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.other_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.work = Category.objects.create(name='Работа')
+        cls.home = Category.objects.create(name='Дом')
+
+    def setUp(self):
+        generations.get_backend().clear()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.work_tasks = [
+            self.create_task('Срочная', self.work, Task.HIGH_INDEX, now + timedelta(days=3)),
+            self.create_task('Важная', self.work, Task.MEDIUM_INDEX, now + timedelta(days=1)),
+            self.create_task('Средняя', self.work, Task.MEDIUM_INDEX, now + timedelta(days=2)),
+            self.create_task('Обычная', self.work, Task.LOW_INDEX, now + timedelta(days=1)),
+        ]
+        self.home_tasks = [
+            self.create_task('Уборка', self.home, Task.LOW_INDEX, now + timedelta(days=1)),
+        ]
+        self.create_task('Чужая', self.home, Task.HIGH_INDEX, now, assigned_to=self.other_user)
+
+    def create_task(self, title, category, priority, due_date, **kwargs):
+        return Task.objects.create(**{
+            'title': title,
+            'category': category,
+            'priority': priority,
+            'due_date': due_date,
+            'creator': self.other_user,
+            'assigned_to': self.user,
+            **kwargs,
+        })
+
+    def get_board(self, url=None, **params):
+        response = self.client.get(url or self.URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()['results']
+
+    def test_first_tasks_of_every_category(self):
+        results = self.get_board(limit=2)
+
+        self.assertEqual(
+            [(column['category']['name'], column['count']) for column in results],
+            [('Дом', 1), ('Работа', 4)],
+        )
+        self.assertEqual(
+            [task['title'] for task in results[1]['tasks']],
+            ['Срочная', 'Важная'],
+        )
+        self.assertIsNone(results[0]['next'])
+        self.assertIsNotNone(results[1]['next'])
+
+    def test_next_tasks_of_category(self):
+        column = self.get_board(limit=2)[1]
+
+        # Added before the position of the cursor, doesn't shift it.
+        self.create_task('Новая', self.work, Task.HIGH_INDEX, timezone.now())
+        more = self.get_board(column['next'])
+
+        self.assertEqual(len(more), 1)
+        self.assertNotIn('count', more[0])
+        self.assertEqual(
+            [task['title'] for task in more[0]['tasks']],
+            ['Средняя', 'Обычная'],
+        )
+        self.assertIsNone(more[0]['next'])
+
+    def test_board_takes_one_task_query(self):
+        self.get_board()
+
+        # The window query and the categories, the tasks are cached.
+        with self.assertNumQueries(2):
+            self.get_board()
+
+    def test_board_honors_filters(self):
+        results = self.get_board(priority=Task.MEDIUM_INDEX)
+
+        self.assertEqual(
+            [(column['category']['name'], column['count']) for column in results],
+            [('Работа', 2)],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.URL, {'column': self.work.id, 'cursor': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.URL, {'cursor': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    GENERATIONS_BACKEND='main.generations.LocalBackend',
+    TASK_SHARDS=['default', SHARD],
+    THROTTLE_ENABLED=False,
+)
+class TestShardedBoard(APITestCase):
+    """ Test the task board with tasks on several shards. """
+
+    URL = '/api/v1/tasks/board/'
+
+    databases = {'default', SHARD}
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestShardedBoard, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.sharded_user = User.objects.create_user(
+            username='sharded_test_user',
+            email='sharded@test.ru',
+            task_shard=SHARD,
+        )
+        cls.primary_user = User.objects.create_user(
+            username='primary_test_user',
+            email='primary@test.ru',
+            task_shard='default',
+        )
+        cls.category = Category.objects.create(
+            name='Категория',
+        )
+
+    def setUp(self):
+        generations.get_backend().clear()
+        self.client.force_authenticate(self.primary_user)
+
+    def create_task(self, title, creator, priority, days):
+        return Task.objects.create(
+            title=title,
+            category=self.category,
+            priority=priority,
+            due_date=timezone.now() + timedelta(days=days),
+            creator=creator,
+            assigned_to=self.primary_user,
+        )
+
+    def test_columns_are_merged_across_shards(self):
+        self.create_task('Первая', self.sharded_user, Task.HIGH_INDEX, 1)
+        self.create_task('Вторая', self.primary_user, Task.HIGH_INDEX, 2)
+        self.create_task('Третья', self.sharded_user, Task.MEDIUM_INDEX, 1)
+        self.create_task('Четвертая', self.primary_user, Task.LOW_INDEX, 1)
+        self.create_task('Пятая', self.sharded_user, Task.LOW_INDEX, 2)
+
+        response = self.client.get(self.URL, {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        column, = response.json()['results']
+        self.assertEqual(column['count'], 5)
+        self.assertEqual([task['title'] for task in column['tasks']], ['Первая', 'Вторая'])
+
+        response = self.client.get(replace_query_param(column['next'], 'limit', 3))
+        column, = response.json()['results']
+        self.assertEqual(
+            [task['title'] for task in column['tasks']],
+            ['Третья', 'Четвертая', 'Пятая'],
+        )
+        self.assertIsNone(column['next'])
@@ -0,0 +1,181 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import AsyncRequestFactory, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.views import calendar_feed
+from main import deletion, generations, ical
+from main.models import Category, Task
+
+User = get_user_model()
+
+
+@override_settings(
+    GENERATIONS_BACKEND='main.generations.LocalBackend',
+    CALENDAR_FEED_BATCH_SIZE=2,
+    THROTTLE_ENABLED=False,
+)
+class TestCalendarFeed(APITestCase):
+    """ Test the iCalendar feed of the due dates of tasks. """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestCalendarFeed, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+            password='first_password',
+        )
+        cls.other_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+            password='second_password',
+        )
+        cls.category = Category.objects.create(
+            name='Категория',
+        )
+
+    def setUp(self):
+        generations.get_backend().clear()
+        self.user.refresh_from_db()
+        self.created = self.create_task('Созданная', self.user, self.other_user, '2024-03-01 10:00')
+        self.assigned = self.create_task('Назначенная', self.other_user, self.user, '2024-03-05 10:00')
+        self.third = self.create_task('Третья', self.user, self.user, '2024-03-10 10:00')
+        self.create_task('Чужая', self.other_user, self.other_user, '2024-03-02 10:00')
+
+    def create_task(self, title, creator, assigned_to, due_date, **kwargs):
+        return Task.objects.create(
+            title=title,
+            category=self.category,
+            creator=creator,
+            assigned_to=assigned_to,
+            due_date=timezone.make_aware(datetime.fromisoformat(due_date)),
+            **kwargs,
+        )
+
+    def get_url(self, user=None):
+        return f'/api/v1/calendar/{ical.get_token(user or self.user)}.ics'
+
+    def get_feed(self, url=None, **kwargs):
+        response = self.client.get(url or self.get_url(), **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        return response['ETag'], b''.join(response.streaming_content).decode()
+
+    def get_uids(self, content):
+        return [
+            int(line[len('UID:task-'):].split('@')[0])
+            for line in content.split('\r\n') if line.startswith('UID:')
+        ]
+
+    def test_feed_of_tasks_of_user(self):
+        _, content = self.get_feed()
+
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'))
+        self.assertTrue(content.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(
+            self.get_uids(content),
+            [self.created.id, self.assigned.id, self.third.id],
+        )
+        self.assertIn('SUMMARY:Назначенная\r\nPRIORITY:9\r\n', content)
+        self.assertIn('DTSTART:20240305T100000Z\r\n', content)
+
+    def test_feed_is_not_streamed_under_asgi(self):
+        _, content = self.get_feed()
+        request = AsyncRequestFactory().get(self.get_url())
+
+        response = calendar_feed(request, ical.get_token(self.user))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content.decode(), content)
+
+    def test_link_to_feed(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get('/api/v1/users/calendar/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['url'], f'http://testserver{self.get_url()}')
+
+    def test_unchanged_feed_is_not_read(self):
+        etag, content = self.get_feed()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.get_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.assertEqual(self.get_feed(), (etag, content))
+
+    def test_changes_of_tasks_change_feed(self):
+        etag, _ = self.get_feed()
+        other_etag, _ = self.get_feed(self.get_url(self.other_user))
+
+        self.third.is_completed = True
+        self.third.save()
+        self.assertEqual(self.get_feed()[0], etag)
+
+        self.assigned.assigned_to = self.other_user
+        self.assigned.save()
+        new_etag, content = self.get_feed()
+        self.assertNotEqual(new_etag, etag)
+        self.assertNotIn(self.assigned.id, self.get_uids(content))
+        self.assertNotEqual(self.get_feed(self.get_url(self.other_user))[0], other_etag)
+
+        deletion.schedule(self.third, requested_by=self.user)
+        etag, content = self.get_feed()
+        self.assertNotEqual(etag, new_etag)
+        self.assertEqual(self.get_uids(content), [self.created.id])
+
+    def test_feed_within_dates(self):
+        etag, _ = self.get_feed()
+
+        window_etag, content = self.get_feed(
+            f'{self.get_url()}?date_from=2024-03-02&date_to=2024-03-05',
+        )
+
+        self.assertNotEqual(window_etag, etag)
+        self.assertEqual(self.get_uids(content), [self.assigned.id])
+
+        response = self.client.get(self.get_url(), {'date_from': '2024-03-05', 'date_to': '2024-03-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_wrong_or_outdated_token(self):
+        response = self.client.get('/api/v1/calendar/1-wrong.ics')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = self.get_url()
+        self.user.set_password('new_password')
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.get_feed()
+
+    def test_lines_are_escaped_and_folded(self):
+        self.third.title = 'Купить: хлеб, молоко; сыр\\масло ' * 3
+        self.third.description = 'Первая строка\nвторая строка'
+        self.third.save()
+
+        _, content = self.get_feed()
+
+        self.assertIn('DESCRIPTION:Первая строка\\nвторая строка\r\n', content)
+        lines = content.split('\r\n')
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        summary = next(
+            index for index, line in enumerate(lines) if line.startswith('SUMMARY:Купить')
+        )
+        unfolded = lines[summary]
+        for line in lines[summary + 1:]:
+            if not line.startswith(' '):
+                break
+            unfolded += line[1:]
+        self.assertEqual(unfolded, 'SUMMARY:' + 'Купить: хлеб\\, молоко\\; сыр\\\\масло ' * 3)
+        self.assertGreater(
+            len([line for line in lines if line.startswith(' ')]),
+            1,
+        )
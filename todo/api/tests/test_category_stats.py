@@ -0,0 +1,139 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main import category_stats, deletion
+from main.models import Category, CategoryStats, Task
+
+User = get_user_model()
+
+
+class TestCategoryStats(APITestCase):
+    """ Test category analytics. """
+
+    URL = '/api/v1/category/statistics/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestCategoryStats, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.first_category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.second_category = Category.objects.create(
+            name='Вторая категория',
+        )
+        now = timezone.now()
+        for hours in (1, 3):
+            cls.create_task(
+                cls.first_category,
+                due_date=now + timedelta(days=1),
+                is_completed=True,
+                finish_date=now + timedelta(hours=hours),
+            )
+        cls.create_task(cls.first_category, due_date=now - timedelta(days=1))
+        cls.create_task(cls.first_category, due_date=now + timedelta(days=1))
+
+    @classmethod
+    def create_task(cls, category, **kwargs):
+        return Task.objects.create(
+            title='Задача',
+            category=category,
+            creator=cls.user,
+            assigned_to=cls.user,
+            **kwargs,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_statistics(self):
+        self.assertTrue(category_stats.refresh())
+
+        with mock.patch('main.tasks.refresh_category_stats.delay') as delay:
+            response = self.client.get(self.URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        delay.assert_not_called()
+        self.assertIsNotNone(response.data['refreshed_at'])
+        stats = {row['id']: row for row in response.data['results']}
+        self.assertEqual(stats[self.first_category.id]['open_count'], 2)
+        self.assertEqual(stats[self.first_category.id]['completed_count'], 2)
+        self.assertEqual(stats[self.first_category.id]['overdue_count'], 1)
+        self.assertAlmostEqual(
+            stats[self.first_category.id]['median_cycle_time'],
+            timedelta(hours=2),
+            delta=timedelta(minutes=1),
+        )
+        self.assertEqual(stats[self.second_category.id]['open_count'], 0)
+        self.assertIsNone(stats[self.second_category.id]['median_cycle_time'])
+
+    def test_numbers_change_only_after_refresh(self):
+        category_stats.refresh()
+        self.create_task(self.second_category)
+
+        stats = CategoryStats.objects.get(category=self.second_category)
+        self.assertEqual(stats.open_count, 0)
+
+        category_stats.refresh()
+        stats = CategoryStats.objects.get(category=self.second_category)
+        self.assertEqual(stats.open_count, 1)
+
+    def test_tasks_waiting_for_deletion_are_not_counted(self):
+        deletion.schedule(self.create_task(self.second_category))
+        deletion.schedule(self.create_task(
+            self.second_category,
+            is_completed=True,
+            finish_date=timezone.now(),
+        ))
+
+        category_stats.refresh()
+
+        stats = CategoryStats.objects.get(category=self.second_category)
+        self.assertEqual(stats.open_count, 0)
+        self.assertEqual(stats.completed_count, 0)
+        self.assertIsNone(stats.median_cycle_time)
+
+    def test_stale_statistics_queue_refresh_once(self):
+        category_stats.refresh()
+
+        with mock.patch('main.tasks.refresh_category_stats.delay') as delay, \
+                mock.patch('main.category_stats.is_stale', return_value=True):
+            self.client.get(self.URL)
+            self.client.get(self.URL)
+
+        delay.assert_called_once_with()
+
+    def test_is_stale(self):
+        now = timezone.now()
+        self.assertTrue(category_stats.is_stale(None))
+        self.assertTrue(category_stats.is_stale(
+            now - settings.CATEGORY_STATS_MAX_AGE - timedelta(seconds=1)
+        ))
+        self.assertFalse(category_stats.is_stale(now))
+
+    def test_search(self):
+        category_stats.refresh()
+
+        response = self.client.get(self.URL, {'search': 'Вторая'})
+
+        self.assertEqual(
+            [row['id'] for row in response.data['results']],
+            [self.second_category.id],
+        )
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
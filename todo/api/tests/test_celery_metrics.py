@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core import mail
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from main import metrics
+from main.celery_signals import ENQUEUED_AT_HEADER, set_enqueued_at
+from main.models import Category, Task
+from main.tasks import send_notification
+
+User = get_user_model()
+
+
+@override_settings(
+    METRICS_BACKEND='main.metrics.LocalBackend',
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class TestCeleryMetrics(APITestCase):
+    """ Test celery task metrics. """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestCeleryMetrics, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.task = Task.objects.create(
+            title='API',
+            due_date=timezone.now()+timedelta(days=1),
+            category=cls.category,
+            creator=cls.user,
+            assigned_to=cls.user,
+        )
+
+    def setUp(self) -> None:
+        metrics.get_backend().clear()
+
+    def test_publish_sets_enqueued_at(self):
+        headers = {}
+        set_enqueued_at(headers=headers)
+
+        self.assertAlmostEqual(headers[ENQUEUED_AT_HEADER], time.time(), delta=1)
+
+    def test_task_metrics(self):
+        send_notification.apply(
+            args=(self.task.id,),
+            headers={ENQUEUED_AT_HEADER: time.time() - 2},
+        )
+        content = metrics.render()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(
+            'celery_task_duration_seconds_count'
+            '{state="SUCCESS",task="main.tasks.send_notification"} 1',
+            content
+        )
+        self.assertIn(
+            'celery_task_queue_latency_seconds_bucket'
+            '{task="main.tasks.send_notification",le="1"} 0',
+            content
+        )
+        self.assertIn(
+            'celery_task_queue_latency_seconds_count'
+            '{task="main.tasks.send_notification"} 1',
+            content
+        )
+        for name in ('db', 'smtp'):
+            self.assertIn(
+                'celery_task_phase_duration_seconds_count'
+                f'{{phase="{name}",task="main.tasks.send_notification"}} 1',
+                content
+            )
+
+    def test_retries_and_failures(self):
+        with mock.patch('main.tasks.send_mail', side_effect=SMTPException):
+            send_notification.apply(args=(self.task.id,))
+        content = metrics.render()
+
+        self.assertIn(
+            'celery_task_retries_total{reason="SMTPException",'
+            'task="main.tasks.send_notification"}',
+            content
+        )
+        self.assertIn(
+            'celery_task_failures_total{exception="SMTPException",'
+            'task="main.tasks.send_notification"} 1',
+            content
+        )
@@ -0,0 +1,156 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main import generations
+from main.models import Category, CompletionRollup, Task, TaskChange
+
+User = get_user_model()
+
+
+@override_settings(
+    ASYNC_VIEW_THREADS=0,
+    GENERATIONS_BACKEND='main.generations.LocalBackend',
+    THROTTLE_ENABLED=False,
+)
+class TestTaskCompletion(APITestCase):
+    """ Test the completion of tasks and the writes of changed fields. """
+
+    CREATOR_URL = '/api/v1/creation-tasks/'
+    ASSIGNED_URL = '/api/v1/tasks/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestTaskCompletion, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.creator = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.assignee = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Категория',
+        )
+
+    def setUp(self):
+        generations.get_backend().clear()
+        self.client.force_authenticate(self.assignee)
+        self.task = Task.objects.create(
+            title='Задача',
+            due_date=timezone.now() + timedelta(days=1),
+            category=self.category,
+            creator=self.creator,
+            assigned_to=self.assignee,
+        )
+
+    def post(self, action, url=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'{url or self.ASSIGNED_URL}{self.task.id}/{action}/')
+
+    def get_task_updates(self, queries):
+        return [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE "main_task"')
+        ]
+
+    def test_complete_and_reopen(self):
+        response = self.post('complete')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['is_completed'])
+        finish_date = response.json()['finish_date']
+        self.assertIsNotNone(finish_date)
+        self.assertEqual(CompletionRollup.objects.get().completed_count, 1)
+
+        response = self.post('complete')
+        self.assertEqual(response.json()['finish_date'], finish_date)
+        self.assertEqual(CompletionRollup.objects.get().completed_count, 1)
+
+        response = self.post('reopen')
+        self.assertFalse(response.json()['is_completed'])
+        self.assertEqual(CompletionRollup.objects.get().completed_count, 0)
+
+        # The first finish date is kept, as by a save of the task.
+        self.client.force_authenticate(self.creator)
+        response = self.post('complete', self.CREATOR_URL)
+        self.assertEqual(response.json()['finish_date'], finish_date)
+        self.assertEqual(CompletionRollup.objects.get().completed_count, 1)
+        self.assertEqual(
+            list(TaskChange.objects.values_list('field', 'new_value', 'changed_by')),
+            [
+                ('is_completed', 'True', self.creator.id),
+                ('is_completed', 'False', self.assignee.id),
+                ('is_completed', 'True', self.assignee.id),
+            ],
+        )
+
+    def test_completion_is_one_conditional_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post('complete')
+
+        updates = self.get_task_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"is_completed"', updates[0].split(' WHERE ')[1])
+        self.assertNotIn('"title"', updates[0])
+        first_task_query = next(
+            query['sql'] for query in queries if '"main_task"' in query['sql']
+        )
+        self.assertTrue(first_task_query.startswith('UPDATE'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.post('complete')
+        self.assertEqual(len(self.get_task_updates(queries)), 1)
+        self.assertFalse(
+            [query for query in queries if 'main_completionrollup' in query['sql']]
+        )
+
+    def test_completion_refreshes_cached_tasks(self):
+        self.client.force_authenticate(self.creator)
+        self.client.get(self.CREATOR_URL)
+
+        self.post('complete', self.CREATOR_URL)
+
+        response = self.client.get(self.CREATOR_URL)
+        self.assertTrue(response.json()['results'][0]['is_completed'])
+
+    def test_tasks_of_other_users_are_not_found(self):
+        self.client.force_authenticate(self.creator)
+
+        response = self.post('complete')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(f'{self.ASSIGNED_URL}first/complete/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.assertFalse(Task.objects.get(pk=self.task.pk).is_completed)
+
+    def test_update_writes_changed_fields(self):
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'{self.ASSIGNED_URL}{self.task.id}/',
+                data={'is_completed': True},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = self.get_task_updates(queries)
+        self.assertEqual(len(updates), 1)
+        assignments = updates[0].split(' SET ')[1].split(' WHERE ')[0]
+        self.assertIn('"is_completed"', assignments)
+        self.assertIn('"finish_date"', assignments)
+        self.assertNotIn('"title"', assignments)
+        self.assertNotIn('"due_date"', assignments)
+
+        task = Task.objects.get(pk=self.task.pk)
+        with CaptureQueriesContext(connection) as queries:
+            task.save()
+        self.assertFalse(self.get_task_updates(queries))
@@ -0,0 +1,142 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main import dashboard
+from main.models import Category, Task
+from main.rollups import get_day_bounds
+
+User = get_user_model()
+
+
+@override_settings(
+    ASYNC_VIEW_THREADS=0,
+    DASHBOARD_BACKEND='main.dashboard.LocalBackend',
+    THROTTLE_ENABLED=False,
+)
+class TestDashboard(APITestCase):
+    """ Test the live counters of the dashboard. """
+
+    URL = '/api/v1/users/dashboard/'
+    CREATOR_URL = '/api/v1/creation-tasks/'
+    ASSIGNED_URL = '/api/v1/tasks/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestDashboard, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.other_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Категория',
+        )
+
+    def setUp(self):
+        dashboard.get_backend().clear()
+        self.client.force_authenticate(self.user)
+        # Noon in two days, the schedule is advanced there by the tests.
+        self.noon = get_day_bounds(timezone.localdate() + timedelta(days=2)) + timedelta(hours=12)
+
+    def create_task(self, title, creator, assigned_to, due_date):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Task.objects.create(
+                title=title,
+                due_date=due_date,
+                category=self.category,
+                creator=creator,
+                assigned_to=assigned_to,
+            )
+
+    def get_counters(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def assertCounters(self, **counters):
+        data = self.get_counters()
+        self.assertEqual(data, counters)
+        # Rebuilt from the database at the same watermark.
+        watermark, _ = dashboard.get_backend().get_state([self.user.pk])
+        self.assertEqual(dashboard.count([self.user.pk], watermark)[0][self.user.pk], data)
+
+    def test_counters_follow_tasks(self):
+        overdue = self.create_task('Просрочена', self.user, self.user, timezone.now() - timedelta(days=1))
+        self.assertCounters(assigned_open=1, created_open=1, due_today=0, overdue=1)
+
+        task = self.create_task('Назначена', self.other_user, self.user, self.noon + timedelta(hours=1))
+        self.create_task('Создана', self.user, self.other_user, self.noon)
+        self.assertCounters(assigned_open=2, created_open=2, due_today=0, overdue=1)
+
+        dashboard.advance(self.noon)
+        self.assertCounters(assigned_open=2, created_open=2, due_today=1, overdue=1)
+        dashboard.advance(self.noon + timedelta(hours=2))
+        self.assertCounters(assigned_open=2, created_open=2, due_today=0, overdue=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{self.ASSIGNED_URL}{task.id}/complete/')
+        self.assertCounters(assigned_open=1, created_open=2, due_today=0, overdue=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{self.ASSIGNED_URL}{task.id}/reopen/')
+            self.client.patch(
+                f'{self.ASSIGNED_URL}{task.id}/',
+                data={'due_date': self.noon + timedelta(days=1)},
+            )
+        self.assertCounters(assigned_open=2, created_open=2, due_today=0, overdue=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'{self.CREATOR_URL}{overdue.id}/')
+        self.assertCounters(assigned_open=1, created_open=1, due_today=0, overdue=0)
+
+        dashboard.advance(self.noon + timedelta(hours=23))
+        self.assertCounters(assigned_open=1, created_open=1, due_today=1, overdue=0)
+
+    def test_counters_are_read_without_database(self):
+        self.create_task('Задача', self.user, self.user, self.noon)
+
+        with self.assertNumQueries(3):
+            self.get_counters()
+        with self.assertNumQueries(0):
+            data = self.get_counters()
+        self.assertEqual(data['assigned_open'], 1)
+
+    def test_repair_fixes_drift(self):
+        self.create_task('Задача', self.user, self.user, self.noon)
+        self.get_counters()
+        backend = dashboard.get_backend()
+        backend.counters[self.user.pk]['assigned_open'] = 42
+        backend.pending[self.user.pk].clear()
+
+        self.assertEqual(dashboard.repair(batch_size=1), 2)
+
+        self.assertCounters(assigned_open=1, created_open=1, due_today=0, overdue=0)
+        dashboard.advance(self.noon)
+        self.assertCounters(assigned_open=1, created_open=1, due_today=0, overdue=1)
+
+    def test_rebuild_is_repeated_after_concurrent_change(self):
+        count = dashboard.count
+
+        def count_during_change(user_ids, watermark):
+            counted = count(user_ids, watermark)
+            if mocked.call_count == 1:
+                # Committed after the rows were read.
+                self.create_task('Задача', self.other_user, self.user, self.noon)
+            return counted
+
+        with mock.patch.object(dashboard, 'count', side_effect=count_during_change) as mocked:
+            counters = self.get_counters()
+
+        self.assertEqual(mocked.call_count, 2)
+        self.assertEqual(counters['assigned_open'], 1)
@@ -0,0 +1,242 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import OperationalError
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main import deletion
+from main.models import (
+    Category,
+    CompletionRollup,
+    DeletionJob,
+    Subtask,
+    Task,
+)
+
+User = get_user_model()
+
+
+class TestDeletion(APITestCase):
+    """ Test background deletion of categories, users and tasks. """
+
+    CATEGORY_URL = '/api/v1/category/'
+    USERS_URL = '/api/v1/users/'
+    CREATOR_OBJECT_URL = '/api/v1/creation-tasks/{0}/'
+    JOBS_URL = '/api/v1/deletion-jobs/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestDeletion, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@test.ru',
+            password='password',
+        )
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Удаляемая')
+        self.other_category = Category.objects.create(name='Остается')
+        self.tasks = [
+            self.create_task(self.category, is_completed=bool(number % 2))
+            for number in range(5)
+        ]
+        self.other_task = self.create_task(self.other_category)
+        for task in self.tasks:
+            Subtask.objects.create(
+                title='Подзадача',
+                parent_task=task,
+                creator=self.first_user,
+            )
+
+    def create_task(self, category, creator=None, **kwargs):
+        return Task.objects.create(
+            title='Задача',
+            category=category,
+            creator=creator or self.first_user,
+            assigned_to=self.second_user,
+            **kwargs,
+        )
+
+    def test_category_deleted_from_admin(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.post(
+            f'/admin/main/category/{self.category.id}/delete/',
+            {'post': 'yes'},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.category.refresh_from_db()
+        self.assertIsNotNone(self.category.deleted_at)
+        self.client.force_authenticate(self.first_user)
+        response = self.client.get(self.CATEGORY_URL)
+        self.assertEqual(
+            [category['id'] for category in response.data['results']],
+            [self.other_category.id],
+        )
+
+        job = DeletionJob.objects.get()
+        self.assertEqual(job.status, DeletionJob.PENDING)
+        self.assertEqual(job.requested_by, self.admin)
+        self.assertTrue(deletion.run(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.deleted, job.total)
+        self.assertEqual(job.progress, 1.0)
+        self.assertFalse(Category.objects.filter(id=self.category.id).exists())
+        self.assertEqual(list(Task.objects.all()), [self.other_task])
+        self.assertFalse(Subtask.objects.exists())
+        self.assertFalse(CompletionRollup.objects.filter(category=self.category).exists())
+
+    def test_admin_confirmation_does_not_collect_dependents(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.get(f'/admin/main/category/{self.category.id}/delete/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotContains(response, 'Подзадача')
+
+    @override_settings(DELETION_BATCH_SIZE=2)
+    def test_batches_and_progress(self):
+        job = deletion.schedule(self.category)
+        self.assertEqual(deletion.schedule(self.category), job)
+
+        self.assertFalse(deletion.run(job, time_budget=-1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.RUNNING)
+        # The category, its rollup row, five tasks and five subtasks.
+        self.assertEqual(job.total, 12)
+        self.assertEqual(job.deleted, 0)
+        self.assertEqual(Subtask.objects.count(), 5)
+
+        delete_batch = deletion.Purger.delete_batch
+        batches = []
+
+        def record_batch(purger, model, pks):
+            batches.append(len(pks))
+            delete_batch(purger, model, pks)
+
+        with mock.patch.object(deletion.Purger, 'delete_batch', record_batch):
+            self.assertTrue(deletion.run(job))
+
+        self.assertLessEqual(max(batches), 2)
+        job.refresh_from_db()
+        self.assertEqual(job.deleted, 12)
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_slow_batch_is_split(self):
+        job = deletion.schedule(self.category)
+        limits = iter([OperationalError('canceling statement due to lock timeout')])
+
+        def limit_locks(purger, connection):
+            error = next(limits, None)
+            if error:
+                raise error
+
+        with mock.patch.object(deletion.Purger, 'limit_locks', limit_locks):
+            self.assertTrue(deletion.run(job))
+
+        self.assertFalse(Task.objects.filter(category=self.category).exists())
+
+    def test_locked_row_leaves_job_to_next_run(self):
+        task = self.tasks[0]
+        Subtask.objects.filter(parent_task=task).delete()
+        job = deletion.schedule(task)
+
+        with mock.patch.object(
+                deletion.Purger,
+                'limit_locks',
+                side_effect=OperationalError('lock timeout'),
+        ):
+            self.assertFalse(deletion.run(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.PENDING)
+        self.assertEqual(job.blocked_runs, 1)
+        self.assertTrue(Task.objects.filter(id=task.id).exists())
+
+        self.assertTrue(deletion.run(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.blocked_runs, 0)
+        self.assertFalse(Task.objects.filter(id=task.id).exists())
+
+    @override_settings(DELETION_MAX_BLOCKED_RUNS=2)
+    def test_repeatedly_locked_row_fails_job(self):
+        task = self.tasks[0]
+        Subtask.objects.filter(parent_task=task).delete()
+        job = deletion.schedule(task)
+
+        with mock.patch.object(
+                deletion.Purger,
+                'limit_locks',
+                side_effect=OperationalError('lock timeout'),
+        ):
+            self.assertFalse(deletion.run(job))
+            self.assertFalse(deletion.run(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.FAILED)
+        self.assertEqual(job.blocked_runs, 2)
+        self.assertIn('lock timeout', job.error)
+
+    def test_user_deletion(self):
+        job = deletion.schedule(self.second_user)
+
+        self.second_user.refresh_from_db()
+        self.assertFalse(self.second_user.is_active)
+        self.client.force_authenticate(self.first_user)
+        response = self.client.get(self.USERS_URL)
+        self.assertNotIn(
+            self.second_user.id,
+            [user['id'] for user in response.data['results']],
+        )
+
+        self.assertTrue(deletion.run(job))
+        self.assertFalse(User.objects.filter(id=self.second_user.id).exists())
+        self.assertFalse(Task.objects.exists())
+
+    def test_task_destroyed_through_api(self):
+        task = self.tasks[0]
+        self.client.force_authenticate(self.first_user)
+
+        response = self.client.delete(self.CREATOR_OBJECT_URL.format(task.id))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(self.CREATOR_OBJECT_URL.format(task.id))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        deletion.run_pending()
+        self.assertTrue(Task.objects.filter(id=task.id).exists())
+        DeletionJob.objects.update(updated_at=timezone.now() - timezone.timedelta(hours=1))
+        deletion.run_pending()
+        self.assertFalse(Task.objects.filter(id=task.id).exists())
+
+    def test_jobs_endpoint(self):
+        deletion.schedule(self.category)
+
+        self.client.force_authenticate(self.first_user)
+        response = self.client.get(self.JOBS_URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(self.JOBS_URL)
+        job = response.data['results'][0]
+        self.assertEqual(job['model'], 'category')
+        self.assertEqual(job['status'], DeletionJob.PENDING)
+        self.assertEqual(job['progress'], 0.0)
@@ -0,0 +1,133 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.serializers import TaskReadSerializer
+from main import generations
+from main.models import Category, Subtask, Task
+
+User = get_user_model()
+
+
+@override_settings(
+    GENERATIONS_BACKEND='main.generations.LocalBackend',
+    THROTTLE_ENABLED=False,
+)
+class TestTaskFragments(APITestCase):
+    """ Test the cache of tasks rendered to JSON. """
+
+    URL = '/api/v1/creation-tasks/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestTaskFragments, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.assignee = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.first_category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.second_category = Category.objects.create(
+            name='Вторая категория',
+        )
+
+    def setUp(self):
+        generations.get_backend().clear()
+        self.client.force_authenticate(self.user)
+        self.first_task = self.create_task('Первая', self.first_category)
+        self.second_task = self.create_task('Вторая', self.second_category)
+
+    def create_task(self, title, category):
+        return Task.objects.create(
+            title=title,
+            category=category,
+            creator=self.user,
+            assigned_to=self.assignee,
+        )
+
+    def get_tasks(self, params=None):
+        """ Listed tasks by title and the number of them serialized. """
+
+        with mock.patch.object(
+                TaskReadSerializer,
+                'get_priority',
+                autospec=True,
+                side_effect=lambda serializer, task: task.get_priority_display(),
+        ) as get_priority:
+            response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tasks = {task['title']: task for task in response.json()['results']}
+        self.assertEqual(response.data['results'], response.json()['results'])
+        return tasks, get_priority.call_count
+
+    def test_unchanged_tasks_are_not_serialized_again(self):
+        first, serialized = self.get_tasks()
+        self.assertEqual(serialized, 2)
+
+        with self.assertNumQueries(2):
+            second, serialized = self.get_tasks()
+
+        self.assertEqual(serialized, 0)
+        self.assertEqual(first, second)
+
+    def test_changes_invalidate_dependent_tasks_only(self):
+        self.get_tasks()
+
+        Subtask.objects.create(
+            title='Подзадача',
+            parent_task=self.first_task,
+            creator=self.user,
+        )
+        tasks, serialized = self.get_tasks()
+        self.assertEqual(serialized, 1)
+        self.assertEqual(tasks['Первая']['subtasks_total'], 1)
+        self.assertEqual(len(tasks['Первая']['subtasks']), 1)
+
+        category = Category.objects.get(pk=self.second_category.pk)
+        category.name = 'Переименована'
+        category.save()
+        tasks, serialized = self.get_tasks()
+        self.assertEqual(serialized, 1)
+        self.assertEqual(tasks['Вторая']['category']['name'], 'Переименована')
+
+        user = User.objects.get(pk=self.assignee.pk)
+        user.last_login = user.date_joined
+        user.save(update_fields=('last_login',))
+        self.assertEqual(self.get_tasks()[1], 0)
+
+        user.username = 'renamed_test_user'
+        user.save()
+        tasks, serialized = self.get_tasks()
+        self.assertEqual(serialized, 2)
+        self.assertEqual(tasks['Первая']['assigned_to']['username'], 'renamed_test_user')
+
+    def test_task_update_invalidates_fragment(self):
+        self.get_tasks()
+
+        response = self.client.patch(
+            f'{self.URL}{self.first_task.id}/',
+            data={'title': 'Изменена'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        tasks, serialized = self.get_tasks()
+        self.assertEqual(serialized, 1)
+        self.assertIn('Изменена', tasks)
+
+    def test_fragments_follow_the_representation(self):
+        self.get_tasks()
+
+        tasks, serialized = self.get_tasks({'include_subtasks': 'false'})
+
+        self.assertEqual(serialized, 2)
+        self.assertNotIn('subtasks', tasks['Первая'])
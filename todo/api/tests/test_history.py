@@ -0,0 +1,157 @@
+from datetime import timedelta
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main import history
+from main.models import Category, Subtask, Task, TaskChange
+
+User = get_user_model()
+
+
+@override_settings(
+    ASYNC_VIEW_THREADS=0,
+    THROTTLE_ENABLED=False,
+)
+class TestTaskHistory(APITestCase):
+    """ Test the change history of tasks. """
+
+    CREATOR_OBJECT_URL = '/api/v1/creation-tasks/{0}/'
+    ASSIGNED_OBJECT_URL = '/api/v1/tasks/{0}/'
+    SUBTASK_URL = '/api/v1/tasks/{0}/subtasks/{1}/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestTaskHistory, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.creator = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.assignee = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Категория',
+        )
+
+    def setUp(self):
+        self.task = Task.objects.create(
+            title='Задача',
+            due_date=timezone.now() + timedelta(days=1),
+            category=self.category,
+            creator=self.creator,
+            assigned_to=self.assignee,
+        )
+
+    def get_history(self, user, url=None):
+        self.client.force_authenticate(user)
+        response = self.client.get(f'{url or self.ASSIGNED_OBJECT_URL.format(self.task.id)}history/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_changes_of_assignee(self):
+        due_date = timezone.now() + timedelta(days=3)
+        self.client.force_authenticate(self.assignee)
+
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self.ASSIGNED_OBJECT_URL.format(self.task.id),
+                data={'due_date': due_date, 'is_completed': True},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        inserts = [
+            query for query in queries
+            if query['sql'].startswith('INSERT INTO "main_taskchange"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        data = self.get_history(self.assignee)
+        self.assertEqual(data['count'], 2)
+        changes = {change['field']: change for change in data['results']}
+        self.assertEqual(changes['is_completed']['old_value'], 'False')
+        self.assertEqual(changes['is_completed']['new_value'], 'True')
+        self.assertEqual(changes['due_date']['new_value'], due_date.isoformat())
+        self.assertEqual(changes['due_date']['changed_by']['username'], 'second_test_user')
+        self.assertIsNone(changes['due_date']['subtask'])
+
+    def test_changes_of_creator_and_subtasks(self):
+        subtask = Subtask.objects.create(
+            title='Подзадача',
+            parent_task=self.task,
+            creator=self.creator,
+        )
+        self.client.force_authenticate(self.creator)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                self.CREATOR_OBJECT_URL.format(self.task.id),
+                data={'title': 'Задача', 'description': 'Описание'},
+            )
+            self.client.patch(
+                self.SUBTASK_URL.format(self.task.id, subtask.id),
+                data={'is_completed': True},
+            )
+
+        data = self.get_history(self.creator, self.CREATOR_OBJECT_URL.format(self.task.id))
+        self.assertEqual(
+            [(change['field'], change['subtask']) for change in data['results']],
+            [('is_completed', subtask.id), ('description', None)],
+        )
+        self.assertEqual(data['results'][1]['old_value'], '')
+        self.assertEqual(data['results'][1]['new_value'], 'Описание')
+
+    def test_changes_in_admin(self):
+        request = RequestFactory().post('/')
+        request.user = self.creator
+        task = Task.objects.get(pk=self.task.pk)
+        task.priority = Task.HIGH_INDEX
+
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.site._registry[Task].save_model(request, task, None, True)
+
+        change = TaskChange.objects.get(task_id=task.pk)
+        self.assertEqual(
+            (change.field, change.old_value, change.new_value, change.changed_by),
+            ('priority', str(Task.LOW_INDEX), str(Task.HIGH_INDEX), self.creator),
+        )
+
+    def test_rolled_back_changes_are_not_recorded(self):
+        task = Task.objects.get(pk=self.task.pk)
+
+        with self.captureOnCommitCallbacks(execute=True), history.recording(self.creator):
+            try:
+                with transaction.atomic():
+                    task.title = 'Отменена'
+                    task.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            task.refresh_from_db()
+            task.is_completed = True
+            task.save()
+
+        self.assertEqual(
+            list(TaskChange.objects.values_list('field', flat=True)),
+            ['is_completed'],
+        )
+
+    def test_changes_outside_of_recording_and_other_users(self):
+        task = Task.objects.get(pk=self.task.pk)
+        task.title = 'Изменена'
+        with self.captureOnCommitCallbacks(execute=True):
+            task.save()
+
+        self.assertFalse(TaskChange.objects.exists())
+        self.client.force_authenticate(self.assignee)
+        response = self.client.get(f'{self.CREATOR_OBJECT_URL.format(self.task.id)}history/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,165 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api import idempotency
+from main.models import Category, Subtask, Task
+
+User = get_user_model()
+
+
+class TestIdempotency(APITestCase):
+    """ Test replay of task and subtask creation with an idempotency key. """
+
+    URL = '/api/v1/creation-tasks/'
+    SUBTASKS_URL = '/api/v1/tasks/{0}/subtasks/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestIdempotency, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+
+    def setUp(self):
+        idempotency.get_backend().clear()
+        self.client.force_authenticate(self.first_user)
+        self.data = {
+            'title': 'Задача',
+            'category': self.category.id,
+            'assigned_to': self.first_user.id,
+            'due_date': timezone.now() + timedelta(days=1),
+        }
+
+    def post(self, url, data, key):
+        return self.client.post(url, data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_is_replayed(self):
+        first = self.post(self.URL, self.data, 'retry')
+        second = self.post(self.URL, self.data, 'retry')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertNotIn(idempotency.REPLAYED_HEADER, first)
+        self.assertEqual(second[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        self.client.post(self.URL, self.data)
+        self.client.post(self.URL, self.data)
+
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_keys_are_scoped_by_user_and_path(self):
+        task = Task.objects.create(
+            title='Задача',
+            category=self.category,
+            creator=self.first_user,
+            assigned_to=self.first_user,
+        )
+        self.post(self.URL, self.data, 'shared')
+        self.post(self.SUBTASKS_URL.format(task.id), {'title': 'Подзадача', 'parent_task': task.id}, 'shared')
+        self.client.force_authenticate(self.second_user)
+        self.post(self.URL, {**self.data, 'assigned_to': self.second_user.id}, 'shared')
+
+        self.assertEqual(Task.objects.count(), 3)
+        self.assertEqual(Subtask.objects.count(), 1)
+
+    def test_subtask_retry_is_replayed(self):
+        task = Task.objects.create(
+            title='Задача',
+            category=self.category,
+            creator=self.first_user,
+            assigned_to=self.first_user,
+        )
+        data = {'title': 'Подзадача', 'parent_task': task.id}
+
+        self.post(self.SUBTASKS_URL.format(task.id), data, 'subtask')
+        response = self.post(self.SUBTASKS_URL.format(task.id), data, 'subtask')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Subtask.objects.count(), 1)
+
+    def test_key_reused_with_other_data(self):
+        self.post(self.URL, self.data, 'reused')
+
+        response = self.post(self.URL, {**self.data, 'title': 'Другая'}, 'reused')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failed_request_is_not_stored(self):
+        response = self.post(self.URL, {**self.data, 'category': ''}, 'fixed')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.post(self.URL, self.data, 'fixed')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_too_long_key(self):
+        response = self.post(self.URL, self.data, 'k' * 256)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_concurrent_duplicate_is_rejected_after_wait(self):
+        backend = idempotency.get_backend()
+        backend.acquire(f'{self.first_user.pk}:{self.URL}:busy')
+
+        response = self.post(self.URL, self.data, 'busy')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Task.objects.exists())
+
+    def test_concurrent_duplicate_waits_for_response(self):
+        backend = idempotency.get_backend()
+        key = f'{self.first_user.pk}:{self.URL}:busy'
+        token = backend.acquire(key)
+
+        def finish_first_request(seconds):
+            backend.set(key, json.dumps({
+                'fingerprint': 'fingerprint',
+                'status': status.HTTP_201_CREATED,
+                'data': {'id': 42},
+            }))
+            backend.release(key, token)
+
+        with mock.patch.object(idempotency, 'get_fingerprint', return_value='fingerprint'), \
+                mock.patch.object(idempotency.time, 'sleep', side_effect=finish_first_request):
+            response = self.post(self.URL, self.data, 'busy')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), {'id': 42})
+        self.assertFalse(Task.objects.exists())
+
+    def test_duplicate_runs_when_first_request_failed(self):
+        backend = idempotency.get_backend()
+        key = f'{self.first_user.pk}:{self.URL}:busy'
+        token = backend.acquire(key)
+
+        with mock.patch.object(
+                idempotency.time,
+                'sleep',
+                side_effect=lambda seconds: backend.release(key, token),
+        ):
+            response = self.post(self.URL, self.data, 'busy')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Task.objects.count(), 1)
@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from main.metrics import get_backend
+from main.models import Category, Task
+
+User = get_user_model()
+
+
+@override_settings(METRICS_BACKEND='main.metrics.LocalBackend', METRICS_TOKEN=None)
+class TestMetrics(APITestCase):
+    """ Test request metrics. """
+
+    METRICS_URL = '/metrics'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestMetrics, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.task = Task.objects.create(
+            title='API',
+            due_date=timezone.now()+timedelta(days=1),
+            category=cls.category,
+            creator=cls.user,
+            assigned_to=cls.user,
+        )
+
+    def setUp(self) -> None:
+        get_backend().clear()
+        self.guest_client = APIClient()
+        self.authorized_client = APIClient()
+        token = RefreshToken.for_user(self.user)
+        self.authorized_client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {str(token.access_token)}'
+        )
+
+    def test_metrics_per_view_action(self):
+        self.authorized_client.get('/api/v1/tasks/statistics/')
+        self.authorized_client.get('/api/v1/creation-tasks/')
+        self.authorized_client.get('/api/v1/creation-tasks/')
+        response = self.guest_client.get(self.METRICS_URL)
+        content = response.content.decode()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            'http_requests_total{action="statistics",method="GET",'
+            'status="200",view="TaskUpdateViewSet"} 1',
+            content
+        )
+        self.assertIn(
+            'http_requests_total{action="list",method="GET",'
+            'status="200",view="TaskViewSet"} 2',
+            content
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{action="list",'
+            'view="TaskViewSet",le="+Inf"} 2',
+            content
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{action="list",view="TaskViewSet"} 2',
+            content
+        )
+        self.assertIn('http_db_queries_total{action="list",view="TaskViewSet"}', content)
+        self.assertIn('metrics_overhead_seconds_total ', content)
+
+    def test_metrics_token(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.guest_client.get(self.METRICS_URL)
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+            response = self.guest_client.get(
+                self.METRICS_URL,
+                HTTP_AUTHORIZATION='Bearer secret'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,96 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from main.db.pool import ConnectionPool, PoolTimeout
+
+
+class Connection:
+
+    def __init__(self):
+        self.closed = False
+        self.usable = True
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(SimpleTestCase):
+    """ Test database connection pool. """
+
+    def get_pool(self, **kwargs):
+        return ConnectionPool(
+            is_usable=lambda connection: connection.usable,
+            reset=lambda connection: not connection.closed,
+            **kwargs,
+        )
+
+    def test_connection_is_reused(self):
+        pool = self.get_pool()
+        connection = pool.acquire(Connection)
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(Connection), connection)
+        self.assertEqual(pool.size, 1)
+
+    def test_pool_is_bounded(self):
+        pool = self.get_pool(max_size=1, timeout=0.05)
+        connection = pool.acquire(Connection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(Connection)
+
+        threading.Timer(0.01, pool.release, (connection,)).start()
+        pool.timeout = 1
+        self.assertIs(pool.acquire(Connection), connection)
+
+    def test_unusable_connection_is_replaced(self):
+        pool = self.get_pool(health_check_interval=0)
+        connection = pool.acquire(Connection)
+        pool.release(connection)
+        connection.usable = False
+
+        new_connection = pool.acquire(Connection)
+        self.assertIsNot(new_connection, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.size, 1)
+
+    def test_broken_connection_is_not_returned(self):
+        pool = self.get_pool()
+        connection = pool.acquire(Connection)
+        connection.close()
+        pool.release(connection)
+
+        self.assertEqual(pool.size, 0)
+        self.assertEqual(pool.idle, [])
+
+    def test_idle_connections_expire(self):
+        pool = self.get_pool(max_idle=0)
+        connection = pool.acquire(Connection)
+        pool.release(connection)
+
+        self.assertIsNot(pool.acquire(Connection), connection)
+        self.assertTrue(connection.closed)
+
+    def test_failed_connect_frees_slot(self):
+        pool = self.get_pool(max_size=1, timeout=0)
+
+        def fail():
+            raise OSError
+
+        with self.assertRaises(OSError):
+            pool.acquire(fail)
+        self.assertEqual(pool.size, 0)
+        pool.acquire(Connection)
+
+    def test_closed_pool(self):
+        pool = self.get_pool()
+        idle = pool.acquire(Connection)
+        used = pool.acquire(Connection)
+        pool.release(idle)
+        pool.close_all()
+        pool.release(used)
+
+        self.assertTrue(idle.closed)
+        self.assertTrue(used.closed)
+        self.assertEqual(pool.size, 0)
@@ -0,0 +1,116 @@
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core import mail
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from main.models import Category, Task
+from main.reminders import DUE_SOON, OVERDUE, sweep
+
+User = get_user_model()
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class TestReminders(APITestCase):
+    """ Test due-soon and overdue reminders. """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestReminders, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+        now = timezone.now()
+        cls.due_soon_tasks = [
+            cls.create_task('Скоро 1', now + timedelta(hours=1), cls.first_user),
+            cls.create_task('Скоро 2', now + timedelta(hours=2), cls.first_user),
+            cls.create_task('Скоро 3', now + timedelta(hours=2), cls.second_user),
+        ]
+        cls.overdue_task = cls.create_task(
+            'Просрочена', now - timedelta(hours=1), cls.second_user
+        )
+        cls.create_task('Не скоро', now + timedelta(days=5), cls.first_user)
+        cls.create_task('Давно', now - timedelta(days=30), cls.first_user)
+        cls.create_task(
+            'Завершена', now + timedelta(hours=1), cls.first_user, is_completed=True
+        )
+
+    @classmethod
+    def create_task(cls, title, due_date, assigned_to, **kwargs):
+        return Task.objects.create(
+            title=title,
+            due_date=due_date,
+            category=cls.category,
+            creator=cls.first_user,
+            assigned_to=assigned_to,
+            **kwargs,
+        )
+
+    def test_due_soon_reminders_grouped_by_assignee(self):
+        reminded = sweep(DUE_SOON, batch_size=2)
+
+        self.assertEqual(reminded, 3)
+        self.assertEqual(
+            [message.to[0] for message in mail.outbox],
+            ['first@test.ru', 'second@test.ru']
+        )
+        self.assertEqual(
+            Task.objects.filter(due_soon_reminded_at__isnull=False).count(),
+            3
+        )
+
+        mail.outbox.clear()
+        self.assertEqual(sweep(DUE_SOON), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_one_email_per_assignee_in_batch(self):
+        sweep(DUE_SOON)
+
+        self.assertEqual(len(mail.outbox), 2)
+        first_email = [
+            message for message in mail.outbox if message.to == ['first@test.ru']
+        ][0]
+        self.assertIn('Скоро 1', first_email.body)
+        self.assertIn('Скоро 2', first_email.body)
+
+    def test_overdue_reminders(self):
+        self.assertEqual(sweep(OVERDUE), 1)
+        self.assertEqual(mail.outbox[0].to, ['second@test.ru'])
+        self.assertIn('Просрочена', mail.outbox[0].body)
+        self.assertEqual(sweep(OVERDUE), 0)
+
+    def test_new_due_date_resets_reminder(self):
+        sweep(DUE_SOON)
+        task = Task.objects.get(id=self.due_soon_tasks[0].id)
+        task.due_date = timezone.now() + timedelta(hours=3)
+        task.save()
+
+        mail.outbox.clear()
+        self.assertEqual(sweep(DUE_SOON), 1)
+        self.assertIn(task.title, mail.outbox[0].body)
+
+    def test_failed_send_releases_batch(self):
+        with mock.patch('main.reminders.send_mass_mail', side_effect=SMTPException):
+            with self.assertRaises(SMTPException):
+                sweep(DUE_SOON)
+
+        self.assertFalse(Task.objects.filter(due_soon_reminded_at__isnull=False).exists())
+        self.assertEqual(sweep(DUE_SOON), 3)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_time_budget(self):
+        self.assertEqual(sweep(DUE_SOON, time_budget=-1), 0)
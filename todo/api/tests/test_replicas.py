@@ -0,0 +1,96 @@
+import math
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main.db import router
+from main.models import Category
+
+User = get_user_model()
+
+REPLICA = 'replica_test'
+
+
+@override_settings(
+    REPLICA_DATABASES=[REPLICA],
+    REPLICA_MAX_LAG=5,
+    REPLICA_LAG_CHECK_INTERVAL=60,
+    THROTTLE_ENABLED=False,
+)
+class TestReplicas(APITestCase):
+    """ Test routing of reads to replicas. """
+
+    # The replica database doesn't get the writes of the primary, which
+    # shows where a request read from.
+    databases = {'default', REPLICA}
+
+    URL = '/api/v1/category/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestReplicas, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='test_user',
+            email='test@test.ru',
+        )
+        Category.objects.create(name='На основной')
+        Category.objects.using(REPLICA).create(name='На реплике')
+
+    def setUp(self):
+        router.forget_lags()
+        self.client.force_authenticate(self.user)
+
+    def get_names(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [category['name'] for category in response.json()['results']]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.get_names(), ['На реплике'])
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(
+            list(Category.objects.values_list('name', flat=True)),
+            ['На основной'],
+        )
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.client.post(self.URL, {'name': 'Новая'})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Category.objects.filter(name='Новая').exists())
+        self.assertFalse(Category.objects.using(REPLICA).filter(name='Новая').exists())
+        self.assertIn('Новая', self.get_names())
+
+        self.client.cookies[settings.REPLICA_STICKY_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.get_names(), ['На реплике'])
+
+    def test_forged_sticky_cookie_is_ignored(self):
+        self.client.cookies[settings.REPLICA_STICKY_COOKIE] = 'forever'
+
+        self.assertEqual(self.get_names(), ['На реплике'])
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with mock.patch.object(router, 'measure_lag', return_value=60.0):
+            self.assertEqual(self.get_names(), ['На основной'])
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        with mock.patch.object(router, 'measure_lag', return_value=math.inf):
+            self.assertEqual(self.get_names(), ['На основной'])
+
+    def test_lag_is_measured_once_per_interval(self):
+        with mock.patch.object(router, 'measure_lag', return_value=0.0) as measure_lag:
+            self.get_names()
+            self.get_names()
+
+        measure_lag.assert_called_once_with(REPLICA)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(router.ReplicaRouter().allow_migrate(REPLICA, 'main'))
+        self.assertTrue(router.ReplicaRouter().allow_migrate('default', 'main'))
@@ -0,0 +1,204 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main.archive import archive
+from main.models import Category, CompletionRollup, Task
+
+User = get_user_model()
+
+
+class TestCompletionRollups(APITestCase):
+    """ Test daily completion rollups and the timeline built from them. """
+
+    ASSIGNED_TIMELINE_URL = '/api/v1/tasks/statistics/timeline/'
+    CREATOR_TIMELINE_URL = '/api/v1/creation-tasks/statistics/timeline/'
+    ASSIGNED_OBJECT_URL = '/api/v1/tasks/{0}/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestCompletionRollups, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.first_category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.second_category = Category.objects.create(
+            name='Вторая категория',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.second_user)
+        self.now = timezone.now()
+
+    def create_task(self, category=None, due_in=timedelta(days=1), **kwargs):
+        return Task.objects.create(**{
+            'title': 'Задача',
+            'category': category or self.first_category,
+            'creator': self.first_user,
+            'assigned_to': self.second_user,
+            'due_date': self.now + due_in,
+            **kwargs,
+        })
+
+    def get_rollups(self):
+        return list(CompletionRollup.objects.filter(completed_count__gt=0).values_list(
+            'date', 'category', 'completed_count', 'overdue_count',
+        ).order_by('date', 'category'))
+
+    def test_completion_is_recorded_once(self):
+        task = self.create_task()
+        self.assertEqual(self.get_rollups(), [])
+
+        response = self.client.patch(
+            self.ASSIGNED_OBJECT_URL.format(task.id),
+            {'is_completed': True},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        task.refresh_from_db()
+        task.save()
+        task.save()
+
+        self.assertEqual(
+            self.get_rollups(),
+            [(timezone.localdate(), self.first_category.id, 1, 0)],
+        )
+
+    def test_reopen_move_and_delete(self):
+        task = self.create_task(
+            due_in=-timedelta(days=1),
+            is_completed=True,
+        )
+        self.assertEqual(
+            self.get_rollups(),
+            [(timezone.localdate(), self.first_category.id, 1, 1)],
+        )
+
+        task.category = self.second_category
+        task.save()
+        self.assertEqual(
+            self.get_rollups(),
+            [(timezone.localdate(), self.second_category.id, 1, 1)],
+        )
+
+        task.is_completed = False
+        task.save()
+        self.assertEqual(self.get_rollups(), [])
+
+        task.is_completed = True
+        task.save()
+        Task.objects.filter(id=task.id).delete()
+        self.assertEqual(self.get_rollups(), [])
+
+    def test_backfill_matches_incremental_rollups(self):
+        for days in range(3):
+            self.create_task(
+                is_completed=True,
+                finish_date=self.now - timedelta(days=days),
+                due_in=-timedelta(days=1, hours=days),
+            )
+        self.create_task(category=self.second_category, is_completed=True)
+        self.create_task()
+        incremental = self.get_rollups()
+
+        CompletionRollup.objects.all().delete()
+        call_command('backfill_completion_rollups', days=2, stdout=open('/dev/null', 'w'))
+
+        self.assertEqual(self.get_rollups(), incremental)
+        self.assertEqual(len(incremental), 4)
+
+    def test_backfill_keeps_archived_tasks(self):
+        for days in (1, 1, 2):
+            self.create_task(
+                is_completed=True,
+                finish_date=self.now - timedelta(days=days),
+                due_in=-timedelta(days=1, hours=days),
+            )
+        # Finished on the same day, but stays in the task table.
+        later = self.now - timedelta(days=1) + timedelta(seconds=1)
+        self.create_task(is_completed=True, finish_date=later)
+        timeline = self.client.get(self.ASSIGNED_TIMELINE_URL).data
+
+        self.assertEqual(archive(before=later), 3)
+        CompletionRollup.objects.all().delete()
+        call_command('backfill_completion_rollups', days=2, stdout=open('/dev/null', 'w'))
+
+        self.assertEqual(self.client.get(self.ASSIGNED_TIMELINE_URL).data, timeline)
+        self.assertEqual(sum(row['completed'] for row in timeline), 4)
+
+    def test_timeline_reads_only_rollups(self):
+        self.create_task(is_completed=True, due_in=-timedelta(hours=1))
+        self.create_task(is_completed=True)
+        self.create_task(category=self.second_category, is_completed=True)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                self.ASSIGNED_TIMELINE_URL,
+                {'period': 'month', 'group_by': 'category'},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any(
+            '"main_task"' in query['sql'] for query in context.captured_queries
+        ))
+        rows = {row['category']: row for row in response.data}
+        self.assertEqual(rows[self.first_category.id]['completed'], 2)
+        self.assertEqual(rows[self.first_category.id]['overdue_rate'], 0.5)
+        self.assertEqual(
+            rows[self.first_category.id]['period'],
+            timezone.localdate().replace(day=1),
+        )
+        self.assertEqual(rows[self.second_category.id]['overdue'], 0)
+        self.assertIsInstance(
+            rows[self.second_category.id]['average_cycle_time'], timedelta
+        )
+
+    def test_timeline_is_limited_to_user_tasks(self):
+        self.create_task(is_completed=True)
+
+        response = self.client.get(self.CREATOR_TIMELINE_URL)
+        self.assertEqual(response.data, [])
+
+        self.client.force_authenticate(self.first_user)
+        response = self.client.get(
+            self.CREATOR_TIMELINE_URL,
+            {'group_by': 'assigned_to'},
+        )
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['assigned_to'], self.second_user.id)
+
+    def test_timeline_range(self):
+        self.create_task(is_completed=True)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+
+        response = self.client.get(
+            self.ASSIGNED_TIMELINE_URL,
+            {'date_from': tomorrow.isoformat()},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(
+            self.ASSIGNED_TIMELINE_URL,
+            {
+                'date_from': tomorrow.isoformat(),
+                'date_to': tomorrow.isoformat(),
+            },
+        )
+        self.assertEqual(response.data, [])
+
+        response = self.client.get(self.ASSIGNED_TIMELINE_URL, {'period': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,295 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main import category_stats, sharding
+from main.archive import archive
+from main.models import Category, Subtask, Task, TaskAssignment
+
+User = get_user_model()
+
+SHARD = 'shard_test'
+
+
+@override_settings(
+    TASK_SHARDS=['default', SHARD],
+    THROTTLE_ENABLED=False,
+)
+class TestSharding(APITestCase):
+    """ Test sharding of tasks by their creator. """
+
+    databases = {'default', SHARD}
+
+    CREATOR_URL = '/api/v1/creation-tasks/'
+    ASSIGNED_URL = '/api/v1/tasks/'
+    SUBTASKS_URL = '/api/v1/tasks/{0}/subtasks/'
+    CATEGORY_STATS_URL = '/api/v1/category/statistics/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestSharding, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.sharded_user = User.objects.create_user(
+            username='sharded_test_user',
+            email='sharded@test.ru',
+            task_shard=SHARD,
+        )
+        cls.primary_user = User.objects.create_user(
+            username='primary_test_user',
+            email='primary@test.ru',
+            task_shard='default',
+        )
+        cls.category = Category.objects.create(
+            name='Категория',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.sharded_user)
+
+    def create_task(self, title, creator, **kwargs):
+        return Task.objects.create(**{
+            'title': title,
+            'due_date': timezone.now() + timedelta(days=1),
+            'category': self.category,
+            'creator': creator,
+            'assigned_to': self.primary_user,
+            **kwargs,
+        })
+
+    def test_task_is_created_on_shard_of_creator(self):
+        primary_task = self.create_task('На основной', self.primary_user)
+
+        response = self.client.post(self.CREATOR_URL, data={
+            'title': 'На шарде',
+            'description': '',
+            'due_date': timezone.now() + timedelta(days=1),
+            'category': self.category.id,
+            'assigned_to': self.primary_user.id,
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        task_id = response.json()['id']
+        self.assertGreater(task_id, primary_task.id)
+        self.assertTrue(Task.objects.using(SHARD).filter(id=task_id).exists())
+        self.assertFalse(Task.objects.using('default').filter(id=task_id).exists())
+        self.assertEqual(sharding.locate(task_id), SHARD)
+        self.assertEqual(sharding.locate(primary_task.id), 'default')
+
+        response = self.client.get(self.CREATOR_URL)
+        self.assertEqual(
+            [task['id'] for task in response.json()['results']],
+            [task_id],
+        )
+        response = self.client.patch(
+            f'{self.CREATOR_URL}{task_id}/',
+            data={'title': 'Изменена'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Task.objects.using(SHARD).get(id=task_id).title, 'Изменена')
+
+    def test_assigned_tasks_are_merged_across_shards(self):
+        tasks = [
+            self.create_task(f'Задача {number}', creator)
+            for number in range(6)
+            for creator in (self.sharded_user, self.primary_user)
+        ]
+        self.create_task('Чужая', self.sharded_user, assigned_to=self.sharded_user)
+        self.client.force_authenticate(self.primary_user)
+
+        first_page = self.client.get(self.ASSIGNED_URL).json()
+        second_page = self.client.get(self.ASSIGNED_URL, {'page': 2}).json()
+
+        self.assertEqual(first_page['count'], 12)
+        self.assertEqual(
+            [task['id'] for task in first_page['results'] + second_page['results']],
+            [task.id for task in reversed(tasks)],
+        )
+        statistics = self.client.get(f'{self.ASSIGNED_URL}statistics/').json()
+        self.assertEqual(statistics['tasks_count'], 12)
+        self.assertEqual(statistics['uncompleted_tasks_count'], 12)
+
+    def test_batch_of_tasks_on_shards(self):
+        sharded = self.create_task('На шарде', self.sharded_user)
+        primary = self.create_task('На основной', self.primary_user)
+        subtask = Subtask.objects.create(
+            title='Подзадача',
+            parent_task=sharded,
+            creator=self.sharded_user,
+        )
+        self.client.force_authenticate(self.primary_user)
+
+        response = self.client.get(f'{self.ASSIGNED_URL}batch/', {
+            'ids': [primary.id, sharded.id],
+            'subtask_ids': [subtask.id],
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [task['title'] for task in response.json()['tasks']],
+            ['На основной', 'На шарде'],
+        )
+        self.assertEqual(response.json()['tasks'][1]['subtasks'][0]['id'], subtask.id)
+        self.assertEqual(response.json()['subtasks'][0]['id'], subtask.id)
+
+    def test_task_on_other_shard_is_updated_by_assignee(self):
+        task = self.create_task('На шарде', self.sharded_user)
+        self.client.force_authenticate(self.primary_user)
+
+        response = self.client.patch(
+            f'{self.ASSIGNED_URL}{task.id}/',
+            data={'is_completed': True},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(Task.objects.using(SHARD).get(id=task.id).is_completed)
+        statistics = self.client.get(f'{self.ASSIGNED_URL}statistics/').json()
+        self.assertEqual(statistics['completed_tasks_count'], 1)
+        self.assertIsNotNone(statistics['average_time'])
+
+    def test_task_on_other_shard_is_completed_by_assignee(self):
+        task = self.create_task('На шарде', self.sharded_user)
+        self.client.force_authenticate(self.primary_user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{self.ASSIGNED_URL}{task.id}/complete/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(Task.objects.using(SHARD).get(id=task.id).is_completed)
+        statistics = self.client.get(f'{self.ASSIGNED_URL}statistics/').json()
+        self.assertEqual(statistics['completed_tasks_count'], 1)
+
+    def test_archived_tasks_are_listed_from_shards(self):
+        archived = self.create_task(
+            'Старая',
+            self.sharded_user,
+            is_completed=True,
+            finish_date=timezone.now() - timedelta(days=400),
+        )
+        current = self.create_task('Текущая', self.primary_user)
+
+        self.assertEqual(archive(), 1)
+
+        self.client.force_authenticate(self.primary_user)
+        response = self.client.get(self.ASSIGNED_URL, {'include_archived': 'true'})
+        self.assertEqual(
+            [(task['id'], task['is_archived']) for task in response.json()['results']],
+            [(current.id, False), (archived.id, True)],
+        )
+
+    def test_subtasks_are_kept_with_their_task(self):
+        task = self.create_task('На шарде', self.sharded_user)
+
+        response = self.client.post(self.SUBTASKS_URL.format(task.id), data={
+            'title': 'Подзадача',
+            'description': '',
+            'parent_task': task.id,
+            'is_completed': True,
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(
+            Subtask.objects.using(SHARD).filter(parent_task_id=task.id).exists()
+        )
+        task.refresh_from_db()
+        self.assertEqual((task.subtasks_total, task.subtasks_completed), (1, 1))
+        response = self.client.get(self.SUBTASKS_URL.format(task.id))
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_category_statistics_are_merged_across_shards(self):
+        now = timezone.now()
+        for creator, hours in ((self.primary_user, 1), (self.sharded_user, 3), (self.sharded_user, 5)):
+            self.create_task(
+                'Выполненная',
+                creator,
+                is_completed=True,
+                finish_date=now + timedelta(hours=hours),
+            )
+        self.create_task('Открытая', self.sharded_user)
+        self.create_task('Просроченная', self.primary_user, due_date=now - timedelta(days=1))
+
+        self.assertTrue(category_stats.refresh())
+        response = self.client.get(self.CATEGORY_STATS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(response.data['refreshed_at'])
+        [stats] = response.data['results']
+        self.assertEqual(stats['id'], self.category.id)
+        self.assertEqual(stats['open_count'], 2)
+        self.assertEqual(stats['completed_count'], 3)
+        self.assertEqual(stats['overdue_count'], 1)
+        # The shard medians, an hour and four hours, weighted by one and
+        # two completed tasks.
+        self.assertAlmostEqual(
+            stats['median_cycle_time'],
+            timedelta(hours=4),
+            delta=timedelta(minutes=1),
+        )
+
+    def test_references_are_copied_to_shards(self):
+        category = Category.objects.create(name='Новая')
+        self.assertEqual(
+            Category.objects.using(SHARD).get(pk=category.pk).name,
+            'Новая',
+        )
+
+        category.name = 'Переименована'
+        category.save()
+        self.assertEqual(
+            Category.objects.using(SHARD).get(pk=category.pk).name,
+            'Переименована',
+        )
+
+        category.delete()
+        self.assertFalse(Category.objects.using(SHARD).filter(pk=category.pk).exists())
+
+    def test_rebalance_moves_tasks_of_user(self):
+        task = self.create_task('Переезжает', self.primary_user)
+        subtask = Subtask.objects.create(
+            title='Подзадача',
+            parent_task=task,
+            creator=self.primary_user,
+        )
+        out = StringIO()
+
+        with mock.patch.object(
+                sharding,
+                'choose_shard',
+                side_effect=lambda user_id, shards=None: SHARD,
+        ):
+            call_command('rebalance_task_shards', stdout=out)
+
+        self.assertIn('Moved 1 tasks of 1 users.', out.getvalue())
+        self.assertFalse(Task.objects.using('default').filter(id=task.id).exists())
+        moved = Task.objects.using(SHARD).get(id=task.id)
+        self.assertEqual(moved.created_at, task.created_at)
+        self.assertEqual(
+            list(moved.related_subtasks.values_list('id', flat=True)),
+            [subtask.id],
+        )
+        self.assertEqual(TaskAssignment.objects.get(task_id=task.id).shard, SHARD)
+        user = User.objects.get(pk=self.primary_user.pk)
+        self.assertEqual(user.task_shard, SHARD)
+
+        self.client.force_authenticate(user)
+        response = self.client.get(f'{self.ASSIGNED_URL}{task.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_adding_shard_moves_users_only_to_it(self):
+        before = {user_id: sharding.choose_shard(user_id, ['a', 'b']) for user_id in range(1000)}
+        after = {user_id: sharding.choose_shard(user_id, ['a', 'b', 'c']) for user_id in range(1000)}
+
+        self.assertEqual(
+            before,
+            {user_id: sharding.choose_shard(user_id, ['b', 'a']) for user_id in range(1000)},
+        )
+        moved = {user_id for user_id in before if before[user_id] != after[user_id]}
+        self.assertTrue(moved)
+        self.assertEqual({after[user_id] for user_id in moved}, {'c'})
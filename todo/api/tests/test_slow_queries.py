@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import slow_queries
+from main.models import Category, Task, Subtask
+
+User = get_user_model()
+
+
+@override_settings(
+    SLOW_QUERY_BACKEND='api.slow_queries.LocalBackend',
+    SLOW_QUERY_THRESHOLD_MS=0,
+    SLOW_QUERY_REPEAT_THRESHOLD=3,
+)
+class TestSlowQueries(APITestCase):
+    """ Test slow query capture. """
+
+    URL = '/api/v1/slow-queries/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestSlowQueries, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.admin = User.objects.create_user(
+            username='admin',
+            email='admin@test.ru',
+            is_staff=True,
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+        for number in range(4):
+            task = Task.objects.create(
+                title=f'Task {number}',
+                due_date=timezone.now()+timedelta(days=1),
+                category=cls.category,
+                creator=cls.user,
+                assigned_to=cls.user,
+            )
+            Subtask.objects.create(
+                title='Subtask',
+                parent_task=task,
+                creator=cls.user,
+            )
+
+    def setUp(self) -> None:
+        slow_queries.get_backend().clear()
+        self.authorized_client = APIClient()
+        token = RefreshToken.for_user(self.user)
+        self.authorized_client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {str(token.access_token)}'
+        )
+        self.admin_client = APIClient()
+        admin_token = RefreshToken.for_user(self.admin)
+        self.admin_client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {str(admin_token.access_token)}'
+        )
+
+    def get_entries(self, kind):
+        # EXPLAIN runs in a single background thread, wait for it.
+        slow_queries.executor.submit(lambda: None).result()
+        response = self.admin_client.get(self.URL, {'kind': kind})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_slow_queries_are_attributed(self):
+        self.authorized_client.get('/api/v1/creation-tasks/')
+        entries = [
+            entry for entry in self.get_entries(slow_queries.SLOW)
+            if entry['view'] == 'TaskViewSet.list'
+        ]
+
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['plan'] for entry in entries))
+        self.assertTrue(all(entry['path'] == '/api/v1/creation-tasks/' for entry in entries))
+
+    def test_repeated_queries_are_flagged(self):
+        self.authorized_client.get('/api/v1/creation-tasks/')
+        entries = [
+            entry for entry in self.get_entries(slow_queries.N_PLUS_ONE)
+            if 'main_subtask' in entry['sql']
+        ]
+
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['count'], 4)
+        self.assertEqual(entries[0]['view'], 'TaskViewSet.list')
+        self.assertIn('api/serializers.py', entries[0]['call_site'])
+        self.assertIn('get_subtasks', entries[0]['call_site'])
+
+    def test_only_admin_can_read_slow_queries(self):
+        response = self.authorized_client.get(self.URL)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,170 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main.archive import archive
+from main.models import ArchivedTask, Category, Subtask, Task
+
+User = get_user_model()
+
+
+class TestSubtaskProgress(APITestCase):
+    """ Test the denormalized subtask counters of tasks. """
+
+    URL = '/api/v1/creation-tasks/'
+    SUBTASKS_URL = '/api/v1/tasks/{0}/subtasks/'
+    SUBTASK_URL = '/api/v1/tasks/{0}/subtasks/{1}/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestSubtaskProgress, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.first_task = self.create_task('Первая')
+        self.second_task = self.create_task('Вторая')
+        self.empty_task = self.create_task('Пустая')
+
+    def create_task(self, title, **kwargs):
+        return Task.objects.create(
+            title=title,
+            category=self.category,
+            creator=self.user,
+            assigned_to=self.user,
+            **kwargs,
+        )
+
+    def create_subtask(self, task, **kwargs):
+        return Subtask.objects.create(
+            title='Подзадача',
+            parent_task=task,
+            creator=self.user,
+            **kwargs,
+        )
+
+    def assertCounters(self, task, total, completed):
+        task.refresh_from_db()
+        self.assertEqual(
+            (task.subtasks_total, task.subtasks_completed),
+            (total, completed),
+        )
+
+    def test_counters_follow_subtasks(self):
+        response = self.client.post(
+            self.SUBTASKS_URL.format(self.first_task.id),
+            {'title': 'Подзадача', 'parent_task': self.first_task.id},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        subtask = self.create_subtask(self.first_task)
+        self.assertCounters(self.first_task, 2, 0)
+
+        response = self.client.patch(
+            self.SUBTASK_URL.format(self.first_task.id, subtask.id),
+            {'is_completed': True},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCounters(self.first_task, 2, 1)
+
+        subtask.refresh_from_db()
+        subtask.parent_task = self.second_task
+        subtask.save()
+        self.assertCounters(self.first_task, 1, 0)
+        self.assertCounters(self.second_task, 1, 1)
+
+        subtask.delete()
+        self.assertCounters(self.second_task, 0, 0)
+        Subtask.objects.filter(parent_task=self.first_task).delete()
+        self.assertCounters(self.first_task, 0, 0)
+
+    def test_task_save_keeps_counters(self):
+        stale = Task.objects.get(id=self.first_task.id)
+        self.create_subtask(self.first_task, is_completed=True)
+
+        stale.title = 'Новое название'
+        stale.save()
+
+        self.assertCounters(self.first_task, 1, 1)
+        self.assertEqual(self.first_task.title, 'Новое название')
+
+    def test_repair_command(self):
+        self.create_subtask(self.first_task, is_completed=True)
+        self.create_subtask(self.first_task)
+        Task.objects.filter(id=self.first_task.id).update(subtasks_total=7)
+        Task.objects.filter(id=self.empty_task.id).update(subtasks_completed=1)
+
+        output = StringIO()
+        call_command('repair_subtask_counters', dry_run=True, stdout=output)
+        self.assertIn('Checked 3 tasks. Found 2', output.getvalue())
+        self.assertCounters(self.first_task, 7, 1)
+
+        output = StringIO()
+        call_command('repair_subtask_counters', batch_size=2, stdout=output)
+        self.assertIn('Repaired 2', output.getvalue())
+        self.assertCounters(self.first_task, 2, 1)
+        self.assertCounters(self.empty_task, 0, 0)
+
+    def test_filter_and_order_by_progress(self):
+        self.create_subtask(self.first_task, is_completed=True)
+        self.create_subtask(self.first_task, is_completed=True)
+        self.create_subtask(self.second_task, is_completed=True)
+        self.create_subtask(self.second_task)
+
+        def get_titles(params):
+            response = self.client.get(self.URL, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [task['title'] for task in response.data['results']]
+
+        self.assertEqual(get_titles({'has_subtasks': 'false'}), ['Пустая'])
+        self.assertEqual(get_titles({'subtasks_done': 'true'}), ['Первая'])
+        self.assertEqual(
+            get_titles({'subtasks_done': 'false'}),
+            ['Пустая', 'Вторая'],
+        )
+        self.assertEqual(
+            get_titles({'has_subtasks': 'true', 'subtasks_remaining_max': 0}),
+            ['Первая'],
+        )
+        self.assertEqual(
+            get_titles({'ordering': '-subtasks_completed'}),
+            ['Первая', 'Вторая', 'Пустая'],
+        )
+
+    def test_counters_without_subtasks_payload(self):
+        self.create_subtask(self.first_task, is_completed=True)
+        self.create_subtask(self.first_task)
+
+        response = self.client.get(self.URL, {'include_subtasks': 'false'})
+
+        task = next(
+            task for task in response.data['results']
+            if task['id'] == self.first_task.id
+        )
+        self.assertNotIn('subtasks', task)
+        self.assertEqual(task['subtasks_total'], 2)
+        self.assertEqual(task['subtasks_completed'], 1)
+
+        response = self.client.get(self.URL)
+        self.assertIn('subtasks', response.data['results'][0])
+
+    def test_archive_keeps_counters(self):
+        task = self.create_task('Старая', is_completed=True)
+        Task.objects.filter(id=task.id).update(finish_date='2000-01-01T00:00Z')
+        self.create_subtask(task, is_completed=True)
+
+        archive()
+
+        archived = ArchivedTask.objects.get(id=task.id)
+        self.assertEqual(archived.subtasks_total, 1)
+        self.assertEqual(archived.subtasks_completed, 1)
@@ -0,0 +1,241 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main.models import Category, Task
+
+User = get_user_model()
+
+
+class TestTaskFilters(APITestCase):
+    """ Test filtering and ordering of the task lists and their query plans. """
+
+    CREATOR_URL = '/api/v1/creation-tasks/'
+    ASSIGNED_URL = '/api/v1/tasks/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestTaskFilters, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.first_category = Category.objects.create(
+            name='Первая категория',
+        )
+        cls.second_category = Category.objects.create(
+            name='Вторая категория',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.first_user)
+        self.now = timezone.now()
+        self.overdue = self.create_task(
+            'Просроченная',
+            due_date=self.now - timedelta(days=2),
+            priority=Task.HIGH_INDEX,
+        )
+        self.soon = self.create_task(
+            'Скоро',
+            due_date=self.now + timedelta(days=1),
+            priority=Task.MEDIUM_INDEX,
+            assigned_to=self.second_user,
+        )
+        self.later = self.create_task(
+            'Позже',
+            due_date=self.now + timedelta(days=10),
+            category=self.second_category,
+        )
+        self.done = self.create_task(
+            'Выполненная',
+            due_date=self.now - timedelta(days=5),
+            is_completed=True,
+            priority=Task.HIGH_INDEX,
+        )
+
+    def create_task(self, title, **kwargs):
+        return Task.objects.create(**{
+            'title': title,
+            'category': self.first_category,
+            'creator': self.first_user,
+            'assigned_to': self.first_user,
+            **kwargs,
+        })
+
+    def get_titles(self, params, url=CREATOR_URL):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [task['title'] for task in response.data['results']]
+
+    def test_priority_is_stored_as_integer(self):
+        task = Task.objects.get(id=self.overdue.id)
+        self.assertEqual(task.priority, 2)
+        self.assertEqual(task.get_priority_display(), Task.HIGH_STATUS)
+
+        response = self.client.post(self.CREATOR_URL, {
+            'title': 'Новая',
+            'category': self.first_category.id,
+            'assigned_to': self.first_user.id,
+            'due_date': self.now + timedelta(days=1),
+            'priority': '1',
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['priority'], Task.MEDIUM_STATUS)
+
+    def test_filters(self):
+        self.assertEqual(
+            self.get_titles({
+                'due_date_after': self.now.isoformat(),
+                'due_date_before': (self.now + timedelta(days=5)).isoformat(),
+            }),
+            ['Скоро'],
+        )
+        self.assertEqual(
+            len(self.get_titles({'created_at_after': self.now.isoformat()})),
+            4,
+        )
+        self.assertEqual(
+            self.get_titles({'created_at_before': self.now.isoformat()}),
+            [],
+        )
+        self.assertEqual(self.get_titles({'is_completed': 'true'}), ['Выполненная'])
+        self.assertEqual(
+            set(self.get_titles({'priority': [Task.MEDIUM_INDEX, Task.HIGH_INDEX]})),
+            {'Просроченная', 'Скоро', 'Выполненная'},
+        )
+        self.assertEqual(
+            self.get_titles({'assigned_to': self.second_user.id}),
+            ['Скоро'],
+        )
+        self.assertEqual(self.get_titles({'overdue': 'true'}), ['Просроченная'])
+        self.assertEqual(
+            set(self.get_titles({'overdue': 'false'})),
+            {'Скоро', 'Позже', 'Выполненная'},
+        )
+        self.assertEqual(
+            self.get_titles({'overdue': 'true'}, url=self.ASSIGNED_URL),
+            ['Просроченная'],
+        )
+
+    def test_invalid_filter_values(self):
+        response = self.client.get(self.CREATOR_URL, {'priority': 5})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.CREATOR_URL, {'due_date_after': 'завтра'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering(self):
+        self.assertEqual(
+            self.get_titles({'ordering': 'due_date'}),
+            ['Выполненная', 'Просроченная', 'Скоро', 'Позже'],
+        )
+        self.assertEqual(
+            self.get_titles({'ordering': 'created_at'}),
+            ['Просроченная', 'Скоро', 'Позже', 'Выполненная'],
+        )
+        self.assertEqual(
+            self.get_titles({'ordering': '-priority,due_date'}),
+            ['Выполненная', 'Просроченная', 'Скоро', 'Позже'],
+        )
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Autovacuum may analyze the table in the middle of the run,
+                # fresh statistics of the test data keep the plans stable.
+                cursor.execute('ANALYZE main_task')
+                # The test tables are tiny, a sequential scan or a sort of
+                # a few rows would win anyway.
+                cursor.execute('SET enable_seqscan = off')
+                cursor.execute('SET enable_sort = off')
+                try:
+                    cursor.execute(f'EXPLAIN {sql}')
+                    return '\n'.join(row[0] for row in cursor.fetchall())
+                finally:
+                    cursor.execute('RESET enable_seqscan')
+                    cursor.execute('RESET enable_sort')
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def assertIndexed(self, url, params, index):
+        """
+        The page query must use the given index of the list, or one of them
+        when several serve it equally well. The count query
+        only has to avoid a table scan, over a few rows the planner counts
+        through whichever index is the narrowest.
+        """
+        if isinstance(index, dict):
+            index = index[connection.vendor]
+        if isinstance(index, str):
+            index = (index,)
+        prefix = 'task_creator_' if url == self.CREATOR_URL else 'task_assigned_'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        queries = [
+            query['sql'] for query in context.captured_queries
+            if 'FROM "main_task"' in query['sql']
+        ]
+        self.assertTrue(queries)
+        for sql in queries:
+            plan = self.explain(sql)
+            message = f'{url} {params}\n{sql}\n{plan}'
+            if connection.vendor == 'postgresql':
+                self.assertNotIn('Seq Scan on main_task', plan, message)
+            else:
+                self.assertNotRegex(plan, r'(?m)^SCAN main_task\b', message)
+            if 'LIMIT' in sql:
+                self.assertTrue(
+                    any(f'{prefix}{name}_idx' in plan for name in index),
+                    message,
+                )
+
+    def test_query_plans(self):
+        # Own tasks of both users, so that for a few tasks of one user for
+        # the other neither index of a single user competes with the index
+        # of the creator and assignee.
+        for number in range(10):
+            for user in (self.first_user, self.second_user):
+                self.create_task(f'Своя {number}', creator=user, assigned_to=user)
+        week = (self.now + timedelta(days=7)).isoformat()
+        cases = (
+            ({}, 'created'),
+            ({'ordering': 'due_date'}, 'due'),
+            ({'ordering': '-due_date'}, 'due'),
+            ({'ordering': 'created_at'}, 'created'),
+            ({'ordering': '-priority'}, 'priority'),
+            ({'ordering': '-subtasks_total'}, 'subtasks'),
+            ({'ordering': 'subtasks_completed'}, 'progress'),
+            (
+                {'due_date_after': self.now.isoformat(), 'due_date_before': week},
+                {'sqlite': 'due', 'postgresql': 'created'},
+            ),
+            ({'created_at_after': self.now.isoformat()}, 'created'),
+            ({'is_completed': 'false'}, 'created'),
+            ({'is_completed': 'false', 'ordering': 'due_date'}, ('due', 'open_due')),
+            ({'priority': [Task.MEDIUM_INDEX, Task.HIGH_INDEX]}, 'created'),
+            (
+                {'priority': Task.HIGH_INDEX, 'due_date_before': week},
+                {'sqlite': 'due', 'postgresql': 'priority'},
+            ),
+            ({'overdue': 'true'}, {'sqlite': 'due', 'postgresql': 'created'}),
+            ({'overdue': 'false'}, 'created'),
+            ({'category': self.first_category.name}, 'created'),
+            ({'assigned_to': self.second_user.id}, 'assignee'),
+            ({'has_subtasks': 'true', 'ordering': 'due_date'}, 'due'),
+        )
+        for url in (self.CREATOR_URL, self.ASSIGNED_URL):
+            for params, index in cases:
+                with self.subTest(url=url, params=params):
+                    self.assertIndexed(url, params, index)
@@ -0,0 +1,214 @@
+from datetime import datetime, timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from main.models import Category, Task, TaskTemplate
+from main.recurrence import generate_occurrences
+from main.tasks import send_notifications
+
+User = get_user_model()
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    TASK_TEMPLATE_HORIZON=timedelta(days=14),
+)
+class TestTaskTemplates(APITestCase):
+    """ Test recurring task templates and their occurrences. """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestTaskTemplates, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+        cls.category = Category.objects.create(
+            name='Первая категория',
+        )
+        # Monday, so weekdays are easy to follow.
+        cls.now = timezone.make_aware(datetime(2030, 1, 7, 9))
+        cls.run_at = cls.now - timedelta(minutes=1)
+
+    def setUp(self):
+        self.client.force_authenticate(self.first_user)
+
+    def create_template(self, **kwargs):
+        return TaskTemplate.objects.create(**{
+            'title': 'Планерка',
+            'category': self.category,
+            'creator': self.first_user,
+            'assigned_to': self.second_user,
+            'starts_at': self.now,
+            **kwargs,
+        })
+
+    def test_weekly_occurrences(self):
+        template = self.create_template(weekdays='0,2')
+
+        generate_occurrences(now=self.run_at)
+
+        self.assertEqual(
+            [
+                timezone.localtime(task.due_date).date().isoformat()
+                for task in template.tasks.order_by('due_date')
+            ],
+            ['2030-01-07', '2030-01-09', '2030-01-14', '2030-01-16'],
+        )
+        task = template.tasks.first()
+        self.assertEqual(task.assigned_to, self.second_user)
+        self.assertEqual(task.category, self.category)
+
+    def test_monthly_occurrences_skip_missing_days(self):
+        template = self.create_template(
+            frequency=TaskTemplate.MONTHLY,
+            starts_at=self.now.replace(day=31),
+        )
+
+        generate_occurrences(now=self.now + timedelta(days=80))
+
+        self.assertEqual(
+            [
+                timezone.localtime(task.due_date).date().isoformat()
+                for task in template.tasks.order_by('due_date')
+            ],
+            ['2030-03-31'],
+        )
+
+    def test_generation_is_idempotent(self):
+        template = self.create_template(frequency=TaskTemplate.DAILY)
+
+        created = generate_occurrences(now=self.run_at)
+        self.assertEqual(len(created), 14)
+        self.assertEqual(generate_occurrences(now=self.run_at), [])
+
+        # A lost watermark must not duplicate the occurrences.
+        TaskTemplate.objects.filter(id=template.id).update(
+            generated_until=self.now - timedelta(days=1),
+        )
+        self.assertEqual(generate_occurrences(now=self.run_at), [])
+        self.assertEqual(template.tasks.count(), 14)
+
+        created = generate_occurrences(now=self.run_at + timedelta(days=2))
+        self.assertEqual(len(created), 2)
+
+    def test_queries_do_not_depend_on_templates_count(self):
+        for _ in range(10):
+            self.create_template(frequency=TaskTemplate.DAILY)
+
+        with CaptureQueriesContext(connection) as context:
+            created = generate_occurrences(now=self.run_at, batch_size=5)
+
+        self.assertEqual(len(created), 140)
+        self.assertLessEqual(len(context.captured_queries), 20)
+
+    def test_inactive_and_finished_templates(self):
+        self.create_template(is_active=False)
+        finished = self.create_template(
+            frequency=TaskTemplate.DAILY,
+            until=self.now + timedelta(days=1),
+        )
+
+        created = generate_occurrences(now=self.run_at)
+
+        self.assertEqual(
+            set(Task.objects.filter(id__in=created).values_list('template', flat=True)),
+            {finished.id},
+        )
+        self.assertEqual(len(created), 2)
+
+    def test_batch_notification(self):
+        self.create_template(weekdays='0,1,2')
+
+        send_notifications(generate_occurrences(now=self.run_at))
+
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(mail.outbox[0].to, ['second@test.ru'])
+        self.assertIn('Планерка', mail.outbox[0].body)
+
+    def test_batch_notification_retries_unsent(self):
+        self.create_template(weekdays='0,1,2')
+        task_ids = generate_occurrences(now=self.run_at)
+        send_messages = locmem.EmailBackend.send_messages
+        calls = []
+
+        def drop_third(backend, messages):
+            calls.append(messages)
+            if len(calls) == 3:
+                raise SMTPException
+            return send_messages(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', drop_third):
+            send_notifications.apply(args=(task_ids,))
+
+        self.assertEqual(len(calls), 7)
+        self.assertEqual(len(mail.outbox), 6)
+        # Every task is notified once, the first two aren't mailed again.
+        self.assertEqual(len({message.body for message in mail.outbox}), 6)
+
+    def test_create_template(self):
+        response = self.client.post(
+            reverse('task-templates-list'),
+            {
+                'title': 'Отчет',
+                'category': self.category.id,
+                'assigned_to': self.second_user.id,
+                'frequency': TaskTemplate.WEEKLY,
+                'weekdays': '4,0',
+                'starts_at': self.now.isoformat(),
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['weekdays'], '0,4')
+        template = TaskTemplate.objects.get(id=response.data['id'])
+        self.assertEqual(template.creator, self.first_user)
+        self.assertLess(template.generated_until, template.starts_at)
+
+    def test_invalid_template(self):
+        data = {
+            'title': 'Отчет',
+            'category': self.category.id,
+            'assigned_to': self.second_user.id,
+            'starts_at': self.now.isoformat(),
+        }
+        for invalid in (
+                {'weekdays': '7'},
+                {'weekdays': 'пн'},
+                {'interval': 0},
+                {'until': (self.now - timedelta(days=1)).isoformat()},
+        ):
+            response = self.client.post(
+                reverse('task-templates-list'),
+                {**data, **invalid},
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST, invalid
+            )
+
+    def test_templates_of_other_users_are_hidden(self):
+        own = self.create_template()
+        self.create_template(creator=self.second_user)
+
+        response = self.client.get(reverse('task-templates-list'))
+
+        self.assertEqual(
+            [template['id'] for template in response.data['results']],
+            [own.id],
+        )
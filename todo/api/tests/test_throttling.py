@@ -0,0 +1,185 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from api import load_shedding, throttling
+from main import metrics
+
+User = get_user_model()
+
+
+@override_settings(
+    METRICS_BACKEND='main.metrics.LocalBackend',
+    METRICS_TOKEN=None,
+    THROTTLE_BACKEND='api.throttling.LocalBackend',
+    THROTTLE_ENABLED=True,
+    THROTTLE_USER_BUCKET=(3, 0.001),
+    THROTTLE_ANON_BUCKET=(2, 0.001),
+    THROTTLE_VIEW_BUCKETS={'TaskUpdateViewSet.statistics': (1, 0.001)},
+)
+class TestThrottling(APITestCase):
+    """ Test token bucket throttling. """
+
+    TASKS_URL = '/api/v1/tasks/'
+    STATISTICS_URL = '/api/v1/tasks/statistics/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestThrottling, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+        cls.first_user = User.objects.create_user(
+            username='first_test_user',
+            email='first@test.ru',
+        )
+        cls.second_user = User.objects.create_user(
+            username='second_test_user',
+            email='second@test.ru',
+        )
+
+    def setUp(self):
+        throttling.get_backend().clear()
+        metrics.get_backend().clear()
+        self.client.force_authenticate(self.first_user)
+
+    def get_statuses(self, *urls, client=None):
+        client = client or self.client
+        return [client.get(url).status_code for url in urls]
+
+    def test_user_bucket(self):
+        self.assertEqual(
+            self.get_statuses(*[self.TASKS_URL] * 4),
+            [200, 200, 200, 429],
+        )
+        response = self.client.get(self.TASKS_URL)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        self.client.force_authenticate(self.second_user)
+        self.assertEqual(self.get_statuses(self.TASKS_URL), [200])
+
+    def test_endpoint_bucket(self):
+        self.assertEqual(
+            self.get_statuses(
+                self.STATISTICS_URL,
+                self.STATISTICS_URL,
+                self.TASKS_URL,
+                self.TASKS_URL,
+                self.TASKS_URL,
+            ),
+            # The rejected request takes no token from the user bucket.
+            [200, 429, 200, 200, 429],
+        )
+
+    def test_anonymous_bucket(self):
+        guest = APIClient()
+
+        self.assertEqual(
+            self.get_statuses(*['/api/v1/category/'] * 3, client=guest),
+            [200, 200, 429],
+        )
+
+    def test_refill(self):
+        now = time.monotonic()
+        with mock.patch.object(throttling.time, 'monotonic', return_value=now):
+            self.get_statuses(*[self.TASKS_URL] * 3)
+            self.assertEqual(self.get_statuses(self.TASKS_URL), [429])
+        with mock.patch.object(throttling.time, 'monotonic', return_value=now + 2000):
+            self.assertEqual(self.get_statuses(self.TASKS_URL), [200])
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(
+            self.get_statuses(*[self.STATISTICS_URL] * 3),
+            [200, 200, 200],
+        )
+
+    def test_decisions_are_exported(self):
+        self.get_statuses(self.STATISTICS_URL, self.STATISTICS_URL)
+
+        content = self.client.get('/metrics').content.decode()
+
+        self.assertIn(
+            'http_throttle_decisions_total{decision="allowed",'
+            'scope="TaskUpdateViewSet.statistics"} 1',
+            content,
+        )
+        self.assertIn(
+            'http_throttle_decisions_total{decision="throttled",'
+            'scope="TaskUpdateViewSet.statistics"} 1',
+            content,
+        )
+
+
+@override_settings(
+    METRICS_BACKEND='main.metrics.LocalBackend',
+    METRICS_TOKEN=None,
+    LOAD_SHEDDING_BACKEND='api.load_shedding.LocalBackend',
+    LOAD_SHEDDING_MAX_QUEUE_TIME=5,
+    LOAD_SHEDDING_MAX_IN_FLIGHT=None,
+)
+class TestLoadShedding(APITestCase):
+    """ Test rejection of requests when the workers are overloaded. """
+
+    URL = '/api/v1/category/'
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super(TestLoadShedding, cls).setUpClass()
+        setattr(settings, 'TESTING', True)
+
+    def setUp(self):
+        metrics.get_backend().clear()
+
+    def get(self, url=URL, started=None):
+        headers = {}
+        if started is not None:
+            headers['HTTP_X_REQUEST_START'] = started
+        return self.client.get(url, **headers)
+
+    def test_queued_too_long(self):
+        response = self.get(started=f't={time.time() - 6:.3f}')
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        content = self.client.get('/metrics').content.decode()
+        self.assertIn('http_shed_requests_total{reason="queue_time"} 1', content)
+        self.assertIn('http_queue_time_seconds_count 1', content)
+
+    def test_queue_time_formats(self):
+        now = time.time()
+        for started in (f't={now:.3f}', str(int(now * 1000)), f't={int(now * 1e6)}'):
+            self.assertEqual(self.get(started=started).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get(started=str(int((now - 60) * 1000))).status_code,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+        self.assertEqual(self.get(started='garbage').status_code, status.HTTP_200_OK)
+
+    def test_only_api_is_shed(self):
+        response = self.get('/metrics', started=f't={time.time() - 60:.3f}')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=1)
+    def test_too_many_in_flight(self):
+        backend = load_shedding.get_backend()
+        backend.enter('other', time.time())
+
+        response = self.get()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        backend.leave('other')
+        self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+        self.assertEqual(backend.requests, {})
+
+    @override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=1, LOAD_SHEDDING_REQUEST_TIMEOUT=30)
+    def test_lost_requests_expire(self):
+        load_shedding.get_backend().enter('lost', time.time() - 31)
+
+        self.assertEqual(self.get().status_code, status.HTTP_200_OK)
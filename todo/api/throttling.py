@@ -0,0 +1,190 @@
+"""
+Token bucket throttling of API requests.
+
+Every user has a bucket for all requests and, for the endpoints listed in
+THROTTLE_VIEW_BUCKETS, one per endpoint. A request takes a token from each
+of its buckets or is rejected without taking any. Buckets are refilled
+continuously at their rate. The Redis backend checks and updates all
+buckets of a request in one atomic script, a single round-trip.
+"""
+import logging
+import math
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from main.metrics import COUNTER, register
+from main.utils import get_redis
+from .utils import get_view_name
+
+
+logger = logging.getLogger(__name__)
+
+ALLOWED = 'allowed'
+THROTTLED = 'throttled'
+
+register(
+    'http_throttle_decisions_total',
+    COUNTER,
+    'Throttling decisions per bucket scope.',
+)
+
+
+def refill(tokens, updated_at, now, capacity, rate):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class LocalBackend:
+    """ Buckets in the current process, used for development and tests. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, buckets):
+        """
+        Take a token from every `(key, capacity, rate)` bucket if all have
+        one. Return whether they had and the seconds until they would have.
+        """
+        now = time.monotonic()
+        with self.lock:
+            levels = [
+                refill(*self.buckets.get(key, (capacity, now)), now, capacity, rate)
+                for key, capacity, rate in buckets
+            ]
+            wait = max(
+                (
+                    (1 - tokens) / rate
+                    for tokens, (_, _, rate) in zip(levels, buckets)
+                    if tokens < 1
+                ),
+                default=0.0,
+            )
+            allowed = wait == 0
+            for tokens, (key, _, _) in zip(levels, buckets):
+                self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return allowed, wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class RedisBackend:
+    """ Buckets shared by all workers in Redis hashes. """
+
+    # KEYS are the buckets, ARGV their capacities and rates in pairs. The
+    # clock of the Redis server is used, so workers can't disagree on it.
+    TAKE = """
+    redis.replicate_commands()
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local levels = {}
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2 - 1])
+        local rate = tonumber(ARGV[i * 2])
+        local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+        local tokens = tonumber(state[1]) or capacity
+        local updated_at = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+        if tokens < 1 then
+            wait = math.max(wait, (1 - tokens) / rate)
+        end
+        levels[i] = tokens
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2 - 1])
+        local rate = tonumber(ARGV[i * 2])
+        local tokens = levels[i]
+        if wait == 0 then
+            tokens = tokens - 1
+        end
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'updated_at', tostring(now))
+        -- A bucket left alone until it is full again is not needed.
+        redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+    end
+    return {wait == 0 and 1 or 0, tostring(wait)}
+    """
+
+    def __init__(self):
+        self.prefix = settings.THROTTLE_REDIS_PREFIX
+        self.script = get_redis().register_script(self.TAKE)
+
+    def take(self, buckets):
+        args = []
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        allowed, wait = self.script(
+            keys=[f'{self.prefix}:{key}' for key, _, _ in buckets],
+            args=args,
+        )
+        return bool(allowed), float(wait)
+
+    def clear(self):
+        client = get_redis()
+        for key in client.scan_iter(f'{self.prefix}:*'):
+            client.delete(key)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.THROTTLE_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting in ('THROTTLE_BACKEND', 'THROTTLE_REDIS_PREFIX') or setting.startswith('REDIS_'):
+        get_backend.cache_clear()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle taking a token from the bucket of the user and from the one of
+    the endpoint for the user. Anonymous requests share buckets per address.
+    """
+
+    def get_buckets(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+            capacity, rate = settings.THROTTLE_USER_BUCKET
+        else:
+            ident = f'anon:{self.get_ident(request)}'
+            capacity, rate = settings.THROTTLE_ANON_BUCKET
+        buckets = [(ident, capacity, rate)]
+        scope = '.'.join(get_view_name(request))
+        if scope in settings.THROTTLE_VIEW_BUCKETS:
+            capacity, rate = settings.THROTTLE_VIEW_BUCKETS[scope]
+            buckets.append((f'{ident}:{scope}', capacity, rate))
+        return scope, buckets
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not settings.THROTTLE_ENABLED:
+            return True
+        scope, buckets = self.get_buckets(request, view)
+        try:
+            allowed, wait = get_backend().take(buckets)
+        except redis.RedisError:
+            logger.warning('Throttling was skipped.', exc_info=True)
+            return True
+        batch = getattr(request, 'metrics', None)
+        if batch is not None:
+            batch.inc(
+                'http_throttle_decisions_total',
+                scope=scope,
+                decision=ALLOWED if allowed else THROTTLED,
+            )
+        if not allowed:
+            self.wait_seconds = math.ceil(wait)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
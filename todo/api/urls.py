@@ -6,9 +6,13 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     CategoryViewSet,
+    calendar_feed,
+    DeletionJobViewSet,
     TaskViewSet,
+    TaskTemplateViewSet,
     TaskUpdateViewSet,
     UserViewSet,
+    SlowQueryViewSet,
     SubtaskViewSet,
 )
 
@@ -38,12 +42,32 @@ router.register(
     SubtaskViewSet,
     basename='subtasks',
 )
+router.register(
+    'task-templates',
+    TaskTemplateViewSet,
+    basename='task-templates',
+)
+router.register(
+    'deletion-jobs',
+    DeletionJobViewSet,
+    basename='deletion-jobs',
+)
+router.register(
+    'slow-queries',
+    SlowQueryViewSet,
+    basename='slow-queries',
+)
 
 
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
+    path(
+        'calendar/<str:token>.ics',
+        calendar_feed,
+        name='calendar-feed',
+    ),
     path(
         'redoc/',
         TemplateView.as_view(template_name='redoc.html'),
@@ -0,0 +1,13 @@
+def get_view_name(request):
+    """
+    Return `(view, action)` of the resolved view,
+    for example `('TaskUpdateViewSet', 'statistics')`.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', request.method.lower()
+    func = match.func
+    view = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    name = view.__name__ if view else func.__name__
+    actions = getattr(func, 'actions', None) or {}
+    return name, actions.get(request.method.lower(), request.method.lower())
@@ -1,28 +1,59 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import condition, require_safe
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters
 from rest_framework.decorators import action
 from rest_framework.permissions import (
+    IsAdminUser,
     IsAuthenticatedOrReadOnly,
     IsAuthenticated,
 )
 from rest_framework.response import Response
 
-from .mixins import ListCreateViewSet, ListRetrieveUpdateViewSet
+from . import slow_queries
+from .mixins import (
+    AsyncViewSetMixin,
+    CompletionTimelineMixin,
+    IdempotentCreateMixin,
+    IncludeArchivedMixin,
+    ListCreateViewSet,
+    ListRetrieveUpdateViewSet,
+    ShardedTasksMixin,
+    TaskBatchMixin,
+    TaskBoardMixin,
+    TaskCompletionMixin,
+    TaskFragmentsMixin,
+    TaskHistoryMixin,
+)
 from .permissions import IsAssigned, IsTaskCreator, IsSubTaskCreator
 from .filters import TaskFilter
 from .serializers import (
+    CalendarQuerySerializer,
     CategorySerializer,
+    CategoryStatsSerializer,
+    DeletionJobSerializer,
     TaskCreateSerializer,
     TaskReadSerializer,
     TaskUpdateSerializer,
     SubtaskCreateSerializer,
     SubtaskReadSerializer,
+    TaskTemplateSerializer,
     UserSerializer,
     UserTaskAnaliseSerializer,
 )
-from main.models import Category, Task, Subtask
+from main import category_stats, dashboard, deletion, ical, metrics as metrics_registry
+from main.models import (
+    Category,
+    DeletionJob,
+    Task,
+    TaskTemplate,
+)
 
 
 User = get_user_model()
@@ -31,24 +62,76 @@ User = get_user_model()
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     """ Viewset that provides only `list()` and `retrieve()` actions. """
 
-    queryset = User.objects.all()
+    queryset = User.objects.filter(deleted_at__isnull=True)
     permission_classes = (IsAuthenticated,)
     serializer_class = UserSerializer
     filter_backends = (filters.SearchFilter,)
     search_fields = ('username',)
 
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='calendar',
+    )
+    def calendar(self, request):
+        """ Link to the calendar feed of the user, see `calendar_feed`. """
+
+        url = reverse('calendar-feed', args=(ical.get_token(request.user),))
+        return Response({'url': request.build_absolute_uri(url)})
+
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='dashboard',
+    )
+    def dashboard(self, request):
+        """ Counters of the open tasks of the user, see `main.dashboard`. """
+
+        return Response(dashboard.get_counters(request.user))
+
 
 class CategoryViewSet(ListCreateViewSet):
     """ Viewset that provides `GET` and `POST` methods. """
 
-    queryset = Category.objects.all()
+    queryset = Category.objects.filter(deleted_at__isnull=True)
     serializer_class = CategorySerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     filter_backends = (filters.SearchFilter,)
     search_fields = ('name', 'id',)
 
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='statistics',
+        permission_classes=(IsAuthenticated,),
+    )
+    def statistics(self, request):
+        stats = category_stats.read(self.filter_queryset(self.get_queryset()))
+        if stats:
+            refreshed_at = stats[0].refreshed_at
+        else:
+            refreshed_at = category_stats.get_refreshed_at()
+        if category_stats.is_stale(refreshed_at):
+            category_stats.request_refresh()
+        return Response({
+            'refreshed_at': refreshed_at,
+            'results': CategoryStatsSerializer(stats, many=True).data,
+        })
+
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(
+        AsyncViewSetMixin,
+        ShardedTasksMixin,
+        CompletionTimelineMixin,
+        TaskBoardMixin,
+        TaskBatchMixin,
+        TaskHistoryMixin,
+        TaskCompletionMixin,
+        IncludeArchivedMixin,
+        TaskFragmentsMixin,
+        IdempotentCreateMixin,
+        viewsets.ModelViewSet,
+):
     """
     Viewset that provides `GET`, `POST`, `PUT`, `PATCH` and `DELETE` methods
     with Task model.
@@ -57,10 +140,19 @@ class TaskViewSet(viewsets.ModelViewSet):
     permission_classes = (IsTaskCreator,)
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_class = TaskFilter
-    ordering_fields = ('priority',)
+    ordering_fields = (
+        'priority',
+        'due_date',
+        'created_at',
+        'subtasks_total',
+        'subtasks_completed',
+    )
+    shard_user_field = 'creator'
+    rollup_user_field = 'creator'
+    archived_user_field = 'creator'
 
     def get_queryset(self):
-        return Task.objects.filter(creator=self.request.user)
+        return Task.objects.visible().filter(creator=self.request.user)
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -72,8 +164,22 @@ class TaskViewSet(viewsets.ModelViewSet):
             return TaskReadSerializer
         return TaskCreateSerializer
 
+    def perform_destroy(self, instance):
+        deletion.schedule(instance, requested_by=self.request.user)
 
-class TaskUpdateViewSet(ListRetrieveUpdateViewSet):
+
+class TaskUpdateViewSet(
+        AsyncViewSetMixin,
+        ShardedTasksMixin,
+        CompletionTimelineMixin,
+        TaskBoardMixin,
+        TaskBatchMixin,
+        TaskHistoryMixin,
+        TaskCompletionMixin,
+        IncludeArchivedMixin,
+        TaskFragmentsMixin,
+        ListRetrieveUpdateViewSet,
+):
     """
     Viewset that provides `GET`, `PUT` and `PATCH` methods
     with Task model.
@@ -83,10 +189,19 @@ class TaskUpdateViewSet(ListRetrieveUpdateViewSet):
     serializer_class = TaskUpdateSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_class = TaskFilter
-    ordering_fields = ('priority',)
+    ordering_fields = (
+        'priority',
+        'due_date',
+        'created_at',
+        'subtasks_total',
+        'subtasks_completed',
+    )
+    shard_user_field = 'assigned_to'
+    rollup_user_field = 'assigned_to'
+    archived_user_field = 'assigned_to'
 
     def get_queryset(self, pk=None):
-        return Task.objects.filter(assigned_to=self.request.user)
+        return Task.objects.visible().filter(assigned_to=self.request.user)
 
     @action(
         detail=False,
@@ -94,11 +209,11 @@ class TaskUpdateViewSet(ListRetrieveUpdateViewSet):
         url_path='statistics',
     )
     def statistics(self, request,):
-        queryset = self.get_queryset()
+        queryset = self.shard_queryset(self.get_queryset())
         return Response(UserTaskAnaliseSerializer(queryset).data)
 
 
-class SubtaskViewSet(viewsets.ModelViewSet):
+class SubtaskViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     Viewset that provides `GET`, `POST`, `PUT`, `PATCH` and `DELETE` methods
     with Subtask model.
@@ -107,12 +222,107 @@ class SubtaskViewSet(viewsets.ModelViewSet):
     permission_classes = (IsSubTaskCreator,)
 
     def get_task(self):
-        return get_object_or_404(Task, id=self.kwargs.get('task_id'))
+        task_id = self.kwargs.get('task_id')
+        return get_object_or_404(
+            Task.objects.visible().on_shard_of(task_id),
+            id=task_id,
+        )
 
     def get_queryset(self):
-        return Subtask.objects.filter(parent_task=self.get_task())
+        # Subtasks are read from the shard of their task.
+        return self.get_task().related_subtasks.all()
 
     def get_serializer_class(self):
         if self.action in ['retrieve', 'list']:
             return SubtaskReadSerializer
         return SubtaskCreateSerializer
+
+
+class TaskTemplateViewSet(viewsets.ModelViewSet):
+    """
+    Viewset that provides `GET`, `POST`, `PUT`, `PATCH` and `DELETE` methods
+    with TaskTemplate model.
+    """
+
+    permission_classes = (IsTaskCreator,)
+    serializer_class = TaskTemplateSerializer
+
+    def get_queryset(self):
+        return TaskTemplate.objects.filter(creator=self.request.user)
+
+
+class DeletionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """ Viewset that provides progress of the background deletions. """
+
+    queryset = DeletionJob.objects.select_related('content_type')
+    permission_classes = (IsAdminUser,)
+    serializer_class = DeletionJobSerializer
+
+
+class SlowQueryViewSet(viewsets.ViewSet):
+    """
+    Viewset that provides `GET` method with the latest slow
+    and repeated queries. Allows filtering by `kind`.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def list(self, request):
+        entries = slow_queries.get_backend().get()
+        kind = request.query_params.get('kind')
+        if kind:
+            entries = [entry for entry in entries if entry['kind'] == kind]
+        return Response(entries)
+
+
+def metrics(request):
+    """ Expose request metrics of all workers in Prometheus text format. """
+
+    if settings.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get('Authorization', ''),
+            f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        metrics_registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+def get_calendar_etag(request, token):
+    query = CalendarQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return None
+    return ical.get_etag(token, **query.validated_data)
+
+
+@require_safe
+@condition(etag_func=get_calendar_etag)
+def calendar_feed(request, token):
+    """
+    Stream the due dates of the tasks of the user of the token in
+    iCalendar format. Allows limiting them by `date_from` and `date_to`.
+
+    Streaming needs a sync (WSGI) worker. Django 3.2 iterates streamed
+    responses in the event loop under ASGI, where reading the batches
+    would block it, so there the feed is rendered whole in the thread of
+    the view.
+    """
+    query = CalendarQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=400)
+    user = ical.get_user(token)
+    if user is None:
+        raise Http404
+    batches = ical.read_batches(
+        ical.get_tasks(user, **query.validated_data),
+        settings.CALENDAR_FEED_BATCH_SIZE,
+    )
+    content_type = 'text/calendar; charset=utf-8'
+    if isinstance(request, ASGIRequest):
+        response = HttpResponse(b''.join(ical.render(batches)), content_type=content_type)
+    else:
+        response = StreamingHttpResponse(ical.render(batches), content_type=content_type)
+    # Apps have to ask again every time, answered by the ETag.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,15 +1,62 @@
-from django.contrib import admin
-
-from .models import Category, CustomUser, Task, Subtask
-
-
-class CategoryAdmin(admin.ModelAdmin):
+from django.contrib import admin, messages
+from django.db.models import Count
+
+from . import deletion, history
+from .models import (
+    Category,
+    CustomUser,
+    DeletionJob,
+    Task,
+    TaskTemplate,
+    Subtask,
+)
+
+
+class BackgroundDeletionMixin:
+    """ Hide deleted objects at once and delete their dependents in the background. """
+
+    def get_deleted_objects(self, objs, request):
+        # Collecting every dependent row for the confirmation page takes as
+        # long as the deletion itself.
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return (
+            [str(obj) for obj in objs],
+            {self.opts.verbose_name_plural: len(objs)},
+            perms_needed,
+            [],
+        )
+
+    def delete_model(self, request, obj):
+        deletion.schedule(obj, requested_by=request.user)
+        self.message_user(
+            request,
+            f'«{obj}» скрыт и будет удален в фоне.',
+            messages.INFO,
+        )
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            deletion.schedule(obj, requested_by=request.user)
+
+
+class RecordedChangesMixin:
+    """ Record the changes saved in the admin in the task history. """
+
+    def save_model(self, request, obj, form, change):
+        with history.recording(request.user):
+            super().save_model(request, obj, form, change)
+
+
+class CategoryAdmin(BackgroundDeletionMixin, admin.ModelAdmin):
     """ Category admin model. """
 
     list_display = (
         'id',
         'name',
         'get_tasks_count',
+        'deleted_at',
     )
     list_editable = (
         'name',
@@ -18,22 +65,26 @@ class CategoryAdmin(admin.ModelAdmin):
         'name',
     )
 
-    @admin.display(description='Tasks count')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(tasks_count=Count('tasks'))
+
+    @admin.display(description='Tasks count', ordering='tasks_count')
     def get_tasks_count(self, obj):
-        return obj.tasks.count()
+        return obj.tasks_count
 
 
-class CustomUserAdmin(admin.ModelAdmin):
+class CustomUserAdmin(BackgroundDeletionMixin, admin.ModelAdmin):
     """ CustomUser admin model. """
 
     list_display = (
         'id',
         'username',
         'email',
+        'deleted_at',
     )
 
 
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(RecordedChangesMixin, BackgroundDeletionMixin, admin.ModelAdmin):
     """ Task admin model. """
 
     list_display = (
@@ -45,6 +96,7 @@ class TaskAdmin(admin.ModelAdmin):
         'creator',
         'priority',
         'is_completed',
+        'get_subtasks_progress',
     )
     list_editable = (
         'title',
@@ -62,8 +114,38 @@ class TaskAdmin(admin.ModelAdmin):
         'creator__username',
     )
 
+    @admin.display(description='Subtasks', ordering='subtasks_completed')
+    def get_subtasks_progress(self, obj):
+        return f'{obj.subtasks_completed}/{obj.subtasks_total}'
+
 
-class SubtaskAdmin(admin.ModelAdmin):
+class TaskTemplateAdmin(admin.ModelAdmin):
+    """ TaskTemplate admin model. """
+
+    list_display = (
+        'id',
+        'title',
+        'frequency',
+        'interval',
+        'starts_at',
+        'generated_until',
+        'creator',
+        'is_active',
+    )
+    list_editable = (
+        'is_active',
+    )
+    list_filter = (
+        'frequency',
+        'is_active',
+    )
+    search_fields = (
+        'title',
+        'creator__username',
+    )
+
+
+class SubtaskAdmin(RecordedChangesMixin, admin.ModelAdmin):
     """ Subtask admin model. """
 
     list_display = (
@@ -84,7 +166,47 @@ class SubtaskAdmin(admin.ModelAdmin):
     )
 
 
+class DeletionJobAdmin(admin.ModelAdmin):
+    """ DeletionJob admin model. """
+
+    list_display = (
+        'id',
+        'content_type',
+        'object_repr',
+        'status',
+        'deleted',
+        'total',
+        'get_progress',
+        'created_at',
+        'finished_at',
+    )
+    list_filter = (
+        'status',
+        'content_type',
+    )
+    readonly_fields = (
+        'content_type',
+        'object_id',
+        'object_repr',
+        'requested_by',
+        'status',
+        'total',
+        'deleted',
+        'error',
+        'finished_at',
+    )
+
+    @admin.display(description='Progress')
+    def get_progress(self, obj):
+        return f'{obj.progress:.0%}'
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Task, TaskAdmin)
+admin.site.register(TaskTemplate, TaskTemplateAdmin)
 admin.site.register(Subtask, SubtaskAdmin)
+admin.site.register(DeletionJob, DeletionJobAdmin)
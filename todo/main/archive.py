@@ -0,0 +1,118 @@
+"""
+Archival of old completed tasks.
+
+Tasks completed before the policy threshold are moved together with their
+subtasks into `ArchivedTask` and `ArchivedSubtask`, batch by batch, each
+batch in its own short transaction. Archived rows keep their ids, so they
+can be listed together with the current ones.
+"""
+import time
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import ical, sharding
+from .models import ArchivedSubtask, ArchivedTask, Subtask, Task
+
+
+TASK_FIELDS = (
+    'id',
+    'title',
+    'description',
+    'is_completed',
+    'category_id',
+    'created_at',
+    'due_date',
+    'assigned_to_id',
+    'priority',
+    'file',
+    'finish_date',
+    'creator_id',
+    'subtasks_total',
+    'subtasks_completed',
+)
+
+SUBTASK_FIELDS = (
+    'id',
+    'title',
+    'description',
+    'is_completed',
+    'parent_task_id',
+    'creator_id',
+)
+
+
+def archive_batch(before, batch_size, now):
+    """ Move the next batch of tasks finished before the date, return its size. """
+
+    with transaction.atomic(using=router.db_for_write(Task)):
+        tasks = list(
+            Task.objects.filter(is_completed=True, finish_date__lt=before)
+            .select_for_update(skip_locked=True)
+            .order_by('finish_date', 'id')
+            .values(*TASK_FIELDS)[:batch_size]
+        )
+        if not tasks:
+            return 0
+        ids = [task['id'] for task in tasks]
+        subtasks = Subtask.objects.filter(parent_task_id__in=ids)
+        ArchivedTask.objects.bulk_create(
+            ArchivedTask(archived_at=now, **task) for task in tasks
+        )
+        ArchivedSubtask.objects.bulk_create(
+            ArchivedSubtask(**subtask)
+            for subtask in subtasks.values(*SUBTASK_FIELDS)
+        )
+        # The rows are moved, not deleted: there is nothing to cascade and
+        # the completion rollups must keep counting them.
+        subtasks._raw_delete(subtasks.db)
+        moved = Task.objects.filter(id__in=ids)
+        moved._raw_delete(moved.db)
+        ical.bump(
+            *(task['creator_id'] for task in tasks),
+            *(task['assigned_to_id'] for task in tasks),
+            using=moved.db,
+        )
+    return len(tasks)
+
+
+def archive(before=None, batch_size=None, time_budget=None):
+    """
+    Archive tasks completed before the date until there are none left or
+    the time budget is spent. Return the number of archived tasks.
+    """
+    now = timezone.now()
+    before = before or now - settings.ARCHIVE_AFTER
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    deadline = time.monotonic() + (time_budget or settings.ARCHIVE_TIME_BUDGET)
+
+    archived = 0
+    for shard in sharding.get_shards():
+        with sharding.use_shard(shard):
+            while time.monotonic() < deadline:
+                moved = archive_batch(before, batch_size, now)
+                archived += moved
+                if moved < batch_size:
+                    break
+    return archived
+
+
+def get_table_stats(model):
+    """ Return row count, heap size and index size of the model's table. """
+
+    connection = connections[router.db_for_read(model)]
+    stats = {
+        'rows': model.objects.count(),
+        'table_bytes': None,
+        'index_bytes': None,
+    }
+    if connection.vendor == 'postgresql':
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_table_size(%s), pg_indexes_size(%s)',
+                [table, table],
+            )
+            stats['table_bytes'], stats['index_bytes'] = cursor.fetchone()
+    return stats
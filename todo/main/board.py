@@ -0,0 +1,96 @@
+"""
+Task board: tasks grouped by category, by priority and due date within it.
+
+The first tasks of every category and the number of them are read in one
+query per shard, numbering the tasks within their category with
+`ROW_NUMBER()`. More tasks of a category are read after the position of
+the last one shown, which stays right when tasks are added before it.
+"""
+import heapq
+import itertools
+from collections import defaultdict
+
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from . import sharding
+
+
+ORDERING = ('-priority', 'due_date', 'id')
+SORT_FIELDS = [(field.lstrip('-'), field.startswith('-')) for field in ORDERING]
+
+
+def get_position(task):
+    """ Values of the ordering of the task, `after` of the next tasks. """
+
+    return tuple(getattr(task, field) for field, _ in SORT_FIELDS)
+
+
+def number(tasks, size):
+    """ The first tasks of every category with `category_count` set, on one database. """
+
+    numbered = tasks.order_by().annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('category_id')],
+            order_by=[F('priority').desc(), F('due_date').asc(), F('id').asc()],
+        ),
+        category_count=Window(
+            Count('id'),
+            partition_by=[F('category_id')],
+        ),
+    )
+    # Window functions can't be filtered in the query computing them.
+    sql, params = numbered.query.sql_with_params()
+    return tasks.model.objects.db_manager(tasks.db).raw(
+        f'SELECT * FROM ({sql}) AS numbered WHERE position <= %s '
+        'ORDER BY category_id, position',
+        (*params, size),
+    )
+
+
+def merge(querysets, size):
+    """ The first `size` tasks of the ordered querysets of several shards. """
+
+    return list(itertools.islice(
+        heapq.merge(*querysets, key=lambda task: sharding.SortKey(task, SORT_FIELDS)),
+        size,
+    ))
+
+
+def get_columns(tasks, size):
+    """
+    Return `(columns, counts)`, the first `size` tasks of every category
+    and the number of tasks in it, by category id.
+    """
+    shards = defaultdict(list)
+    counts = defaultdict(int)
+    for queryset in sharding.split(tasks):
+        columns = defaultdict(list)
+        for task in number(queryset, size):
+            columns[task.category_id].append(task)
+        for category_id, column in columns.items():
+            shards[category_id].append(column)
+            counts[category_id] += column[0].category_count
+    columns = {
+        category_id: merge(column, size)
+        for category_id, column in shards.items()
+    }
+    return columns, dict(counts)
+
+
+def get_column(tasks, category_id, size, after=None):
+    """ Up to `size` tasks of the category following the position `after`. """
+
+    tasks = tasks.filter(category_id=category_id)
+    if after is not None:
+        priority, due_date, pk = after
+        tasks = tasks.filter(
+            Q(priority__lt=priority)
+            | Q(priority=priority, due_date__gt=due_date)
+            | Q(priority=priority, due_date=due_date, id__gt=pk)
+        )
+    return merge(
+        (queryset.order_by(*ORDERING)[:size] for queryset in sharding.split(tasks)),
+        size,
+    )
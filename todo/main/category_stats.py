@@ -0,0 +1,182 @@
+"""
+Task analytics per category.
+
+On PostgreSQL the numbers live in the `main_category_stats` materialized
+view. It is refreshed CONCURRENTLY, so readers are never blocked while it is
+recomputed. Other databases get a plain table with the same columns that is
+filled from Python, which is enough for development and tests.
+
+With sharding enabled every shard keeps the statistics of its own tasks.
+They are refreshed together and merged when read: the counts add up, and
+the median cycle time of a category with tasks on several shards is the
+median of the shard medians weighted by their completed tasks.
+"""
+import logging
+import statistics
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from . import sharding
+from .models import Category, CategoryStats, Task
+
+
+logger = logging.getLogger(__name__)
+
+REFRESH_LOCK_ID = 2034
+REFRESH_QUEUED_KEY = 'category-stats-refresh-queued'
+
+
+def get_databases():
+    """ Databases with the statistics of their own tasks. """
+
+    if sharding.is_enabled():
+        return sharding.get_shards()
+    return [router.db_for_write(CategoryStats)]
+
+
+def refresh():
+    """ Recompute the statistics, return False when a refresh is already running. """
+
+    refreshed = True
+    for alias in get_databases():
+        connection = connections[alias]
+        if connection.vendor == 'postgresql':
+            refreshed = refresh_materialized_view(connection) and refreshed
+        else:
+            refresh_table(alias)
+    return refreshed
+
+
+def refresh_materialized_view(connection):
+    # A transaction level lock works behind PgBouncer as well.
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [REFRESH_LOCK_ID])
+        if not cursor.fetchone()[0]:
+            return False
+        cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY main_category_stats')
+    return True
+
+
+def refresh_table(using):
+    now = timezone.now()
+    visible = Q(tasks__deleted_at__isnull=True)
+    counts = Category.objects.using(using).annotate(
+        open_count=Count('tasks', filter=visible & Q(tasks__is_completed=False)),
+        completed_count=Count('tasks', filter=visible & Q(tasks__is_completed=True)),
+        overdue_count=Count('tasks', filter=visible & Q(
+            tasks__is_completed=False,
+            tasks__due_date__lt=now,
+        )),
+    ).values_list('id', 'open_count', 'completed_count', 'overdue_count')
+
+    cycle_times = defaultdict(list)
+    completed = Task.objects.visible().using(using).filter(
+        is_completed=True,
+        finish_date__isnull=False,
+    ).annotate(cycle_time=ExpressionWrapper(
+        F('finish_date') - F('created_at'),
+        output_field=DurationField(),
+    )).values_list('category_id', 'cycle_time')
+    for category_id, cycle_time in completed.iterator():
+        cycle_times[category_id].append(cycle_time)
+
+    with transaction.atomic(using=using):
+        CategoryStats.objects.using(using).all().delete()
+        CategoryStats.objects.using(using).bulk_create(
+            CategoryStats(
+                category_id=category_id,
+                open_count=open_count,
+                completed_count=completed_count,
+                overdue_count=overdue_count,
+                median_cycle_time=(
+                    statistics.median(cycle_times[category_id])
+                    if cycle_times[category_id] else None
+                ),
+                refreshed_at=now,
+            )
+            for category_id, open_count, completed_count, overdue_count in counts
+        )
+
+
+def read(categories):
+    """ Statistics of the categories, merged from every shard. """
+
+    if not sharding.is_enabled():
+        return list(CategoryStats.objects.select_related('category').filter(
+            category__in=categories,
+        ))
+    categories = {category.id: category for category in categories}
+    shard_stats = defaultdict(list)
+    for alias in get_databases():
+        for stats in CategoryStats.objects.using(alias).filter(category_id__in=list(categories)):
+            shard_stats[stats.category_id].append(stats)
+    return [
+        merge(categories[category_id], shard_stats[category_id])
+        # The ordering of the model.
+        for category_id in sorted(shard_stats, reverse=True)
+    ]
+
+
+def merge(category, shard_stats):
+    return CategoryStats(
+        category=category,
+        open_count=sum(stats.open_count for stats in shard_stats),
+        completed_count=sum(stats.completed_count for stats in shard_stats),
+        overdue_count=sum(stats.overdue_count for stats in shard_stats),
+        median_cycle_time=get_weighted_median(sorted(
+            (stats.median_cycle_time, stats.completed_count)
+            for stats in shard_stats if stats.median_cycle_time is not None
+        )),
+        refreshed_at=min(stats.refreshed_at for stats in shard_stats),
+    )
+
+
+def get_weighted_median(values):
+    """ Median of `(value, weight)` pairs sorted by value, None without any. """
+
+    half = sum(weight for _, weight in values) / 2
+    total = 0
+    for value, weight in values:
+        total += weight
+        if total >= half:
+            return value
+    return None
+
+
+def get_refreshed_at():
+    """ Time of the oldest refresh of the statistics, None before the first one. """
+
+    if not sharding.is_enabled():
+        return CategoryStats.objects.values_list('refreshed_at', flat=True).first()
+    times = [
+        CategoryStats.objects.using(alias).values_list('refreshed_at', flat=True).first()
+        for alias in get_databases()
+    ]
+    return None if None in times else min(times)
+
+
+def is_stale(refreshed_at):
+    return (
+        refreshed_at is None
+        or timezone.now() - refreshed_at > settings.CATEGORY_STATS_MAX_AGE
+    )
+
+
+def request_refresh():
+    """ Queue a refresh unless one was queued recently. """
+
+    from .tasks import refresh_category_stats
+
+    timeout = settings.CATEGORY_STATS_MAX_AGE.total_seconds()
+    if not cache.add(REFRESH_QUEUED_KEY, True, timeout=timeout):
+        return
+    try:
+        refresh_category_stats.delay()
+    except OperationalError:
+        logger.warning('Category statistics refresh was not queued.', exc_info=True)
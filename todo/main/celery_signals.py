@@ -0,0 +1,100 @@
+"""
+Celery hooks storing task metrics next to the metrics of the web tier.
+"""
+import time
+from contextlib import contextmanager
+
+from celery import current_task
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+)
+
+from .metrics import Batch
+
+
+ENQUEUED_AT_HEADER = 'enqueued_at'
+
+
+@contextmanager
+def phase(name):
+    """ Measure a part of the currently running task, e.g. `phase('smtp')`. """
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request = current_task.request if current_task else None
+        batch = getattr(request, 'metrics', None)
+        if batch is not None:
+            batch.observe(
+                'celery_task_phase_duration_seconds',
+                time.perf_counter() - started,
+                task=current_task.name,
+                phase=name,
+            )
+
+
+@before_task_publish.connect
+def set_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(ENQUEUED_AT_HEADER, time.time())
+
+
+@task_prerun.connect
+def start_task(task=None, **kwargs):
+    task.request.metrics = Batch()
+    task.request.started_at = time.perf_counter()
+    # Workers put custom headers into the request itself,
+    # eagerly applied tasks keep them in `request.headers`.
+    enqueued_at = getattr(task.request, ENQUEUED_AT_HEADER, None) or (
+        task.request.headers or {}
+    ).get(ENQUEUED_AT_HEADER)
+    if enqueued_at is not None:
+        task.request.metrics.observe(
+            'celery_task_queue_latency_seconds',
+            max(time.time() - float(enqueued_at), 0),
+            task=task.name,
+        )
+
+
+@task_retry.connect
+def retry_task(sender=None, reason=None, **kwargs):
+    batch = getattr(sender.request, 'metrics', None)
+    if batch is not None:
+        # Automatic retries wrap the original exception.
+        reason = getattr(reason, 'exc', None) or reason
+        batch.inc(
+            'celery_task_retries_total',
+            task=sender.name,
+            reason=type(reason).__name__,
+        )
+
+
+@task_failure.connect
+def fail_task(sender=None, exception=None, **kwargs):
+    batch = getattr(sender.request, 'metrics', None)
+    if batch is not None:
+        batch.inc(
+            'celery_task_failures_total',
+            task=sender.name,
+            exception=type(exception).__name__,
+        )
+
+
+@task_postrun.connect
+def finish_task(task=None, state=None, **kwargs):
+    batch = getattr(task.request, 'metrics', None)
+    if batch is None:
+        return
+    batch.observe(
+        'celery_task_duration_seconds',
+        time.perf_counter() - task.request.started_at,
+        task=task.name,
+        state=state or 'UNKNOWN',
+    )
+    batch.flush()
+    task.request.metrics = None
@@ -0,0 +1,64 @@
+"""
+Completion of tasks with one conditional UPDATE.
+
+`complete()` and `reopen()` write `is_completed` only when the task is in
+the other state, completing also sets `finish_date` unless the task was
+finished before, as `Task.save()` does. Of concurrent toggles of a task
+one changes it, and none reads the row first or writes its other fields.
+The UPDATE sends no signals, so the effects of the `Task` receivers on a
+completion are made here: the rollups, the dashboard counters, the cache
+generation of the task and the history.
+"""
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import dashboard, generations, history, sharding
+from .rollups import ROLLUP_FIELDS, record_change
+
+
+def complete(tasks, task_id):
+    """ Complete the task of the queryset, see `toggle()`. """
+
+    return toggle(tasks, task_id, True)
+
+
+def reopen(tasks, task_id):
+    """ Reopen the task of the queryset, see `toggle()`. """
+
+    return toggle(tasks, task_id, False)
+
+
+def toggle(tasks, task_id, completed):
+    """
+    Set `is_completed` of the task of the queryset with the id. Return the
+    task with the rollup and dashboard fields, None if it isn't found, and
+    whether it was changed.
+    """
+    tasks = tasks.filter(pk=task_id)
+    values = {'is_completed': completed}
+    if completed:
+        values['finish_date'] = Coalesce('finish_date', Value(timezone.now()))
+    using = tasks.db
+    with sharding.atomic(using):
+        changed = tasks.filter(is_completed=not completed).update(**values)
+        # The row is locked by the UPDATE, so these are the values it wrote.
+        task = tasks.only(*ROLLUP_FIELDS, *dashboard.FIELDS).first()
+        if changed and task is not None:
+            # Reopening keeps `finish_date`, completing doesn't depend on it.
+            previous = task.get_loaded_values((*ROLLUP_FIELDS, *dashboard.FIELDS))
+            previous['is_completed'] = not completed
+            record_change(previous, task)
+            dashboard.record_change(
+                {field: previous[field] for field in dashboard.FIELDS},
+                dashboard.get_values(task),
+                using=using,
+            )
+            generations.bump(generations.key('task', task.pk), using=using)
+            history.record_changes(
+                task.pk,
+                None,
+                [('is_completed', history.to_text(not completed), history.to_text(completed))],
+                using,
+            )
+    return task, bool(changed)
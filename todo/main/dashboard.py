@@ -0,0 +1,448 @@
+"""
+Live dashboard counters of users.
+
+Every user has the numbers of the open tasks assigned to them and created
+by them, and of the open assigned tasks due today and overdue, in a Redis
+hash read with one round-trip. Saving, completing, hiding or deleting a
+task adds the difference of its contributions once its transaction
+commits.
+
+A task turns due today at the start of its day and overdue at its due
+date without being written, so these changes are put in a schedule of
+time buckets of DASHBOARD_BUCKET_SECONDS instead. `advance()` applies the
+buckets that have started and moves the watermark, the counters are the
+numbers as of its start. A change of a task that happened before the
+watermark is added to the counters at once, a later one to the schedule.
+
+Counters of a user are built from the database when read for the first
+time and rebuilt for all users by `repair()`, which also fixes a drift,
+for example after the tasks of a deleted category or user are removed by
+the background deletion. A rebuild is written only if no change of the
+user's tasks and no bucket was applied while it counted, or tried again.
+"""
+import json
+import logging
+import math
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Count, Q
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import sharding
+from .models import CustomUser, Task
+from .rollups import get_day_bounds
+from .utils import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = (
+    'assigned_open',
+    'created_open',
+    'due_today',
+    'overdue',
+)
+
+# Task fields the counters depend on.
+FIELDS = (
+    'creator',
+    'assigned_to',
+    'is_completed',
+    'due_date',
+    'deleted_at',
+)
+
+# Attempts of a rebuild disturbed by concurrent changes.
+REPAIR_ATTEMPTS = 3
+
+
+class LocalBackend:
+    """ Counters and schedule in the current process, used for development and tests. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.pending = defaultdict(dict)
+        self.schedule = defaultdict(set)
+        self.versions = defaultdict(int)
+        self.watermark = 0
+
+    def get(self, user_id):
+        with self.lock:
+            counters = self.counters.get(user_id)
+            return dict(counters) if counters is not None else None
+
+    def add(self, items):
+        with self.lock:
+            for user_id, counter, delta, bucket in items:
+                self.versions[user_id] += 1
+                counters = self.counters.get(user_id)
+                if counters is None:
+                    continue
+                if bucket <= self.watermark:
+                    counters[counter] += delta
+                else:
+                    self.put(user_id, counter, delta, bucket)
+
+    def put(self, user_id, counter, delta, bucket):
+        pending = self.pending[user_id]
+        pending[bucket, counter] = pending.get((bucket, counter), 0) + delta
+        self.schedule[bucket].add(user_id)
+
+    def advance(self, bucket):
+        with self.lock:
+            due = sorted(name for name in self.schedule if name <= bucket)
+            for name in due:
+                for user_id in self.schedule.pop(name):
+                    pending = self.pending[user_id]
+                    counters = self.counters.get(user_id)
+                    for counter in COUNTERS:
+                        delta = pending.pop((name, counter), None)
+                        if delta and counters is not None:
+                            counters[counter] += delta
+            self.watermark = max(self.watermark, bucket)
+            return len(due)
+
+    def get_state(self, user_ids):
+        with self.lock:
+            return self.watermark, [self.versions[user_id] for user_id in user_ids]
+
+    def rebuild(self, watermark, users):
+        with self.lock:
+            if watermark != self.watermark or any(
+                    user['version'] != self.versions[user['id']] for user in users
+            ):
+                return False
+            for user in users:
+                self.counters[user['id']] = dict(user['counters'])
+                self.pending[user['id']] = {}
+                for bucket, counter, delta in user['pending']:
+                    self.put(user['id'], counter, delta, bucket)
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+
+
+class RedisBackend:
+    """
+    Counters in a Redis hash per user, changes waiting for their bucket in
+    a hash per user indexed by a set of users per bucket.
+    """
+
+    # KEYS are the watermark and the buckets, ARGV the prefix and the
+    # changes by four: user, counter, delta and bucket.
+    ADD = """
+    local prefix = ARGV[1]
+    local watermark = tonumber(redis.call('GET', KEYS[1])) or 0
+    for i = 2, #ARGV, 4 do
+        local user, counter, delta, bucket = ARGV[i], ARGV[i + 1], ARGV[i + 2], ARGV[i + 3]
+        redis.call('INCR', prefix .. ':version:' .. user)
+        local counters = prefix .. ':user:' .. user
+        if redis.call('EXISTS', counters) == 1 then
+            if tonumber(bucket) <= watermark then
+                redis.call('HINCRBY', counters, counter, delta)
+            else
+                redis.call('HINCRBY', prefix .. ':pending:' .. user, bucket .. ':' .. counter, delta)
+                redis.call('SADD', prefix .. ':schedule:' .. bucket, user)
+                redis.call('ZADD', KEYS[2], bucket, bucket)
+            end
+        end
+    end
+    """
+
+    # Applies the earliest bucket up to ARGV[2] or, if there is none left,
+    # moves the watermark there. ARGV[3] and on are the counters.
+    ADVANCE = """
+    local prefix = ARGV[1]
+    local due = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[2], 'LIMIT', 0, 1)
+    if #due == 0 then
+        if tonumber(ARGV[2]) > (tonumber(redis.call('GET', KEYS[1])) or 0) then
+            redis.call('SET', KEYS[1], ARGV[2])
+        end
+        return 0
+    end
+    local bucket = due[1]
+    local schedule = prefix .. ':schedule:' .. bucket
+    for _, user in ipairs(redis.call('SMEMBERS', schedule)) do
+        local pending = prefix .. ':pending:' .. user
+        local counters = prefix .. ':user:' .. user
+        for i = 3, #ARGV do
+            local name = bucket .. ':' .. ARGV[i]
+            local delta = redis.call('HGET', pending, name)
+            if delta then
+                redis.call('HDEL', pending, name)
+                if redis.call('EXISTS', counters) == 1 then
+                    redis.call('HINCRBY', counters, ARGV[i], delta)
+                end
+            end
+        end
+    end
+    redis.call('DEL', schedule)
+    redis.call('ZREM', KEYS[2], bucket)
+    return 1
+    """
+
+    # ARGV are the prefix, the watermark the users were counted at and
+    # the users as JSON.
+    REBUILD = """
+    local prefix = ARGV[1]
+    if (tonumber(redis.call('GET', KEYS[1])) or 0) ~= tonumber(ARGV[2]) then
+        return 0
+    end
+    local users = cjson.decode(ARGV[3])
+    for _, user in ipairs(users) do
+        if (tonumber(redis.call('GET', prefix .. ':version:' .. user.id)) or 0) ~= user.version then
+            return 0
+        end
+    end
+    for _, user in ipairs(users) do
+        local counters = prefix .. ':user:' .. user.id
+        local pending = prefix .. ':pending:' .. user.id
+        for name, value in pairs(user.counters) do
+            redis.call('HSET', counters, name, value)
+        end
+        redis.call('DEL', pending)
+        for _, change in ipairs(user.pending) do
+            local bucket = change[1]
+            redis.call('HINCRBY', pending, bucket .. ':' .. change[2], change[3])
+            redis.call('SADD', prefix .. ':schedule:' .. bucket, user.id)
+            redis.call('ZADD', KEYS[2], bucket, bucket)
+        end
+    end
+    return 1
+    """
+
+    def __init__(self):
+        self.prefix = settings.DASHBOARD_REDIS_PREFIX
+        self.keys = [f'{self.prefix}:watermark', f'{self.prefix}:buckets']
+        client = get_redis()
+        self.add_script = client.register_script(self.ADD)
+        self.advance_script = client.register_script(self.ADVANCE)
+        self.rebuild_script = client.register_script(self.REBUILD)
+
+    def get(self, user_id):
+        values = get_redis().hmget(f'{self.prefix}:user:{user_id}', COUNTERS)
+        if values[0] is None:
+            return None
+        return {counter: int(value or 0) for counter, value in zip(COUNTERS, values)}
+
+    def add(self, items):
+        args = [self.prefix]
+        for item in items:
+            args += item
+        self.add_script(keys=self.keys, args=args)
+
+    def advance(self, bucket):
+        applied = 0
+        while self.advance_script(keys=self.keys, args=[self.prefix, bucket, *COUNTERS]):
+            applied += 1
+        return applied
+
+    def get_state(self, user_ids):
+        values = get_redis().mget([
+            self.keys[0],
+            *(f'{self.prefix}:version:{user_id}' for user_id in user_ids),
+        ])
+        return int(values[0] or 0), [int(value or 0) for value in values[1:]]
+
+    def rebuild(self, watermark, users):
+        return bool(self.rebuild_script(
+            keys=self.keys,
+            # Ids as strings, Lua formats large numbers in keys as floats.
+            args=[self.prefix, watermark, json.dumps([{**user, 'id': str(user['id'])} for user in users])],
+        ))
+
+    def clear(self):
+        client = get_redis()
+        for name in client.scan_iter(f'{self.prefix}:*'):
+            client.delete(name)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.DASHBOARD_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting.startswith('DASHBOARD_') or setting.startswith('REDIS_'):
+        get_backend.cache_clear()
+
+
+def get_bucket(moment):
+    """ The first bucket starting at the moment or after it. """
+
+    return math.ceil(moment.timestamp() / settings.DASHBOARD_BUCKET_SECONDS)
+
+
+def get_moment(bucket):
+    return datetime.fromtimestamp(bucket * settings.DASHBOARD_BUCKET_SECONDS, tz=timezone.utc)
+
+
+def get_values(task):
+    return {field: getattr(task, task._meta.get_field(field).attname) for field in FIELDS}
+
+
+def get_due_items(user_id, due_date, sign):
+    """ Changes of the due counters by an open task of the user over time. """
+
+    overdue_at = get_bucket(due_date)
+    return [
+        (user_id, 'due_today', sign, get_bucket(get_day_bounds(timezone.localdate(due_date)))),
+        (user_id, 'due_today', -sign, overdue_at),
+        (user_id, 'overdue', sign, overdue_at),
+    ]
+
+
+def get_items(values, sign):
+    """
+    Changes `(user_id, counter, delta, bucket)` of the counters by a task
+    with the values, bucket 0 for a change at once.
+    """
+    if values is None or values['is_completed'] or values['deleted_at'] is not None:
+        return []
+    return [
+        (values['assigned_to'], 'assigned_open', sign, 0),
+        (values['creator'], 'created_open', sign, 0),
+        *get_due_items(values['assigned_to'], values['due_date'], sign),
+    ]
+
+
+def add(items):
+    try:
+        get_backend().add(items)
+    except redis.RedisError:
+        logger.warning('Dashboard counters were not updated.', exc_info=True)
+
+
+def record_changes(changes, using=None):
+    """
+    Move the contributions of tasks from their `previous` values to the
+    `current` ones of `(previous, current)` pairs once the transaction of
+    `using` commits. The values are those of FIELDS, None for no task.
+    """
+    items = []
+    for previous, current in changes:
+        if get_items(previous, 1) != get_items(current, 1):
+            items += get_items(previous, -1) + get_items(current, 1)
+    if items:
+        transaction.on_commit(lambda: add(items), using=using)
+
+
+def record_change(previous, current, using=None):
+    record_changes([(previous, current)], using=using)
+
+
+def advance(now=None):
+    """ Apply the buckets started by now and return their number. """
+
+    return get_backend().advance(
+        math.floor((now or timezone.now()).timestamp() / settings.DASHBOARD_BUCKET_SECONDS)
+    )
+
+
+def count(user_ids, watermark):
+    """
+    Counters of the users and their scheduled changes by `(bucket,
+    counter)` as of the watermark, from the database.
+    """
+    moment = get_moment(watermark)
+    day_end = get_day_bounds(timezone.localdate(moment) + timedelta(days=1))
+    counters = {user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids}
+    pending = {user_id: defaultdict(int) for user_id in user_ids}
+    tasks = sharding.on_all_shards(Task.objects.visible().filter(is_completed=False))
+    for shard_tasks in sharding.split(tasks):
+        assigned = shard_tasks.filter(assigned_to__in=user_ids).order_by()
+        for row in assigned.values('assigned_to').annotate(
+                assigned_open=Count('id'),
+                due_today=Count('id', filter=Q(due_date__gt=moment, due_date__lt=day_end)),
+                overdue=Count('id', filter=Q(due_date__lte=moment)),
+        ):
+            for counter in ('assigned_open', 'due_today', 'overdue'):
+                counters[row['assigned_to']][counter] += row[counter]
+        created = shard_tasks.filter(creator__in=user_ids).order_by()
+        for row in created.values('creator').annotate(created_open=Count('id')):
+            counters[row['creator']]['created_open'] += row['created_open']
+        upcoming = assigned.filter(due_date__gt=moment).values_list('assigned_to', 'due_date')
+        for user_id, due_date in upcoming:
+            for _, counter, delta, bucket in get_due_items(user_id, due_date, 1):
+                if bucket > watermark:
+                    pending[user_id][bucket, counter] += delta
+    return counters, pending
+
+
+def rebuild(user_ids):
+    """ Build the counters of the users from the database and return them. """
+
+    backend = get_backend()
+    for _ in range(REPAIR_ATTEMPTS):
+        advance()
+        watermark, versions = backend.get_state(user_ids)
+        counters, pending = count(user_ids, watermark)
+        users = [
+            {
+                'id': user_id,
+                'version': version,
+                'counters': counters[user_id],
+                'pending': [
+                    [bucket, counter, delta]
+                    for (bucket, counter), delta in sorted(pending[user_id].items())
+                    if delta
+                ],
+            }
+            for user_id, version in zip(user_ids, versions)
+        ]
+        if backend.rebuild(watermark, users):
+            break
+    else:
+        logger.warning('Dashboard counters of %d users changed while rebuilt.', len(user_ids))
+    return counters
+
+
+def get_counters(user):
+    """ Counters of the user, from the database when Redis is not available. """
+
+    try:
+        counters = get_backend().get(user.pk)
+        if counters is None:
+            counters = rebuild([user.pk])[user.pk]
+    except redis.RedisError:
+        logger.warning('Dashboard counters were counted in the database.', exc_info=True)
+        now = math.floor(timezone.now().timestamp() / settings.DASHBOARD_BUCKET_SECONDS)
+        counters = count([user.pk], now)[0][user.pk]
+    # A drift until the next repair is not shown below zero.
+    return {counter: max(counters[counter], 0) for counter in COUNTERS}
+
+
+def repair(batch_size=None):
+    """ Rebuild the counters of all active users, return the number of them. """
+
+    batch_size = batch_size or settings.DASHBOARD_REPAIR_BATCH_SIZE
+    users = CustomUser.objects.filter(
+        is_active=True,
+        deleted_at__isnull=True,
+    ).order_by('id').values_list('id', flat=True)
+    repaired = 0
+    last_id = 0
+    while True:
+        user_ids = list(users.filter(id__gt=last_id)[:batch_size])
+        if not user_ids:
+            break
+        rebuild(user_ids)
+        repaired += len(user_ids)
+        last_id = user_ids[-1]
+    return repaired
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """ Raised when no connection was released within the pool timeout. """
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections of one process.
+
+    Idle connections are reused in LIFO order, checked with `is_usable`
+    when they were idle longer than `health_check_interval` and closed
+    after `max_idle` seconds without use.
+    """
+
+    def __init__(self, is_usable, reset, max_size=4, max_idle=300,
+                 health_check_interval=30, timeout=10):
+        self.is_usable = is_usable
+        self.reset = reset
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.idle = []
+        self.size = 0
+        self.closed = False
+
+    def acquire(self, connect):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                connection = self.get_idle()
+                if connection is not None:
+                    return connection
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'All {self.max_size} connections are in use.'
+                    )
+                self.condition.wait(remaining)
+        try:
+            return connect()
+        except BaseException:
+            self.forget()
+            raise
+
+    def get_idle(self):
+        while self.idle:
+            connection, released_at = self.idle.pop()
+            idle_for = time.monotonic() - released_at
+            if idle_for > self.max_idle or (
+                    idle_for > self.health_check_interval
+                    and not self.is_usable(connection)
+            ):
+                self.close(connection)
+                self.size -= 1
+                continue
+            return connection
+        return None
+
+    def release(self, connection):
+        if self.closed or not self.reset(connection):
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        self.close(connection)
+        self.forget()
+
+    def forget(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def close_all(self):
+        """ Close idle connections, connections in use are closed on release. """
+
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                connection, _ = self.idle.pop()
+                self.close(connection)
+                self.size -= 1
+
+    @staticmethod
+    def close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,151 @@
+"""
+PostgreSQL backend that keeps connections in a per-process pool.
+
+Django closes the connection at the end of every request and celery task,
+this backend returns it to the pool instead, so the TCP, TLS and auth
+handshake happens once per pooled connection. The pool is configured by
+the `POOL` key of the database settings:
+
+    'POOL': {
+        'MAX_SIZE': 4,
+        'MAX_IDLE': 300,
+        'HEALTH_CHECK_INTERVAL': 30,
+        'TIMEOUT': 10,
+        'PGBOUNCER': False,
+    }
+
+With `PGBOUNCER` enabled the backend doesn't change session state
+(time zone) and server-side cursors should be disabled, which makes it
+safe behind pgbouncer in transaction pooling mode.
+"""
+import os
+import threading
+
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+from ..pool import ConnectionPool, PoolTimeout
+
+
+Database = base.Database
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 4,
+    'MAX_IDLE': 300,
+    'HEALTH_CHECK_INTERVAL': 30,
+    'TIMEOUT': 10,
+    'PGBOUNCER': False,
+}
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def close_pools(database):
+    """ Close pooled connections to the database, e.g. before dropping it. """
+
+    with pools_lock:
+        for key in [key for key in pools if key[1] == database]:
+            pools.pop(key).close_all()
+
+
+def is_usable(connection):
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def reset(connection):
+    """ Return the connection into a clean state or report it as broken. """
+
+    if connection.closed:
+        return False
+    try:
+        status = connection.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    creation_class = DatabaseCreation
+    pool = None
+
+    @property
+    def pool_settings(self):
+        return {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+
+    def get_pool(self, conn_params):
+        key = (
+            self.alias,
+            conn_params.get('database'),
+            conn_params.get('host'),
+            conn_params.get('port'),
+            conn_params.get('user'),
+        )
+        with pools_lock:
+            pool = pools.get(key)
+            # Connections inherited from a parent process must not be shared.
+            if pool is None or pool.pid != os.getpid():
+                options = self.pool_settings
+                pool = pools[key] = ConnectionPool(
+                    is_usable=is_usable,
+                    reset=reset,
+                    max_size=options['MAX_SIZE'],
+                    max_idle=options['MAX_IDLE'],
+                    health_check_interval=options['HEALTH_CHECK_INTERVAL'],
+                    timeout=options['TIMEOUT'],
+                )
+            return pool
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        try:
+            connection = pool.acquire(
+                lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+            )
+        except PoolTimeout as error:
+            raise Database.OperationalError(str(error)) from error
+        self.pool = pool
+
+        # A reused connection keeps the isolation level it was created with.
+        try:
+            self.isolation_level = self.settings_dict['OPTIONS']['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        return connection
+
+    def ensure_timezone(self):
+        if self.pool_settings['PGBOUNCER']:
+            # A `SET` would stick to a server connection shared by other
+            # clients, the server default time zone is used instead.
+            return False
+        return super().ensure_timezone()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.pool is None or self.pool.pid != os.getpid():
+                return self.connection.close()
+            self.pool.release(self.connection)
+            self.pool = None
@@ -0,0 +1,145 @@
+"""
+Routing of sharded tasks and of reads to the replicas listed in
+REPLICA_DATABASES.
+
+Only code that opted in with `use_replica()`, the safe requests of
+ReplicaMiddleware, reads from a replica; everything else, writes and
+celery tasks included, works with the primary. A replica is chosen once
+per request among those lagging behind the primary by no more than
+REPLICA_MAX_LAG. The lag is measured at most every REPLICA_LAG_CHECK_INTERVAL
+per process, an unreachable replica counts as infinitely lagging, and
+without a usable replica the request reads from the primary.
+
+With TASK_SHARDS set, tasks, subtasks and their archived copies go to
+their shard instead, see `main.sharding`. Replicas serve the models of
+the primary only.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds since the last transaction replayed from the primary. A replica
+# that has replayed everything it received isn't lagging even when the
+# primary had nothing to send for a while.
+LAG_QUERIES = {
+    'postgresql': """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(
+                EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+            )
+        END
+    """,
+}
+
+replica = ContextVar('replica', default=None)
+
+lags = {}
+lags_lock = threading.Lock()
+
+
+def measure_lag(alias):
+    """ Replication lag of the replica in seconds, infinite when it is unreachable. """
+
+    connection = connections[alias]
+    query = LAG_QUERIES.get(connection.vendor)
+    if query is None:
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        logger.warning('Replication lag of %s was not measured.', alias, exc_info=True)
+        return math.inf
+
+
+def get_lag(alias):
+    now = time.monotonic()
+    with lags_lock:
+        lag, checked_at = lags.get(alias, (None, 0))
+    if lag is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+    lag = measure_lag(alias)
+    with lags_lock:
+        lags[alias] = (lag, now)
+    return lag
+
+
+def forget_lags():
+    with lags_lock:
+        lags.clear()
+
+
+def choose_replica():
+    """ A random replica within REPLICA_MAX_LAG or None to read from the primary. """
+
+    aliases = list(settings.REPLICA_DATABASES)
+    random.shuffle(aliases)
+    for alias in aliases:
+        if get_lag(alias) <= settings.REPLICA_MAX_LAG:
+            return alias
+    return None
+
+
+@contextmanager
+def use_replica(alias):
+    """ Send reads of the current thread or coroutine to the replica. """
+
+    token = replica.set(alias)
+    try:
+        yield alias
+    finally:
+        replica.reset(token)
+
+
+class ReplicaRouter:
+    """ Reads from the replica chosen for the request, writes and migrations on the primary. """
+
+    def db_for_read(self, model, **hints):
+        return replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+class ShardRouter:
+    """ Sharded models on their shard, models of objects loaded from a shard on the primary. """
+
+    def db_for_read(self, model, **hints):
+        if not settings.TASK_SHARDS:
+            return None
+        from main import sharding
+
+        if model._meta.label_lower in sharding.SHARDED_MODELS:
+            return sharding.get_db(**hints)
+        # Without it the database of the instance in the hints, a shard,
+        # would be used for the related users and categories.
+        return replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not settings.TASK_SHARDS:
+            return None
+        from main import sharding
+
+        if model._meta.label_lower in sharding.SHARDED_MODELS:
+            return sharding.get_db(**hints)
+        return DEFAULT_DB_ALIAS
@@ -0,0 +1,41 @@
+"""
+Execute wrappers of the current request.
+
+`connection.execute_wrapper()` installs a wrapper on the connection of the
+current thread only, while a request served by an async view runs its
+queries in other threads. Wrappers installed with `execute_wrappers()`
+are kept in a context variable instead, which follows the request into
+every thread it uses, and apply to queries on all databases.
+"""
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+wrappers = ContextVar('execute_wrappers', default=())
+
+
+def execute(execute, sql, params, many, context):
+    """ Run the query through the wrappers of the context, the outermost first. """
+
+    for wrapper in reversed(wrappers.get()):
+        execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def execute_wrappers(*functions):
+    token = wrappers.set((*wrappers.get(), *functions))
+    try:
+        yield
+    finally:
+        wrappers.reset(token)
+
+
+@receiver(connection_created)
+def install(sender, connection, **kwargs):
+    if execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute)
@@ -0,0 +1,273 @@
+"""
+Background deletion of objects with many dependents.
+
+The root object is hidden at once and a `DeletionJob` is queued. The job
+walks the cascading relations leaves first and deletes the rows in small
+batches in primary key order, every batch in its own transaction. On
+PostgreSQL a batch may not wait for locks or run longer than
+DELETION_LOCK_BUDGET, a batch that hits the limit is retried at half the
+size. A single row that still hits it stops the job until the next
+scheduled run, which fails it after DELETION_MAX_BLOCKED_RUNS such runs in
+a row. The job stops when its time budget is spent and continues on the
+next run.
+
+With sharding enabled, the tasks of a deleted user or category are
+deleted on every shard, a deleted task on its own one.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, OperationalError, connections, router, transaction
+from django.db.models import CASCADE, F
+from django.db.models.deletion import ProtectedError, get_candidate_relations_to_delete
+from django.utils import timezone
+from kombu.exceptions import OperationalError as BrokerError
+
+from . import dashboard, ical, sharding
+from .models import Category, CustomUser, DeletionJob, Task
+
+
+logger = logging.getLogger(__name__)
+
+# How the root of a deletion is hidden until it is gone.
+HIDE = {
+    Category: {'deleted_at': timezone.now},
+    CustomUser: {'deleted_at': timezone.now, 'is_active': lambda: False},
+    Task: {'deleted_at': timezone.now},
+}
+
+
+def get_cascades(model):
+    return [
+        relation for relation in get_candidate_relations_to_delete(model._meta)
+        if relation.on_delete is CASCADE
+    ]
+
+
+def get_related(relation, pks):
+    """ Rows of the relation's model pointing at the given primary keys. """
+
+    return relation.related_model._base_manager.filter(
+        **{f'{relation.field.name}__in': pks}
+    )
+
+
+def get_shards(model, relation):
+    """ Shards of the related rows, all of them for rows of a model that isn't sharded. """
+
+    if (
+            sharding.is_enabled()
+            and relation.related_model._meta.label_lower in sharding.SHARDED_MODELS
+            and model._meta.label_lower not in sharding.SHARDED_MODELS
+    ):
+        return sharding.get_shards()
+    return [sharding.current.get()]
+
+
+def count(model, queryset):
+    """ Number of rows deleted together with the queryset. """
+
+    total = queryset.count()
+    for relation in get_cascades(model):
+        shards = get_shards(model, relation)
+        pks = queryset.values('pk')
+        if shards != [sharding.current.get()]:
+            # Subqueries don't cross databases.
+            pks = list(queryset.values_list('pk', flat=True))
+        for shard in shards:
+            with sharding.use_shard(shard):
+                total += count(relation.related_model, get_related(relation, pks))
+    return total
+
+
+def schedule(instance, requested_by=None):
+    """ Hide the object and queue the deletion of it with its dependents. """
+
+    model = type(instance)
+    with sharding.atomic(instance._state.db):
+        model._base_manager.using(instance._state.db).filter(pk=instance.pk).update(**{
+            field: value() for field, value in HIDE[model].items()
+        })
+        if model is Task:
+            # The hidden task leaves the calendar feeds at once.
+            ical.bump(instance.creator_id, instance.assigned_to_id, using=instance._state.db)
+            dashboard.record_change(
+                instance.get_loaded_values(dashboard.FIELDS),
+                None,
+                using=instance._state.db,
+            )
+        try:
+            with transaction.atomic():
+                job = DeletionJob.objects.create(
+                    content_type=ContentType.objects.get_for_model(model),
+                    object_id=instance.pk,
+                    object_repr=str(instance)[:200],
+                    requested_by=requested_by,
+                )
+        except IntegrityError:
+            # The deletion is already queued.
+            return DeletionJob.objects.get(
+                content_type=ContentType.objects.get_for_model(model),
+                object_id=instance.pk,
+                status__in=(DeletionJob.PENDING, DeletionJob.RUNNING),
+            )
+    if not settings.TESTING:
+        transaction.on_commit(lambda: enqueue(job.id))
+    return job
+
+
+def enqueue(job_id):
+    from .tasks import run_deletion_job
+
+    try:
+        run_deletion_job.delay(job_id)
+    except BrokerError:
+        # The scheduled run picks the job up later.
+        logger.warning('Deletion job %s was not queued.', job_id, exc_info=True)
+
+
+class Purger:
+    """ Deletes querysets leaves first in batches within a time budget. """
+
+    def __init__(self, job, deadline):
+        self.job = job
+        self.deadline = deadline
+        self.batch_size = settings.DELETION_BATCH_SIZE
+        self.budget = settings.DELETION_LOCK_BUDGET
+        self.deleted = 0
+        # The error of the row that stayed locked.
+        self.blocked = None
+
+    def purge(self, model, queryset):
+        """ Delete the queryset with its dependents, False when out of time. """
+
+        while time.monotonic() < self.deadline:
+            pks = list(
+                queryset.order_by('pk').values_list('pk', flat=True)[:self.batch_size]
+            )
+            if not pks:
+                return True
+            for relation in get_cascades(model):
+                for shard in get_shards(model, relation):
+                    with sharding.use_shard(shard):
+                        if not self.purge(relation.related_model, get_related(relation, pks)):
+                            return False
+            self.delete_batch(model, pks)
+            if self.blocked:
+                return False
+        return False
+
+    def delete_batch(self, model, pks):
+        connection = connections[router.db_for_write(model)]
+        started = time.monotonic()
+        try:
+            with transaction.atomic(using=connection.alias):
+                self.limit_locks(connection)
+                deleted, _ = model._base_manager.filter(pk__in=pks).delete()
+        except OperationalError as error:
+            if len(pks) == 1:
+                self.blocked = error
+                return
+            # Too slow or blocked, the next batch is smaller.
+            self.batch_size = max(1, len(pks) // 2)
+            return
+        duration = time.monotonic() - started
+        if duration > self.budget / 2:
+            self.batch_size = max(1, self.batch_size // 2)
+        elif duration < self.budget / 4:
+            self.batch_size = min(self.batch_size * 2, settings.DELETION_BATCH_SIZE)
+        self.deleted += deleted
+        DeletionJob.objects.filter(pk=self.job.pk).update(
+            deleted=F('deleted') + deleted,
+            blocked_runs=0,
+            updated_at=timezone.now(),
+        )
+
+    def limit_locks(self, connection):
+        if connection.vendor != 'postgresql':
+            return
+        milliseconds = int(self.budget * 1000)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET LOCAL lock_timeout = {milliseconds}')
+            cursor.execute(f'SET LOCAL statement_timeout = {milliseconds}')
+
+
+def run(job, time_budget=None):
+    """ Continue the job until it is done or the time budget is spent. """
+
+    deadline = time.monotonic() + (time_budget or settings.DELETION_TIME_BUDGET)
+    model = job.content_type.model_class()
+    root = model._base_manager.filter(pk=job.object_id)
+    shard = None
+    if model._meta.label_lower in sharding.SHARDED_MODELS:
+        shard = sharding.locate(job.object_id)
+    if job.total is None:
+        with sharding.use_shard(shard):
+            job.total = count(model, root)
+    job.status = DeletionJob.RUNNING
+    job.save(update_fields=('total', 'status', 'updated_at'))
+
+    purger = Purger(job, deadline)
+    try:
+        with sharding.use_shard(shard):
+            finished = purger.purge(model, root)
+    except (ProtectedError, OperationalError) as error:
+        logger.exception('Deletion job %s failed.', job.pk)
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.FAILED,
+            error=str(error),
+            finished_at=timezone.now(),
+        )
+        return False
+    if purger.blocked:
+        block(job, purger.blocked)
+        return False
+    if finished:
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.DONE,
+            finished_at=timezone.now(),
+        )
+    return finished
+
+
+def block(job, error):
+    """
+    Leave the job stopped by a locked row to the next scheduled run, fail
+    it when it was blocked too many runs in a row.
+    """
+    jobs = DeletionJob.objects.filter(pk=job.pk)
+    jobs.update(
+        status=DeletionJob.PENDING,
+        blocked_runs=F('blocked_runs') + 1,
+        error=str(error),
+        updated_at=timezone.now(),
+    )
+    job.refresh_from_db(fields=('blocked_runs',))
+    if job.blocked_runs >= settings.DELETION_MAX_BLOCKED_RUNS:
+        logger.error('Deletion job %s stayed blocked: %s', job.pk, error)
+        jobs.update(
+            status=DeletionJob.FAILED,
+            finished_at=timezone.now(),
+        )
+    else:
+        logger.warning('Deletion job %s is blocked by a locked row.', job.pk)
+
+
+def run_pending(time_budget=None):
+    """
+    Run the unfinished jobs nobody has worked on for a while, the least
+    recently touched first.
+    """
+    time_budget = time_budget or settings.DELETION_TIME_BUDGET
+    deadline = time.monotonic() + time_budget
+    jobs = DeletionJob.objects.filter(
+        status__in=(DeletionJob.PENDING, DeletionJob.RUNNING),
+        updated_at__lt=timezone.now() - timedelta(seconds=settings.DELETION_TIME_BUDGET),
+    ).select_related('content_type').order_by('updated_at')
+    for job in jobs:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not run(job, time_budget=remaining):
+            break
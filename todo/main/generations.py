@@ -0,0 +1,153 @@
+"""
+Generations of cached data.
+
+A value cached from database rows is stored with the generations of the
+rows it was built from and is used only while they are the same. A change
+of a row gives the row a new random generation, which invalidates every
+value built from it without finding and deleting them. A generation that
+isn't known, for example evicted, is created when it is read and makes
+the values built from the row invalid as well.
+
+Readers have to read the generations before the rows: a value built from
+rows read afterwards may be older than the generations it is stored with.
+"""
+import logging
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .utils import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+
+def key(kind, pk):
+    """ Key of the generation of a row, for example `key('task', 1)`. """
+
+    return f'generation:{kind}:{pk}'
+
+
+class LocalBackend:
+    """ Generations and values in the current process, used for development and tests. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self.lock:
+            found = {}
+            for name in keys:
+                value, expires_at = self.values.get(name, (None, 0))
+                if expires_at > now:
+                    found[name] = value
+            return found
+
+    def set_many(self, values, timeout):
+        expires_at = time.monotonic() + timeout
+        with self.lock:
+            for name, value in values.items():
+                self.values[name] = (value, expires_at)
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class RedisBackend:
+    """ Generations and values shared by all workers in Redis keys with expiry. """
+
+    def __init__(self):
+        self.prefix = settings.GENERATIONS_REDIS_PREFIX
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = get_redis().mget([f'{self.prefix}:{name}' for name in keys])
+        return {name: value for name, value in zip(keys, values) if value is not None}
+
+    def set_many(self, values, timeout):
+        pipeline = get_redis().pipeline(transaction=False)
+        for name, value in values.items():
+            pipeline.set(f'{self.prefix}:{name}', value, ex=timeout)
+        pipeline.execute()
+
+    def clear(self):
+        client = get_redis()
+        for name in client.scan_iter(f'{self.prefix}:*'):
+            client.delete(name)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.GENERATIONS_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting.startswith('GENERATIONS_') or setting.startswith('REDIS_'):
+        get_backend.cache_clear()
+
+
+def new_generations(keys):
+    return {name: uuid.uuid4().hex[:16] for name in keys}
+
+
+def read(keys, values=()):
+    """
+    Return the generations of the keys and the cached values of the
+    `values` keys found, in one round-trip. Unknown generations are
+    created. Without the backend every generation is new and no value
+    is found.
+    """
+    keys = list(dict.fromkeys(keys))
+    try:
+        found = get_backend().get_many([*keys, *values])
+    except redis.RedisError:
+        logger.warning('Generations were not read.', exc_info=True)
+        return new_generations(keys), {}
+    generations = {}
+    for name in keys:
+        generation = found.pop(name, None)
+        generations[name] = generation.decode() if isinstance(generation, bytes) else generation
+    missing = new_generations(name for name, generation in generations.items() if generation is None)
+    if missing:
+        store(missing, settings.GENERATIONS_TTL)
+        generations.update(missing)
+    return generations, found
+
+
+def store(values, timeout):
+    """ Cache the values built from rows for `timeout` seconds. """
+
+    try:
+        get_backend().set_many(values, timeout)
+    except redis.RedisError:
+        logger.warning('Cached values were not stored.', exc_info=True)
+
+
+def bump(*keys, using=None):
+    """
+    Give the rows new generations at once and again when the transaction
+    of `using` commits, as a reader may have cached the rows it could
+    still see under the first ones.
+    """
+    if not keys:
+        return
+    store(new_generations(keys), settings.GENERATIONS_TTL)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(
+            lambda: store(new_generations(keys), settings.GENERATIONS_TTL),
+            using=using,
+        )
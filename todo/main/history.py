@@ -0,0 +1,136 @@
+"""
+Change history of tasks and subtasks.
+
+Saves of tasks and subtasks made within `recording(user)`, by the API
+serializers and the admin, append a `TaskChange` per changed field. The
+rows of a save are kept until its transaction commits and dropped if it
+rolls back. The rows committed during the recording are written with one
+INSERT when it ends, or when the transaction it ends in commits.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Subtask, Task, TaskChange
+
+
+# Fields recorded per model, by name.
+FIELDS = {
+    Task: (
+        'title',
+        'description',
+        'due_date',
+        'category',
+        'assigned_to',
+        'priority',
+        'is_completed',
+        'file',
+    ),
+    Subtask: (
+        'title',
+        'description',
+        'is_completed',
+    ),
+}
+
+current = ContextVar('history_recording', default=None)
+
+
+class Recording:
+    """ Changes recorded on behalf of a user. """
+
+    def __init__(self, user):
+        self.user = user
+        self.committed = []
+        self.databases = set()
+
+    def add(self, rows, using):
+        self.databases.add(using)
+        transaction.on_commit(partial(self.committed.extend, rows), using=using)
+
+    def flush(self):
+        rows, self.committed = self.committed, []
+        if rows:
+            TaskChange.objects.bulk_create(rows)
+
+
+@contextmanager
+def recording(user):
+    """ Record the changes of tasks and subtasks saved within the block as made by the user. """
+
+    recording = Recording(user if user is not None and user.is_authenticated else None)
+    token = current.set(recording)
+    try:
+        yield recording
+    finally:
+        current.reset(token)
+        # Runs after the rows of the saves, once the transactions commit.
+        for using in recording.databases:
+            transaction.on_commit(recording.flush, using=using)
+
+
+def get_changes(instance, fields):
+    """ `(field, old, new)` of the fields changed since the instance was loaded. """
+
+    previous = instance.get_loaded_values(fields)
+    changes = []
+    for name in fields:
+        field = instance._meta.get_field(name)
+        new = getattr(instance, field.attname)
+        if previous[name] != new:
+            changes.append((name, to_text(previous[name]), to_text(new)))
+    return changes
+
+
+def to_text(value):
+    if value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def record(instance, using, update_fields=None):
+    """ Record the changes of the saved task or subtask if a recording is on. """
+
+    recording = current.get()
+    if recording is None:
+        return
+    model = type(instance)
+    fields = [
+        name for name in FIELDS[model]
+        if update_fields is None
+        or name in update_fields
+        or model._meta.get_field(name).attname in update_fields
+    ]
+    if model is Subtask:
+        task_id, subtask_id = instance.parent_task_id, instance.pk
+    else:
+        task_id, subtask_id = instance.pk, None
+    record_changes(task_id, subtask_id, get_changes(instance, fields), using)
+
+
+def record_changes(task_id, subtask_id, changes, using):
+    """ Record the `(field, old, new)` changes of a task or subtask if a recording is on. """
+
+    recording = current.get()
+    if recording is None:
+        return
+    changed_at = timezone.now()
+    rows = [
+        TaskChange(
+            task_id=task_id,
+            subtask_id=subtask_id,
+            field=field,
+            old_value=old,
+            new_value=new,
+            changed_by=recording.user,
+            changed_at=changed_at,
+        )
+        for field, old, new in changes
+    ]
+    if rows:
+        recording.add(rows, using)
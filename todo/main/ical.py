@@ -0,0 +1,216 @@
+"""
+iCalendar feed of the due dates of tasks.
+
+Calendar apps poll the feed of a user every few minutes. The feed is
+versioned by the generation of the tasks of the user, see
+`main.generations`, given a new one on every change of a task the user
+created or is assigned to. An unchanged feed is recognized by its ETag
+with the generation read alone, without the database. A changed one is
+written event by event while the tasks are read in batches.
+"""
+import hashlib
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from . import generations, sharding
+from .models import Task
+
+
+# Changed together with the content of the events.
+VERSION = 1
+
+PRODID = '-//DobroSen//Tasks//RU'
+NAME = 'Задачи DobroSen'
+
+FIELDS = ('id', 'title', 'description', 'due_date', 'created_at', 'priority')
+# Fields of a task that change the feeds of its users.
+CHANGED_FIELDS = (
+    'title',
+    'description',
+    'due_date',
+    'priority',
+    'creator',
+    'assigned_to',
+    'deleted_at',
+)
+
+# Priorities of iCalendar, 1 is the highest.
+PRIORITIES = {
+    Task.HIGH_INDEX: 1,
+    Task.MEDIUM_INDEX: 5,
+    Task.LOW_INDEX: 9,
+}
+
+TOKEN_SALT = 'main.ical.token'
+
+
+def key(user_id):
+    return generations.key('user_tasks', user_id)
+
+
+def bump(*user_ids, using=None):
+    """ Give the feeds of the users new generations, see `generations.bump()`. """
+
+    generations.bump(
+        *(key(user_id) for user_id in dict.fromkeys(user_ids) if user_id is not None),
+        using=using,
+    )
+
+
+def get_token(user):
+    """ Token of the feed of the user, changed with the password. """
+
+    digest = salted_hmac(
+        TOKEN_SALT,
+        f'{user.pk}:{user.password}',
+        algorithm='sha256',
+    ).hexdigest()
+    return f'{user.pk}-{digest[:32]}'
+
+
+def get_user_id(token):
+    """ Id of the user the token claims to be of, None when it isn't a token. """
+
+    user_id, _, digest = token.partition('-')
+    if not user_id.isdigit() or not digest:
+        return None
+    return int(user_id)
+
+
+def get_user(token):
+    """ Active user of the token, None when the token is wrong or outdated. """
+
+    user_id = get_user_id(token)
+    if user_id is None:
+        return None
+    user = get_user_model().objects.filter(
+        pk=user_id,
+        is_active=True,
+        deleted_at__isnull=True,
+    ).first()
+    if user is None or not constant_time_compare(token, get_token(user)):
+        return None
+    return user
+
+
+def get_etag(token, date_from=None, date_to=None):
+    """
+    Strong ETag of the feed, read with one cache lookup. The token is a
+    part of it, so only its holder can tell the feed is unchanged.
+    """
+    user_id = get_user_id(token)
+    if user_id is None:
+        return None
+    current, _ = generations.read([key(user_id)])
+    return hashlib.sha256(
+        f'{VERSION}:{token}:{current[key(user_id)]}:{date_from}:{date_to}'.encode()
+    ).hexdigest()[:32]
+
+
+def get_tasks(user, date_from=None, date_to=None):
+    """ Visible tasks the user created or is assigned to, due within the dates. """
+
+    tasks = Task.objects.visible().filter(Q(creator=user) | Q(assigned_to=user))
+    if date_from is not None:
+        tasks = tasks.filter(due_date__gte=start_of(date_from))
+    if date_to is not None:
+        tasks = tasks.filter(due_date__lt=start_of(date_to + timedelta(days=1)))
+    if sharding.is_enabled():
+        shards = {sharding.get_shard(user), *sharding.get_assigned_shards(user)}
+        tasks = sharding.on_shards(tasks, sorted(shards))
+    return tasks
+
+
+def start_of(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def read_batches(tasks, batch_size):
+    """ Yield rows of the tasks in batches of `batch_size` ordered by id on every shard. """
+
+    for queryset in sharding.split(tasks):
+        rows = queryset.order_by('id').values_list(*FIELDS)
+        last_id = 0
+        while True:
+            batch = list(rows.filter(id__gt=last_id)[:batch_size])
+            yield batch
+            if len(batch) < batch_size:
+                break
+            last_id = batch[-1][0]
+
+
+def render(batches):
+    """ Yield the feed with the tasks of the batches of rows, an event per task. """
+
+    yield lines(
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape(NAME)}',
+    )
+    for batch in batches:
+        if batch:
+            yield b''.join(render_event(*row) for row in batch)
+    yield lines('END:VCALENDAR')
+
+
+def render_event(pk, title, description, due_date, created_at, priority):
+    properties = [
+        'BEGIN:VEVENT',
+        f'UID:task-{pk}@dobrosen',
+        # The time the task was created keeps the feed the same while the
+        # task is, as a strong ETag requires.
+        f'DTSTAMP:{format_datetime(created_at)}',
+        f'DTSTART:{format_datetime(due_date)}',
+        f'SUMMARY:{escape(title)}',
+    ]
+    if description:
+        properties.append(f'DESCRIPTION:{escape(description)}')
+    properties += [
+        f'PRIORITY:{PRIORITIES[priority]}',
+        'END:VEVENT',
+    ]
+    return lines(*properties)
+
+
+def format_datetime(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def escape(text):
+    return (
+        text.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+        .replace('\r', '\\n')
+    )
+
+
+def lines(*content_lines):
+    """ Content lines folded at 75 octets and terminated with CRLF. """
+
+    return b''.join(fold(line.encode()) + b'\r\n' for line in content_lines)
+
+
+def fold(line):
+    parts = []
+    limit = 75
+    while len(line) > limit:
+        cut = limit
+        # A multi-byte character isn't split.
+        while line[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+        # Continuation lines start with a space.
+        limit = 74
+    parts.append(line)
+    return b'\r\n '.join(parts)
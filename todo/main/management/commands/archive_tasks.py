@@ -0,0 +1,99 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from main.archive import archive, get_table_stats
+from main.models import Task
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Move old completed tasks to the archive and report the size of the task
+    table and the latency of a task list before and after.
+
+    PostgreSQL reuses the freed space after a vacuum, the table files only
+    shrink after `VACUUM FULL` or pg_repack.
+    """
+
+    help = 'Archive completed tasks older than the policy threshold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=settings.ARCHIVE_AFTER.days,
+            help='Archive tasks finished more days ago than this.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ARCHIVE_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--time-budget',
+            type=float,
+            default=settings.ARCHIVE_TIME_BUDGET,
+            help='Seconds after which no new batch is started.',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Task list queries measured before and after.',
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 0:
+            raise CommandError('--older-than-days must not be negative.')
+        if options['batch_size'] < 1 or options['iterations'] < 1:
+            raise CommandError('--batch-size and --iterations must be positive.')
+        self.options = options
+        self.user = User.objects.annotate(
+            tasks_count=Count('assigned_tasks'),
+        ).order_by('-tasks_count').first()
+
+        self.report('Before')
+        started = time.perf_counter()
+        archived = archive(
+            before=timezone.now() - timedelta(days=options['older_than_days']),
+            batch_size=options['batch_size'],
+            time_budget=options['time_budget'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} tasks in {time.perf_counter() - started:.1f}s.'
+        ))
+        self.report('After')
+
+    def report(self, title):
+        stats = get_table_stats(Task)
+        line = f'{title}: {stats["rows"]} tasks'
+        if stats['table_bytes'] is not None:
+            line += (
+                f', table {stats["table_bytes"] // 1024} KiB'
+                f', indexes {stats["index_bytes"] // 1024} KiB'
+            )
+        if self.user is not None:
+            line += f', task list p50 {self.measure_list():.2f}ms'
+        self.stdout.write(line)
+
+    def measure_list(self):
+        """ Median time of the queries behind the first page of `/tasks/`. """
+
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        queryset = Task.objects.filter(assigned_to=self.user)
+        timings = []
+        for _ in range(self.options['iterations']):
+            started = time.perf_counter()
+            queryset.count()
+            list(queryset.prefetch_related('related_subtasks')[:page_size])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
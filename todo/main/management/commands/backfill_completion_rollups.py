@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from main import sharding
+from main.models import ArchivedTask, Task
+from main.rollups import backfill
+
+
+class Command(BaseCommand):
+    """ Rebuild the daily completion rollups from the current and archived tasks. """
+
+    help = 'Rebuild the daily completion rollups of completed tasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-from',
+            type=date.fromisoformat,
+            help='First finish day, defaults to the earliest completed task, archived ones included.',
+        )
+        parser.add_argument(
+            '--date-to',
+            type=date.fromisoformat,
+            help='Last finish day, defaults to today.',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=31,
+            help='Days rebuilt in one transaction.',
+        )
+
+    def handle(self, *args, **options):
+        date_to = options['date_to'] or timezone.localdate()
+        date_from = options['date_from']
+        if date_from is None:
+            first = min(
+                (
+                    value
+                    for model in (Task, ArchivedTask)
+                    for tasks in sharding.split(sharding.on_all_shards(
+                        model.objects.filter(is_completed=True)
+                    ))
+                    for value in tasks.aggregate(first=Min('finish_date')).values()
+                    if value is not None
+                ),
+                default=None,
+            )
+            if first is None:
+                self.stdout.write('There are no completed tasks.')
+                return
+            date_from = timezone.localdate(first)
+        if date_from > date_to:
+            raise CommandError('--date-from must not be later than --date-to.')
+        if options['days'] < 1:
+            raise CommandError('--days must be positive.')
+
+        rows = 0
+        start = date_from
+        while start <= date_to:
+            end = min(start + timedelta(days=options['days'] - 1), date_to)
+            rows += backfill(start, end)
+            self.stdout.write(f'Rebuilt {start} - {end}.')
+            start = end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows.'))
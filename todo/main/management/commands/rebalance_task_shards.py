@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import sharding
+from main.models import CustomUser
+
+
+class Command(BaseCommand):
+    """ Move the tasks of users to the shards their ids hash to. """
+
+    help = 'Move tasks of users to their shards after the list of shards changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users and rows processed in one query.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the users to be moved.',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.is_enabled():
+            raise CommandError('Sharding is disabled, set TASK_SHARDS.')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        if not options['dry_run']:
+            for alias in sharding.get_other_shards():
+                sharding.sync_references(alias, batch_size)
+
+        users = 0
+        tasks = 0
+        after = 0
+        while True:
+            batch = list(
+                CustomUser.objects.filter(pk__gt=after)
+                .order_by('pk')
+                .only('pk', 'task_shard')[:batch_size]
+            )
+            if not batch:
+                break
+            after = batch[-1].pk
+            for user in batch:
+                source = sharding.get_shard(user)
+                target = sharding.choose_shard(user.pk)
+                if source == target:
+                    continue
+                users += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'User {user.pk}: {source} -> {target}.')
+                if not options['dry_run']:
+                    tasks += sharding.move(user, source, target)
+
+        fixed = 0
+        if not options['dry_run']:
+            # Tasks created before the sharding have no assignments yet.
+            for alias in sharding.get_shards():
+                fixed += sharding.sync_assignments(alias, batch_size)
+        if options['dry_run']:
+            message = f'Found {users} users to move.'
+        else:
+            message = f'Moved {tasks} tasks of {users} users. Fixed {fixed} assignments.'
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import sharding
+from main.progress import repair_batch
+
+
+class Command(BaseCommand):
+    """ Verify the subtask counters of the tasks and rebuild the wrong ones. """
+
+    help = 'Verify and rebuild the denormalized subtask counters of tasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Tasks verified in one transaction.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the tasks with wrong counters.',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        checked = 0
+        wrong = []
+        for shard in sharding.get_shards():
+            after = 0
+            with sharding.use_shard(shard):
+                while True:
+                    ids, batch_wrong = repair_batch(
+                        after,
+                        options['batch_size'],
+                        dry_run=options['dry_run'],
+                    )
+                    if not ids:
+                        break
+                    checked += len(ids)
+                    wrong += batch_wrong
+                    after = ids[-1]
+
+        if wrong and options['verbosity'] > 1:
+            self.stdout.write(f'Wrong counters: {", ".join(map(str, wrong))}.')
+        action = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} tasks. {action} {len(wrong)} with wrong counters.'
+        ))
@@ -0,0 +1,214 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main.models import Category, Task, Subtask
+from main.utils import disabled_auto_now_add
+
+
+User = get_user_model()
+
+DISTRIBUTIONS = ('uniform', 'pareto')
+
+
+class Command(BaseCommand):
+    """ Fill the database with a realistic volume of generated data. """
+
+    help = 'Generate users, categories, tasks and subtasks for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--tasks', type=int, default=10000)
+        parser.add_argument(
+            '--subtasks-per-task',
+            type=float,
+            default=2.0,
+            help='Average amount of subtasks for every task.',
+        )
+        parser.add_argument(
+            '--distribution',
+            choices=DISTRIBUTIONS,
+            default='pareto',
+            help='How tasks are spread between users and categories.',
+        )
+        parser.add_argument('--completed-ratio', type=float, default=0.6)
+        parser.add_argument('--overdue-ratio', type=float, default=0.2)
+        parser.add_argument(
+            '--self-assigned-ratio',
+            type=float,
+            default=0.3,
+            help='Share of tasks assigned to their creator.',
+        )
+        parser.add_argument(
+            '--history-days',
+            type=int,
+            default=365,
+            help='How far in the past tasks may be created.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        for name in ('completed_ratio', 'overdue_ratio', 'self_assigned_ratio'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be between 0 and 1.')
+        if options['users'] < 1 or options['categories'] < 1:
+            raise CommandError('At least one user and one category are required.')
+
+        self.random = random.Random(options['seed'])
+        self.options = options
+        self.now = timezone.now()
+
+        users = self.create_users()
+        categories = self.create_categories()
+        tasks_count, subtasks_count = self.create_tasks(users, categories)
+        # Bulk inserts skip `Task.save` and `Subtask.save`, so the rollups
+        # and the subtask counters are built at once.
+        call_command('backfill_completion_rollups', stdout=self.stdout)
+        call_command('repair_subtask_counters', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(users)} users, {len(categories)} categories, '
+            f'{tasks_count} tasks and {subtasks_count} subtasks.'
+        ))
+
+    def weights(self, amount):
+        if self.options['distribution'] == 'uniform':
+            return [1] * amount
+        return [self.random.paretovariate(1.16) for _ in range(amount)]
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password('password')
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'{prefix}_user_{index}',
+                    email=f'{prefix}_user_{index}@example.com',
+                    password=password,
+                )
+                for index in range(self.options['users'])
+            ],
+            batch_size=self.options['batch_size'],
+            ignore_conflicts=True,
+        )
+        return list(
+            User.objects.filter(
+                username__startswith=f'{prefix}_user_'
+            ).order_by('id').values_list('id', flat=True)[:self.options['users']]
+        )
+
+    def create_categories(self):
+        categories = Category.objects.bulk_create(
+            [
+                Category(name=f'{self.options["prefix"]} category {index}')
+                for index in range(self.options['categories'])
+            ],
+            batch_size=self.options['batch_size'],
+        )
+        if categories and categories[0].pk is None:
+            return self.last_ids(Category, len(categories))
+        return [category.pk for category in categories]
+
+    def create_tasks(self, users, categories):
+        user_weights = self.weights(len(users))
+        category_weights = self.weights(len(categories))
+        batch_size = self.options['batch_size']
+        created_tasks = created_subtasks = 0
+
+        with disabled_auto_now_add(Task, 'created_at'):
+            while created_tasks < self.options['tasks']:
+                amount = min(batch_size, self.options['tasks'] - created_tasks)
+                creators = self.random.choices(users, user_weights, k=amount)
+                assignees = self.random.choices(users, user_weights, k=amount)
+                task_categories = self.random.choices(
+                    categories, category_weights, k=amount
+                )
+                with transaction.atomic():
+                    tasks = Task.objects.bulk_create(
+                        [
+                            self.build_task(creator, assignee, category)
+                            for creator, assignee, category in zip(
+                                creators, assignees, task_categories
+                            )
+                        ],
+                        batch_size=batch_size,
+                    )
+                    created_subtasks += self.create_subtasks(tasks)
+                created_tasks += amount
+                self.stdout.write(f'Tasks: {created_tasks}/{self.options["tasks"]}')
+        return created_tasks, created_subtasks
+
+    def build_task(self, creator, assignee, category):
+        if self.random.random() < self.options['self_assigned_ratio']:
+            assignee = creator
+        created_at = self.now - timedelta(
+            seconds=self.random.randint(0, self.options['history_days'] * 86400)
+        )
+        due_date = created_at + timedelta(hours=self.random.randint(1, 24 * 30))
+        is_completed = self.random.random() < self.options['completed_ratio']
+        finish_date = None
+        if is_completed:
+            overdue = self.random.random() < self.options['overdue_ratio']
+            finish_date = due_date + timedelta(
+                hours=self.random.randint(1, 24 * 7) * (1 if overdue else -1)
+            )
+            finish_date = min(max(finish_date, created_at), self.now)
+        return Task(
+            title=f'Task {self.random.randint(1, 10 ** 6)}',
+            description='Generated by seed_data.',
+            category_id=category,
+            creator_id=creator,
+            assigned_to_id=assignee,
+            priority=self.random.choices(
+                [choice for choice, _ in Task.PRIORITY_CHOICES],
+                weights=(5, 3, 2),
+            )[0],
+            created_at=created_at,
+            due_date=due_date,
+            is_completed=is_completed,
+            finish_date=finish_date,
+        )
+
+    def create_subtasks(self, tasks):
+        task_ids = [task.pk for task in tasks]
+        if task_ids and task_ids[0] is None:
+            task_ids = self.last_ids(Task, len(tasks))
+        average = self.options['subtasks_per_task']
+        subtasks = []
+        for task, task_id in zip(tasks, task_ids):
+            amount = int(self.random.expovariate(1 / average)) if average else 0
+            subtasks.extend(
+                Subtask(
+                    title=f'Subtask {index}',
+                    parent_task_id=task_id,
+                    creator_id=task.creator_id,
+                    is_completed=task.is_completed or self.random.random() < 0.5,
+                )
+                for index in range(amount)
+            )
+        Subtask.objects.bulk_create(
+            subtasks,
+            batch_size=self.options['batch_size'],
+        )
+        return len(subtasks)
+
+    @staticmethod
+    def last_ids(model, amount):
+        """
+        Backends that can't return ids from a bulk insert (SQLite) get
+        them back by reading the newest rows, the command is the only writer.
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('Bulk insert did not return primary keys.')
+        return list(reversed(
+            model.objects.order_by('-pk').values_list('pk', flat=True)[:amount]
+        ))
@@ -12,3 +12,26 @@ NOTIFICATION_EMAIL = """
 С Уважением,
 Команда проекта.
 """
+
+
+DUE_SOON_REMINDER_EMAIL = """
+Вы получили это письмо, потому что срок выполнения Ваших задач скоро истекает.
+
+{0}
+
+С Уважением,
+Команда проекта.
+"""
+
+
+OVERDUE_REMINDER_EMAIL = """
+Вы получили это письмо, потому что срок выполнения Ваших задач истек.
+
+{0}
+
+С Уважением,
+Команда проекта.
+"""
+
+
+REMINDER_TASK_LINE = '* {0} (категория: {1}) — завершить до {2};'
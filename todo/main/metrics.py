@@ -0,0 +1,247 @@
+"""
+Process independent metrics in Prometheus text format.
+
+Every sample is stored as a plain counter so that several gunicorn or celery
+processes can add to the same series. Histograms keep non-cumulative bucket
+counters, they are accumulated only when the metrics are rendered.
+"""
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .utils import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+SEPARATOR = '\t'
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'),
+)
+
+METRICS = {}
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels):
+    return _format_labels(tuple(sorted(labels.items())))
+
+
+@lru_cache(maxsize=4096)
+def _format_labels(items):
+    return ','.join(
+        '{0}="{1}"'.format(
+            key,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for key, value in items
+    )
+
+
+def format_series(name, labels, value):
+    if labels:
+        return f'{name}{{{labels}}} {format_number(value)}'
+    return f'{name} {format_number(value)}'
+
+
+def register(name, kind, description, buckets=None):
+    METRICS[name] = {
+        'kind': kind,
+        'description': description,
+        'buckets': [
+            (bucket, format_number(bucket)) for bucket in buckets or ()
+        ],
+    }
+
+
+register(
+    'http_requests_total',
+    COUNTER,
+    'Handled requests per view and action.',
+)
+register(
+    'http_request_duration_seconds',
+    HISTOGRAM,
+    'Request latency per view and action.',
+    LATENCY_BUCKETS,
+)
+register(
+    'http_db_queries_total',
+    COUNTER,
+    'Database queries executed while handling requests.',
+)
+register(
+    'http_db_duration_seconds_total',
+    COUNTER,
+    'Time spent in database queries while handling requests.',
+)
+register(
+    'http_response_size_bytes_total',
+    COUNTER,
+    'Size of response bodies.',
+)
+register(
+    'metrics_overhead_seconds_total',
+    COUNTER,
+    'Time spent collecting and storing the request metrics.',
+)
+register(
+    'celery_task_queue_latency_seconds',
+    HISTOGRAM,
+    'Time between publishing a task and the start of its execution.',
+    LATENCY_BUCKETS,
+)
+register(
+    'celery_task_duration_seconds',
+    HISTOGRAM,
+    'Task run time per task and final state.',
+    LATENCY_BUCKETS,
+)
+register(
+    'celery_task_phase_duration_seconds',
+    HISTOGRAM,
+    'Task run time split by phase, e.g. database and SMTP.',
+    LATENCY_BUCKETS,
+)
+register(
+    'celery_task_retries_total',
+    COUNTER,
+    'Task retries per reason.',
+)
+register(
+    'celery_task_failures_total',
+    COUNTER,
+    'Failed tasks per exception.',
+)
+
+
+class Batch:
+    """ Samples collected during one request or task and stored at once. """
+
+    def __init__(self):
+        self.samples = defaultdict(float)
+
+    def inc(self, name, value=1, **labels):
+        self.samples[SEPARATOR.join((name, format_labels(labels), ''))] += value
+
+    def observe(self, name, value, **labels):
+        key = format_labels(labels)
+        for bucket, bucket_name in METRICS[name]['buckets']:
+            if value <= bucket:
+                break
+        self.samples[SEPARATOR.join((name, key, bucket_name))] += 1
+        self.samples[SEPARATOR.join((name + '_sum', key, ''))] += value
+        self.samples[SEPARATOR.join((name + '_count', key, ''))] += 1
+
+    def flush(self):
+        if not self.samples:
+            return
+        try:
+            get_backend().add(self.samples)
+        except redis.RedisError:
+            logger.warning('Metrics were not stored.', exc_info=True)
+        self.samples = defaultdict(float)
+
+
+class LocalBackend:
+    """ Keep the metrics in the current process, used for development and tests. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(float)
+
+    def add(self, samples):
+        with self.lock:
+            for key, value in samples.items():
+                self.samples[key] += value
+
+    def get(self):
+        with self.lock:
+            return dict(self.samples)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+
+class RedisBackend:
+    """ Share the metrics between processes in a single Redis hash. """
+
+    def __init__(self):
+        self.key = settings.METRICS_REDIS_KEY
+
+    def add(self, samples):
+        pipeline = get_redis().pipeline(transaction=False)
+        for key, value in samples.items():
+            pipeline.hincrbyfloat(self.key, key, value)
+        pipeline.execute()
+
+    def get(self):
+        return {
+            key.decode(): float(value)
+            for key, value in get_redis().hgetall(self.key).items()
+        }
+
+    def clear(self):
+        get_redis().delete(self.key)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.METRICS_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting == 'METRICS_BACKEND':
+        get_backend.cache_clear()
+
+
+def render():
+    """ Return all stored metrics in Prometheus text exposition format. """
+
+    series = defaultdict(dict)
+    for key, value in get_backend().get().items():
+        name, labels, bucket = key.split(SEPARATOR)
+        series[name][labels, bucket] = value
+
+    lines = []
+    for name, description in sorted(METRICS.items()):
+        lines.append(f'# HELP {name} {description["description"]}')
+        lines.append(f'# TYPE {name} {description["kind"]}')
+        if description['kind'] == COUNTER:
+            for (labels, _), value in sorted(series[name].items()):
+                lines.append(format_series(name, labels, value))
+            continue
+
+        label_sets = sorted({labels for labels, _ in series[name]})
+        for labels in label_sets:
+            total = 0
+            for _, bucket_name in description['buckets']:
+                total += series[name].get((labels, bucket_name), 0)
+                bucket_labels = ','.join(
+                    filter(None, (labels, f'le="{bucket_name}"'))
+                )
+                lines.append(format_series(name + '_bucket', bucket_labels, total))
+            for suffix in ('_sum', '_count'):
+                value = series[name + suffix].get((labels, ''), 0)
+                lines.append(format_series(name + suffix, labels, value))
+    return '\n'.join(lines) + '\n'
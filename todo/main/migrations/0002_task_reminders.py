@@ -0,0 +1,35 @@
+# Generated by Django 3.2 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='subtask',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='due_soon_reminded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='overdue_reminded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('due_soon_reminded_at__isnull', True), ('is_completed', False)), fields=['due_date', 'id'], name='task_due_soon_reminder_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('is_completed', False), ('overdue_reminded_at__isnull', True)), fields=['due_date', 'id'], name='task_overdue_reminder_idx'),
+        ),
+    ]
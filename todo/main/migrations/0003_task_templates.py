@@ -0,0 +1,62 @@
+# Generated by Django 3.2 on 2026-10-19 16:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_task_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=128)),
+                ('description', models.TextField(blank=True)),
+                ('priority', models.CharField(choices=[('0', 'Низкий'), ('1', 'Средний'), ('2', 'Высокий')], default='0', max_length=7)),
+                ('frequency', models.CharField(choices=[('daily', 'Ежедневно'), ('weekly', 'Еженедельно'), ('monthly', 'Ежемесячно')], default='weekly', max_length=7)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('weekdays', models.CharField(blank=True, help_text='Comma separated weekdays (0 is Monday) of weekly templates.', max_length=13)),
+                ('starts_at', models.DateTimeField(help_text='Due date of the first occurrence.')),
+                ('until', models.DateTimeField(blank=True, null=True)),
+                ('generated_until', models.DateTimeField(editable=False, help_text='Occurrences up to this moment are already created.')),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='tasktemplate',
+            name='assigned_to',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assigned_task_templates', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='tasktemplate',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_templates', to='main.category'),
+        ),
+        migrations.AddField(
+            model_name='tasktemplate',
+            name='creator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='creation_task_templates', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tasks', to='main.tasktemplate'),
+        ),
+        migrations.AddIndex(
+            model_name='tasktemplate',
+            index=models.Index(condition=models.Q(is_active=True), fields=['generated_until'], name='task_template_active_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(fields=('template', 'due_date'), name='unique_template_occurrence'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2 on 2026-10-19 16:06
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_task_templates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompletionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('overdue_count', models.PositiveIntegerField(default=0, help_text='Tasks completed after their due date.')),
+                ('cycle_time_total', models.DurationField(default=datetime.timedelta, help_text='Sum of `finish_date - created_at` of the completed tasks.')),
+                ('assigned_to', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assigned_completion_rollups', to=settings.AUTH_USER_MODEL)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completion_rollups', to='main.category')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='creation_completion_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='completionrollup',
+            index=models.Index(fields=['assigned_to', 'date'], name='rollup_assigned_to_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completionrollup',
+            index=models.Index(fields=['creator', 'date'], name='rollup_creator_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='completionrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'category', 'assigned_to', 'creator'), name='unique_completion_rollup'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 3.2 on 2026-10-19 16:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POSTGRESQL_CREATE = """
+CREATE MATERIALIZED VIEW main_category_stats AS
+SELECT
+    category.id AS category_id,
+    count(task.id) FILTER (WHERE NOT task.is_completed) AS open_count,
+    count(task.id) FILTER (WHERE task.is_completed) AS completed_count,
+    count(task.id) FILTER (
+        WHERE NOT task.is_completed AND task.due_date < now()
+    ) AS overdue_count,
+    percentile_cont(0.5) WITHIN GROUP (
+        ORDER BY task.finish_date - task.created_at
+    ) FILTER (WHERE task.is_completed) AS median_cycle_time,
+    now() AS refreshed_at
+FROM main_category category
+LEFT JOIN main_task task ON task.category_id = category.id
+GROUP BY category.id;
+
+CREATE UNIQUE INDEX main_category_stats_pk ON main_category_stats (category_id);
+"""
+
+POSTGRESQL_DROP = 'DROP MATERIALIZED VIEW main_category_stats;'
+
+# Emulation filled from Python, see `main.category_stats`.
+TABLE_CREATE = """
+CREATE TABLE main_category_stats (
+    category_id integer NOT NULL PRIMARY KEY,
+    open_count integer NOT NULL,
+    completed_count integer NOT NULL,
+    overdue_count integer NOT NULL,
+    median_cycle_time bigint NULL,
+    refreshed_at datetime NOT NULL
+);
+"""
+
+TABLE_DROP = 'DROP TABLE main_category_stats;'
+
+
+def create_category_stats(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_CREATE)
+    else:
+        schema_editor.execute(TABLE_CREATE)
+
+
+def drop_category_stats(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_DROP)
+    else:
+        schema_editor.execute(TABLE_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_completion_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='stats', serialize=False, to='main.category')),
+                ('open_count', models.IntegerField()),
+                ('completed_count', models.IntegerField()),
+                ('overdue_count', models.IntegerField(help_text='Uncompleted tasks past their due date at the refresh.')),
+                ('median_cycle_time', models.DurationField(null=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'main_category_stats',
+                'ordering': ['-category'],
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_category_stats, drop_category_stats),
+    ]
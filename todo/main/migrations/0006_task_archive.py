@@ -0,0 +1,75 @@
+# Generated by Django 3.2 on 2026-10-19 16:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_category_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSubtask',
+            fields=[
+                ('title', models.CharField(max_length=128)),
+                ('description', models.TextField(blank=True)),
+                ('is_completed', models.BooleanField(default=False)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('title', models.CharField(max_length=128)),
+                ('description', models.TextField(blank=True)),
+                ('is_completed', models.BooleanField(default=False)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('due_date', models.DateTimeField()),
+                ('priority', models.CharField(choices=[('0', 'Низкий'), ('1', 'Средний'), ('2', 'Высокий')], default='0', max_length=7)),
+                ('file', models.FileField(blank=True, null=True, upload_to='tasks/')),
+                ('finish_date', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(is_completed=True), fields=['finish_date', 'id'], name='task_archive_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='assigned_to',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_assigned_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to='main.category'),
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='creator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_creation_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedsubtask',
+            name='creator',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_creation_subtasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedsubtask',
+            name='parent_task',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_subtasks', to='main.archivedtask'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-19 16:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('main', '0006_task_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Hidden and waiting for the background deletion.', null=True),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Hidden and waiting for the background deletion.', null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Hidden and waiting for the background deletion.', null=True),
+        ),
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.BigIntegerField()),
+                ('object_repr', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], default='pending', max_length=7)),
+                ('total', models.PositiveIntegerField(blank=True, help_text='Rows to delete, counted when the job starts.', null=True)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deletion_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='deletionjob',
+            index=models.Index(condition=models.Q(status__in=('pending', 'running')), fields=['updated_at'], name='deletion_job_active_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='deletionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=('pending', 'running')), fields=('content_type', 'object_id'), name='unique_active_deletion_job'),
+        ),
+    ]
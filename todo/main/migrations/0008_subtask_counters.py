@@ -0,0 +1,60 @@
+# Generated by Django 3.2 on 2026-10-19 16:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subtasks(subtask_model, **filters):
+    return Coalesce(
+        Subquery(
+            subtask_model.objects.filter(parent_task=OuterRef('pk'), **filters)
+            .order_by()
+            .values('parent_task')
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    for task_model, subtask_model in (('Task', 'Subtask'), ('ArchivedTask', 'ArchivedSubtask')):
+        subtask_model = apps.get_model('main', subtask_model)
+        apps.get_model('main', task_model).objects.filter(
+            related_subtasks__isnull=False,
+        ).update(
+            subtasks_total=count_subtasks(subtask_model),
+            subtasks_completed=count_subtasks(subtask_model, is_completed=True),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_deletion_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedtask',
+            name='subtasks_completed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='archivedtask',
+            name='subtasks_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtasks_completed',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtasks_total',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Maintained by `main.progress` on changes of the subtasks.'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 3.2 on 2026-10-19 16:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_subtask_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedtask',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Низкий'), (1, 'Средний'), (2, 'Высокий')], default=0),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Низкий'), (1, 'Средний'), (2, 'Высокий')], default=0),
+        ),
+        migrations.AlterField(
+            model_name='tasktemplate',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Низкий'), (1, 'Средний'), (2, 'Высокий')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'created_at'], name='task_creator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'due_date'], name='task_creator_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'is_completed', 'due_date'], name='task_creator_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'priority', 'created_at'], name='task_creator_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'category', 'created_at'], name='task_creator_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'created_at'], name='task_assigned_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'due_date'], name='task_assigned_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'is_completed', 'due_date'], name='task_assigned_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'priority', 'created_at'], name='task_assigned_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'category', 'created_at'], name='task_assigned_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'assigned_to', 'created_at'], name='task_creator_assignee_idx'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='assigned_to',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='assigned_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='creator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='creation_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
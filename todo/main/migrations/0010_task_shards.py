@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-19 16:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_task_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='task_shard',
+            field=models.CharField(blank=True, editable=False, help_text='Database holding the tasks the user created, see `main.sharding`.', max_length=64),
+        ),
+        migrations.CreateModel(
+            name='TaskAssignment',
+            fields=[
+                ('task_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('shard', models.CharField(max_length=64)),
+                ('assigned_to', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='task_assignments', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taskassignment',
+            index=models.Index(fields=['assigned_to', 'shard'], name='task_assignment_shard_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-19 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_task_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deletionjob',
+            name='blocked_runs',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Runs in a row stopped by a row that stayed locked.'),
+        ),
+    ]
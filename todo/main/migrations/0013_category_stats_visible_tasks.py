@@ -0,0 +1,51 @@
+# Generated by Django 3.2 on 2026-10-19 18:09
+
+from django.db import migrations
+
+
+VIEW_CREATE = """
+CREATE MATERIALIZED VIEW main_category_stats AS
+SELECT
+    category.id AS category_id,
+    count(task.id) FILTER (WHERE NOT task.is_completed) AS open_count,
+    count(task.id) FILTER (WHERE task.is_completed) AS completed_count,
+    count(task.id) FILTER (
+        WHERE NOT task.is_completed AND task.due_date < now()
+    ) AS overdue_count,
+    percentile_cont(0.5) WITHIN GROUP (
+        ORDER BY task.finish_date - task.created_at
+    ) FILTER (WHERE task.is_completed) AS median_cycle_time,
+    now() AS refreshed_at
+FROM main_category category
+LEFT JOIN main_task task ON task.category_id = category.id{condition}
+GROUP BY category.id;
+
+CREATE UNIQUE INDEX main_category_stats_pk ON main_category_stats (category_id);
+"""
+
+VIEW_DROP = 'DROP MATERIALIZED VIEW main_category_stats;'
+
+
+def recreate_view(condition):
+    def recreate(apps, schema_editor):
+        # The table of other databases is filled from Python.
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        schema_editor.execute(VIEW_DROP)
+        schema_editor.execute(VIEW_CREATE.format(condition=condition))
+    return recreate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_deletionjob_blocked_runs'),
+    ]
+
+    operations = [
+        # Tasks hidden until their deletion don't count.
+        migrations.RunPython(
+            recreate_view(' AND task.deleted_at IS NULL'),
+            recreate_view(''),
+        ),
+    ]
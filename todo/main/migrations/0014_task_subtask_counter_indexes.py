@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-19 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_category_stats_visible_tasks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'subtasks_total', 'created_at'], name='task_creator_subtasks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'subtasks_completed', 'created_at'], name='task_creator_progress_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'subtasks_total', 'created_at'], name='task_assigned_subtasks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['assigned_to', 'subtasks_completed', 'created_at'], name='task_assigned_progress_idx'),
+        ),
+    ]
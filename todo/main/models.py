@@ -1,25 +1,109 @@
+from datetime import timedelta
+from itertools import count
+
 from django.contrib.auth.models import AbstractUser
+from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 
 from .tasks import send_notification
 
 
-class CustomUser(AbstractUser):
+class LoadedValuesMixin:
+    """ Remembers the field values loaded from the database. """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self.remember_loaded_values(fields)
+
+    def remember_loaded_values(self, fields=None):
+        """ Take the current values as loaded from the database. """
+
+        deferred_fields = self.get_deferred_fields()
+        loaded_values = getattr(self, '_loaded_values', {}) if fields else {}
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred_fields:
+                continue
+            if fields and field.name not in fields and field.attname not in fields:
+                continue
+            loaded_values[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded_values
+
+    def has_changed(self, field):
+        """ Whether the field differs from the value loaded from the database. """
+
+        loaded_values = getattr(self, '_loaded_values', {})
+        attname = self._meta.get_field(field).attname
+        if attname not in loaded_values:
+            return self._state.adding
+        return loaded_values[attname] != getattr(self, attname)
+
+    def get_changed_fields(self):
+        """ Names of the fields changed since loaded from the database or never loaded. """
+
+        loaded_values = getattr(self, '_loaded_values', {})
+        deferred_fields = self.get_deferred_fields()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.attname not in deferred_fields
+            and (
+                field.attname not in loaded_values
+                or loaded_values[field.attname] != getattr(self, field.attname)
+            )
+        ]
+
+    def get_loaded_values(self, fields):
+        """ Values loaded from the database, current values of the deferred fields. """
+
+        loaded_values = getattr(self, '_loaded_values', {})
+        values = {}
+        for field in fields:
+            attname = self._meta.get_field(field).attname
+            values[field] = loaded_values.get(attname, getattr(self, attname))
+        return values
+
+
+class CustomUser(LoadedValuesMixin, AbstractUser):
     """ Custom user model with required email field. """
 
     email = models.EmailField(unique=True, blank=False)
+    deleted_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='Hidden and waiting for the background deletion.',
+    )
+    task_shard = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text='Database holding the tasks the user created, see `main.sharding`.',
+    )
 
 
-class Category(models.Model):
+class Category(LoadedValuesMixin, models.Model):
     """ Category model. """
 
     name = models.CharField(
         max_length=128,
     )
+    deleted_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='Hidden and waiting for the background deletion.',
+    )
 
     class Meta:
         ordering = ['-id']
@@ -48,12 +132,12 @@ class AbstractTaskModel(models.Model):
         return self.title
 
 
-class Task(AbstractTaskModel):
-    """ Task model. """
+class Priority:
+    """ Priorities of tasks and task templates. """
 
-    LOW_INDEX = '0'
-    MEDIUM_INDEX = '1'
-    HIGH_INDEX = '2'
+    LOW_INDEX = 0
+    MEDIUM_INDEX = 1
+    HIGH_INDEX = 2
 
     LOW_STATUS = 'Низкий'
     MEDIUM_STATUS = 'Средний'
@@ -65,6 +149,192 @@ class Task(AbstractTaskModel):
         (HIGH_INDEX, HIGH_STATUS),
     )
 
+
+class TaskTemplate(models.Model):
+    """ Template of a task that is created again on a schedule. """
+
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+    MONTHLY = 'monthly'
+
+    FREQUENCY_CHOICES = (
+        (DAILY, 'Ежедневно'),
+        (WEEKLY, 'Еженедельно'),
+        (MONTHLY, 'Ежемесячно'),
+    )
+
+    title = models.CharField(
+        max_length=128,
+    )
+    description = models.TextField(
+        blank=True,
+    )
+    category = models.ForeignKey(
+        to=Category,
+        on_delete=models.CASCADE,
+        related_name='task_templates',
+    )
+    assigned_to = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='assigned_task_templates',
+    )
+    creator = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='creation_task_templates',
+    )
+    priority = models.PositiveSmallIntegerField(
+        choices=Priority.PRIORITY_CHOICES,
+        default=Priority.LOW_INDEX,
+    )
+    frequency = models.CharField(
+        max_length=7,
+        choices=FREQUENCY_CHOICES,
+        default=WEEKLY,
+    )
+    interval = models.PositiveSmallIntegerField(
+        default=1,
+    )
+    weekdays = models.CharField(
+        max_length=13,
+        blank=True,
+        help_text='Comma separated weekdays (0 is Monday) of weekly templates.',
+    )
+    starts_at = models.DateTimeField(
+        help_text='Due date of the first occurrence.',
+    )
+    until = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    generated_until = models.DateTimeField(
+        editable=False,
+        help_text='Occurrences up to this moment are already created.',
+    )
+    is_active = models.BooleanField(
+        default=True,
+    )
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=['generated_until'],
+                condition=Q(is_active=True),
+                name='task_template_active_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, **kwargs):
+        if self.generated_until is None:
+            self.generated_until = self.starts_at - timedelta(microseconds=1)
+        return super().save(*args, **kwargs)
+
+    def get_weekdays(self):
+        if self.weekdays:
+            return sorted({int(day) for day in self.weekdays.split(',')})
+        return [timezone.localtime(self.starts_at).weekday()]
+
+    def get_occurrences(self, after, until):
+        """ Yield due dates of occurrences in `(after, until]`. """
+
+        if self.until:
+            until = min(until, self.until)
+        starts_at = timezone.localtime(self.starts_at)
+        if self.frequency == self.DAILY:
+            dates = (
+                starts_at + timedelta(days=step * self.interval)
+                for step in count()
+            )
+        elif self.frequency == self.WEEKLY:
+            week_start = starts_at - timedelta(days=starts_at.weekday())
+            dates = (
+                week_start + timedelta(weeks=step * self.interval, days=day)
+                for step in count()
+                for day in self.get_weekdays()
+            )
+        else:
+            dates = (
+                date for date in (
+                    add_months(starts_at, step * self.interval)
+                    for step in count()
+                )
+                if date is not None
+            )
+        for date in dates:
+            if date > until:
+                return
+            if date >= self.starts_at and (after is None or date > after):
+                yield date
+
+    def build_task(self, due_date):
+        return Task(
+            title=self.title,
+            description=self.description,
+            category_id=self.category_id,
+            assigned_to_id=self.assigned_to_id,
+            creator_id=self.creator_id,
+            priority=self.priority,
+            due_date=due_date,
+            template=self,
+        )
+
+
+def add_months(date, months):
+    """ Shift the date by months, None when the day doesn't exist in that month. """
+
+    month = date.month - 1 + months
+    try:
+        return date.replace(year=date.year + month // 12, month=month % 12 + 1)
+    except ValueError:
+        return None
+
+
+class ShardedModelQuerySet(models.QuerySet):
+    """ Queryset of a sharded model, see `main.sharding`. """
+
+    def create(self, **kwargs):
+        # Unlike `QuerySet.create()`, lets the router choose the shard of
+        # the new object from its fields unless the database is given.
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
+class TaskQuerySet(ShardedModelQuerySet):
+
+    def visible(self):
+        """ Tasks that aren't waiting for the background deletion. """
+
+        return self.filter(deleted_at__isnull=True)
+
+    def on_shard_of(self, task_id):
+        """ Tasks on the shard of the task when the tasks are sharded. """
+
+        from .sharding import locate
+
+        shard = locate(task_id)
+        return self.using(shard) if shard else self
+
+
+class Task(LoadedValuesMixin, AbstractTaskModel):
+    """ Task model. """
+
+    LOW_INDEX = Priority.LOW_INDEX
+    MEDIUM_INDEX = Priority.MEDIUM_INDEX
+    HIGH_INDEX = Priority.HIGH_INDEX
+
+    LOW_STATUS = Priority.LOW_STATUS
+    MEDIUM_STATUS = Priority.MEDIUM_STATUS
+    HIGH_STATUS = Priority.HIGH_STATUS
+
+    PRIORITY_CHOICES = Priority.PRIORITY_CHOICES
+
     category = models.ForeignKey(
         to=Category,
         on_delete=models.CASCADE,
@@ -80,9 +350,10 @@ class Task(AbstractTaskModel):
         to=CustomUser,
         on_delete=models.CASCADE,
         related_name='assigned_tasks',
+        # Covered by the list indexes below.
+        db_index=False,
     )
-    priority = models.CharField(
-        max_length=7,
+    priority = models.PositiveSmallIntegerField(
         choices=PRIORITY_CHOICES,
         default=LOW_INDEX,
     )
@@ -99,18 +370,130 @@ class Task(AbstractTaskModel):
         to=CustomUser,
         on_delete=models.CASCADE,
         related_name='creation_tasks',
+        # Covered by the list indexes below.
+        db_index=False,
+    )
+    due_soon_reminded_at = models.DateTimeField(
+        blank=True,
+        null=True,
     )
+    overdue_reminded_at = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    template = models.ForeignKey(
+        to=TaskTemplate,
+        on_delete=models.SET_NULL,
+        related_name='tasks',
+        blank=True,
+        null=True,
+    )
+    subtasks_total = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text='Maintained by `main.progress` on changes of the subtasks.',
+    )
+    subtasks_completed = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    deleted_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='Hidden and waiting for the background deletion.',
+    )
+
+    objects = TaskQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['template', 'due_date'],
+                name='unique_template_occurrence',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['due_date', 'id'],
+                condition=Q(
+                    is_completed=False,
+                    due_soon_reminded_at__isnull=True,
+                ),
+                name='task_due_soon_reminder_idx',
+            ),
+            models.Index(
+                fields=['due_date', 'id'],
+                condition=Q(
+                    is_completed=False,
+                    overdue_reminded_at__isnull=True,
+                ),
+                name='task_overdue_reminder_idx',
+            ),
+            models.Index(
+                fields=['finish_date', 'id'],
+                condition=Q(is_completed=True),
+                name='task_archive_idx',
+            ),
+        ] + [
+            # Task lists are scoped by the creator or the assignee, every
+            # filter and ordering of `api.filters.TaskFilter` has an index
+            # for both.
+            models.Index(fields=[user_field, *fields], name=f'task_{name}_idx')
+            for user_field, prefix in (('creator', 'creator'), ('assigned_to', 'assigned'))
+            for name, fields in (
+                (f'{prefix}_created', ['created_at']),
+                (f'{prefix}_due', ['due_date']),
+                (f'{prefix}_open_due', ['is_completed', 'due_date']),
+                (f'{prefix}_priority', ['priority', 'created_at']),
+                (f'{prefix}_category', ['category', 'created_at']),
+                # Orderings by the subtask counters, see `main.progress`.
+                (f'{prefix}_subtasks', ['subtasks_total', 'created_at']),
+                (f'{prefix}_progress', ['subtasks_completed', 'created_at']),
+            )
+        ] + [
+            models.Index(
+                fields=['creator', 'assigned_to', 'created_at'],
+                name='task_creator_assignee_idx',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
+        from . import sharding
+        from .progress import COUNTER_FIELDS
+        from .rollups import ROLLUP_FIELDS, record_change
+
         if self.is_completed and not self.finish_date:
             self.finish_date = timezone.now()
-        return super().save(*args, **kwargs)
+        if not self._state.adding and self.has_changed('due_date'):
+            # The new deadline deserves new reminders.
+            self.due_soon_reminded_at = None
+            self.overdue_reminded_at = None
+        previous = None
+        if not self._state.adding:
+            previous = self.get_loaded_values(ROLLUP_FIELDS)
+            if kwargs.get('update_fields') is None:
+                # Only the changed fields are written, the subtask counters
+                # only by `main.progress`.
+                kwargs['update_fields'] = [
+                    name for name in self.get_changed_fields()
+                    if name not in COUNTER_FIELDS
+                ]
+        using = None
+        if sharding.is_enabled():
+            using = kwargs['using'] = kwargs.get('using') or router.db_for_write(Task, instance=self)
+            sharding.allocate_id(self, using, kwargs)
+        adding = self._state.adding
+        with sharding.atomic(using):
+            super().save(*args, **kwargs)
+            record_change(previous, self)
+            if using is not None and (adding or self.has_changed('assigned_to')):
+                sharding.record_assignment(self, adding)
+        self.remember_loaded_values(kwargs.get('update_fields'))
 
 
-class Subtask(AbstractTaskModel):
+class Subtask(LoadedValuesMixin, AbstractTaskModel):
     """ Subtask model. """
 
     parent_task = models.ForeignKey(
@@ -124,8 +507,344 @@ class Subtask(AbstractTaskModel):
         related_name='creation_subtasks',
     )
 
+    objects = ShardedModelQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-id']
+
+    def save(self, *args, **kwargs):
+        from . import sharding
+        from .progress import PROGRESS_FIELDS, record_change
+
+        previous = None
+        if not self._state.adding:
+            previous = self.get_loaded_values(PROGRESS_FIELDS)
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = self.get_changed_fields()
+        using = None
+        if sharding.is_enabled():
+            using = kwargs['using'] = kwargs.get('using') or router.db_for_write(Subtask, instance=self)
+            sharding.allocate_id(self, using, kwargs)
+        # The counters of the task are updated on the shard of the subtask.
+        with transaction.atomic(using=using), sharding.use_shard(using):
+            super().save(*args, **kwargs)
+            record_change(previous, self)
+        self.remember_loaded_values(kwargs.get('update_fields'))
+
+
+class ArchivedTask(AbstractTaskModel):
+    """ Completed task moved out of the task table, keeps the original id. """
+
+    id = models.BigIntegerField(
+        primary_key=True,
+    )
+    category = models.ForeignKey(
+        to=Category,
+        on_delete=models.CASCADE,
+        related_name='archived_tasks',
+    )
+    created_at = models.DateTimeField()
+    due_date = models.DateTimeField()
+    assigned_to = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='archived_assigned_tasks',
+    )
+    priority = models.PositiveSmallIntegerField(
+        choices=Priority.PRIORITY_CHOICES,
+        default=Priority.LOW_INDEX,
+    )
+    file = models.FileField(
+        upload_to='tasks/',
+        blank=True,
+        null=True,
+    )
+    finish_date = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+    creator = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='archived_creation_tasks',
+    )
+    subtasks_total = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    subtasks_completed = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+    archived_at = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ArchivedSubtask(AbstractTaskModel):
+    """ Subtask of an archived task. """
+
+    id = models.BigIntegerField(
+        primary_key=True,
+    )
+    parent_task = models.ForeignKey(
+        to=ArchivedTask,
+        on_delete=models.CASCADE,
+        related_name='related_subtasks',
+    )
+    creator = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='archived_creation_subtasks',
+    )
+
+    class Meta:
+        ordering = ['-id']
+
+
+class TaskAssignment(models.Model):
+    """
+    Shard and assignee of a task, kept while the tasks are sharded. Lists
+    of assigned tasks and lookups of a task by id start here.
+    """
+
+    task_id = models.BigIntegerField(
+        primary_key=True,
+    )
+    assigned_to = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='task_assignments',
+        # Covered by the index below.
+        db_index=False,
+    )
+    shard = models.CharField(
+        max_length=64,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['assigned_to', 'shard'],
+                name='task_assignment_shard_idx',
+            ),
+        ]
+
+
+class TaskChange(models.Model):
+    """
+    Change of a field of a task or of one of its subtasks, appended by
+    `main.history` and never updated. The ids aren't foreign keys: the
+    history stays on the primary database after the task is archived,
+    deleted or moved to another shard.
+    """
+
+    task_id = models.BigIntegerField()
+    subtask_id = models.BigIntegerField(
+        blank=True,
+        null=True,
+    )
+    field = models.CharField(
+        max_length=32,
+    )
+    old_value = models.TextField(
+        blank=True,
+        null=True,
+    )
+    new_value = models.TextField(
+        blank=True,
+        null=True,
+    )
+    changed_by = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        blank=True,
+        null=True,
+    )
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=['task_id', 'id'],
+                name='task_change_task_idx',
+            ),
+        ]
+
+
+class CompletionRollup(models.Model):
+    """ Completed tasks aggregated per finish day, category, assignee and creator. """
+
+    date = models.DateField()
+    category = models.ForeignKey(
+        to=Category,
+        on_delete=models.CASCADE,
+        related_name='completion_rollups',
+    )
+    assigned_to = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='assigned_completion_rollups',
+    )
+    creator = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='creation_completion_rollups',
+    )
+    completed_count = models.PositiveIntegerField(
+        default=0,
+    )
+    overdue_count = models.PositiveIntegerField(
+        default=0,
+        help_text='Tasks completed after their due date.',
+    )
+    cycle_time_total = models.DurationField(
+        default=timedelta,
+        help_text='Sum of `finish_date - created_at` of the completed tasks.',
+    )
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'category', 'assigned_to', 'creator'],
+                name='unique_completion_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['assigned_to', 'date'],
+                name='rollup_assigned_to_date_idx',
+            ),
+            models.Index(
+                fields=['creator', 'date'],
+                name='rollup_creator_date_idx',
+            ),
+        ]
+
+
+class CategoryStats(models.Model):
+    """
+    Task counts and median cycle time per category, a materialized view on
+    PostgreSQL and a plain table elsewhere. Both are filled by
+    `main.category_stats.refresh()`.
+    """
+
+    category = models.OneToOneField(
+        to=Category,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_constraint=False,
+        related_name='stats',
+    )
+    open_count = models.IntegerField()
+    completed_count = models.IntegerField()
+    overdue_count = models.IntegerField(
+        help_text='Uncompleted tasks past their due date at the refresh.',
+    )
+    median_cycle_time = models.DurationField(
+        null=True,
+    )
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'main_category_stats'
+        ordering = ['-category']
+
+
+class DeletionJob(models.Model):
+    """ Background deletion of an object and everything depending on it. """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    content_type = models.ForeignKey(
+        to=ContentType,
+        on_delete=models.CASCADE,
+    )
+    object_id = models.BigIntegerField()
+    object_repr = models.CharField(
+        max_length=200,
+    )
+    requested_by = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.SET_NULL,
+        related_name='deletion_jobs',
+        blank=True,
+        null=True,
+    )
+    status = models.CharField(
+        max_length=7,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    total = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='Rows to delete, counted when the job starts.',
+    )
+    deleted = models.PositiveIntegerField(
+        default=0,
+    )
+    error = models.TextField(
+        blank=True,
+    )
+    blocked_runs = models.PositiveSmallIntegerField(
+        default=0,
+        help_text='Runs in a row stopped by a row that stayed locked.',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+    )
+    finished_at = models.DateTimeField(
+        blank=True,
+        null=True,
+    )
+
     class Meta:
         ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_type', 'object_id'],
+                condition=Q(status__in=('pending', 'running')),
+                name='unique_active_deletion_job',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['updated_at'],
+                condition=Q(status__in=('pending', 'running')),
+                name='deletion_job_active_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.content_type.model} {self.object_repr}'
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 1.0 if self.status == self.DONE else 0.0
+        return min(self.deleted / self.total, 1.0)
 
 
 @receiver(post_save, sender=Task)
@@ -133,3 +852,123 @@ def send_task_notification(sender, instance, created, **kwargs):
     if created and not settings.TESTING:
         send_notification.delay(instance.id)
 
+
+@receiver(post_delete, sender=Task)
+def remove_task_from_rollups(sender, instance, **kwargs):
+    from .rollups import ROLLUP_FIELDS, record_change
+
+    record_change(instance.get_loaded_values(ROLLUP_FIELDS), None)
+
+
+@receiver(post_save, sender=Task)
+def update_dashboard_counters(sender, instance, created, using, **kwargs):
+    from . import dashboard
+
+    previous = None if created else instance.get_loaded_values(dashboard.FIELDS)
+    dashboard.record_change(previous, dashboard.get_values(instance), using=using)
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_from_dashboard(sender, instance, using, **kwargs):
+    from . import dashboard
+
+    dashboard.record_change(instance.get_loaded_values(dashboard.FIELDS), None, using=using)
+
+
+@receiver(post_delete, sender=Subtask)
+def remove_subtask_from_progress(sender, instance, using, **kwargs):
+    from . import sharding
+    from .progress import PROGRESS_FIELDS, record_change
+
+    with sharding.use_shard(using):
+        record_change(instance.get_loaded_values(PROGRESS_FIELDS), None)
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=ArchivedTask)
+def remove_task_assignment(sender, instance, **kwargs):
+    from . import sharding
+
+    if sharding.is_enabled():
+        TaskAssignment.objects.filter(task_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=TaskTemplate)
+def copy_to_shards(sender, instance, using, **kwargs):
+    from . import sharding
+
+    if sharding.is_enabled() and using == DEFAULT_DB_ALIAS:
+        sharding.copy_to_shards(instance)
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=TaskTemplate)
+def remove_from_shards(sender, instance, using, **kwargs):
+    from . import sharding
+
+    if sharding.is_enabled() and using == DEFAULT_DB_ALIAS:
+        sharding.remove_from_shards(instance)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def bump_task_generation(sender, instance, using, **kwargs):
+    from . import generations
+
+    generations.bump(generations.key('task', instance.pk), using=using)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def bump_calendar_generations(sender, instance, using, **kwargs):
+    from . import ical
+
+    if kwargs.get('created') is False and not any(
+            instance.has_changed(field) for field in ical.CHANGED_FIELDS
+    ):
+        return
+    # A reassigned task leaves the feeds of the previous users too.
+    previous = instance.get_loaded_values(('creator', 'assigned_to'))
+    ical.bump(
+        instance.creator_id,
+        instance.assigned_to_id,
+        *previous.values(),
+        using=using,
+    )
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Subtask)
+def record_history(sender, instance, created, using, update_fields, **kwargs):
+    from . import history
+
+    if not created:
+        history.record(instance, using, update_fields)
+
+
+@receiver(post_save, sender=Subtask)
+@receiver(post_delete, sender=Subtask)
+def bump_parent_task_generation(sender, instance, using, **kwargs):
+    from . import generations
+
+    # The subtasks and their counters are a part of the task.
+    generations.bump(generations.key('task', instance.parent_task_id), using=using)
+
+
+@receiver(post_save, sender=Category)
+def bump_category_generation(sender, instance, using, **kwargs):
+    from . import generations
+
+    if instance.has_changed('name'):
+        generations.bump(generations.key('category', instance.pk), using=using)
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_user_generation(sender, instance, using, **kwargs):
+    from . import generations
+
+    if instance.has_changed('username'):
+        generations.bump(generations.key('user', instance.pk), using=using)
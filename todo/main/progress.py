@@ -0,0 +1,124 @@
+"""
+Denormalized subtask counters of tasks.
+
+`Task.subtasks_total` and `Task.subtasks_completed` follow the subtasks:
+saving or deleting a subtask moves its contribution between tasks with
+`F()` updates in the same transaction, so the progress of a task is known
+without reading its subtasks. The `repair_subtask_counters` command verifies
+and rebuilds the counters.
+"""
+from django.db import router, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from . import generations
+from .models import Subtask, Task
+
+
+PROGRESS_FIELDS = (
+    'parent_task',
+    'is_completed',
+)
+
+COUNTER_FIELDS = (
+    'subtasks_total',
+    'subtasks_completed',
+)
+
+
+def get_contribution(values):
+    """ Return the task the subtask counts for and whether it counts as completed. """
+
+    if values is None:
+        return None
+    return values['parent_task'], int(values['is_completed'])
+
+
+def add(task_id, completed, sign):
+    tasks = Task.objects.filter(pk=task_id)
+    if sign < 0:
+        # Counters that are out of sync are left for the repair instead of
+        # going negative.
+        tasks = tasks.filter(
+            subtasks_total__gte=1,
+            subtasks_completed__gte=completed,
+        )
+    tasks.update(
+        subtasks_total=F('subtasks_total') + sign,
+        subtasks_completed=F('subtasks_completed') + sign * completed,
+    )
+
+
+def record_change(previous, subtask):
+    """
+    Move the contribution of the subtask from its `previous` values to the
+    current ones, `subtask` is None when it was deleted.
+    """
+    current = None
+    if subtask is not None:
+        current = {
+            field: getattr(subtask, subtask._meta.get_field(field).attname)
+            for field in PROGRESS_FIELDS
+        }
+    before = get_contribution(previous)
+    after = get_contribution(current)
+    if before == after:
+        return
+    if before:
+        add(*before, sign=-1)
+    if after:
+        add(*after, sign=1)
+
+
+def count_subtasks(**filters):
+    return Coalesce(
+        Subquery(
+            Subtask.objects.filter(parent_task=OuterRef('pk'), **filters)
+            .order_by()
+            .values('parent_task')
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def repair_batch(after, batch_size, dry_run=False):
+    """
+    Verify the counters of the next batch of tasks with ids above `after`
+    and rebuild the wrong ones. Return the ids of the batch and of the
+    tasks with wrong counters.
+    """
+    with transaction.atomic(using=router.db_for_write(Task)):
+        # Locked first, so the counts below see every committed subtask and
+        # concurrent changes of the subtasks wait for the batch.
+        ids = list(
+            Task.objects.filter(pk__gt=after)
+            .select_for_update()
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return ids, []
+        wrong = list(
+            Task.objects.filter(pk__in=ids)
+            .annotate(
+                actual_total=count_subtasks(),
+                actual_completed=count_subtasks(is_completed=True),
+            )
+            .filter(
+                ~Q(subtasks_total=F('actual_total'))
+                | ~Q(subtasks_completed=F('actual_completed'))
+            )
+            .values_list('pk', flat=True)
+        )
+        if wrong and not dry_run:
+            Task.objects.filter(pk__in=wrong).update(
+                subtasks_total=count_subtasks(),
+                subtasks_completed=count_subtasks(is_completed=True),
+            )
+            generations.bump(
+                *(generations.key('task', pk) for pk in wrong),
+                using=router.db_for_write(Task),
+            )
+    return ids, wrong
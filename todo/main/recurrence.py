@@ -0,0 +1,82 @@
+"""
+Materialization of recurring task templates.
+
+Every active template remembers the moment its occurrences are created up
+to. A run takes templates lagging behind the horizon in batches, creates
+their occurrences with one bulk insert per batch and moves the watermark in
+the same transaction. The unique `(template, due_date)` constraint makes a
+repeated run harmless even if a watermark was lost.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import dashboard, ical, sharding
+from .models import Task, TaskTemplate
+
+
+def generate_batch(horizon, now, batch_size):
+    """ Create occurrences of the next batch of templates and return them. """
+
+    with transaction.atomic():
+        templates = list(
+            TaskTemplate.objects.filter(
+                is_active=True,
+                generated_until__lt=horizon,
+            )
+            .select_for_update(skip_locked=True)
+            .order_by('generated_until', 'id')[:batch_size]
+        )
+        if not templates:
+            return templates
+        tasks = [
+            template.build_task(due_date)
+            for template in templates
+            # Occurrences missed while the template was paused are not
+            # worth creating anymore.
+            for due_date in template.get_occurrences(
+                max(template.generated_until, now),
+                horizon,
+            )
+        ]
+        sharding.bulk_create_tasks(tasks, ignore_conflicts=True)
+        ical.bump(
+            *(task.creator_id for task in tasks),
+            *(task.assigned_to_id for task in tasks),
+        )
+        TaskTemplate.objects.filter(
+            id__in=[template.id for template in templates],
+        ).update(generated_until=horizon)
+    return templates
+
+
+def generate_occurrences(now=None, batch_size=None):
+    """
+    Create occurrences of all templates that are due within the horizon.
+    Return ids of the created tasks.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.TASK_TEMPLATE_BATCH_SIZE
+    horizon = now + settings.TASK_TEMPLATE_HORIZON
+    started_at = timezone.now()
+
+    created = []
+    while True:
+        templates = generate_batch(horizon, now, batch_size)
+        if not templates:
+            break
+        # Rows skipped because of a conflict aren't returned by
+        # `bulk_create`, look the new ones up instead.
+        rows = list(
+            sharding.on_all_shards(Task.objects.filter(
+                template__in=templates,
+                created_at__gte=started_at,
+            )).values_list('id', *dashboard.FIELDS)
+        )
+        created.extend(row[0] for row in rows)
+        dashboard.record_changes(
+            [(None, dict(zip(dashboard.FIELDS, row[1:]))) for row in rows]
+        )
+        if len(templates) < batch_size:
+            break
+    return created
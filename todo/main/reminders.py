@@ -0,0 +1,144 @@
+"""
+Due-soon and overdue reminders for uncompleted tasks.
+
+Every kind of reminder has a partial index over uncompleted tasks that
+haven't been reminded yet, the sweep walks it in `(due_date, id)` order.
+Each batch is claimed and marked as reminded in one short transaction
+before the emails are sent, so a reminder is never sent twice. When the
+emails of a batch can't be sent, the claim is released and the next sweep
+reminds of the tasks again.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .messages import (
+    DUE_SOON_REMINDER_EMAIL,
+    OVERDUE_REMINDER_EMAIL,
+    REMINDER_TASK_LINE,
+)
+from . import sharding
+from .models import Task
+
+
+DUE_SOON = 'due_soon'
+OVERDUE = 'overdue'
+
+REMINDERS = {
+    DUE_SOON: {
+        'field': 'due_soon_reminded_at',
+        'title': 'Срок выполнения задач скоро истекает',
+        'message': DUE_SOON_REMINDER_EMAIL,
+    },
+    OVERDUE: {
+        'field': 'overdue_reminded_at',
+        'title': 'Срок выполнения задач истек',
+        'message': OVERDUE_REMINDER_EMAIL,
+    },
+}
+
+
+def get_window(kind, now):
+    """ Return the `due_date` range of tasks waiting for the reminder. """
+
+    if kind == DUE_SOON:
+        return now, now + settings.REMINDER_DUE_SOON
+    return now - settings.REMINDER_OVERDUE_LOOKBACK, now
+
+
+def claim_batch(kind, start, end, after, batch_size, now):
+    """ Mark the next batch of tasks as reminded and return them. """
+
+    field = REMINDERS[kind]['field']
+    queryset = Task.objects.visible().filter(
+        is_completed=False,
+        due_date__gte=start,
+        due_date__lt=end,
+        **{f'{field}__isnull': True},
+    )
+    if after is not None:
+        due_date, pk = after
+        queryset = queryset.filter(
+            Q(due_date__gt=due_date) | Q(due_date=due_date, id__gt=pk)
+        )
+    with transaction.atomic(using=router.db_for_write(Task)):
+        tasks = list(
+            queryset.select_for_update(skip_locked=True, of=('self',))
+            .select_related('category', 'assigned_to')
+            .order_by('due_date', 'id')[:batch_size]
+        )
+        if tasks:
+            Task.objects.filter(
+                id__in=[task.id for task in tasks],
+            ).update(**{field: now})
+    return tasks
+
+
+def release_batch(kind, tasks, now):
+    """ Unmark the tasks of a claimed batch the reminders weren't sent for. """
+
+    field = REMINDERS[kind]['field']
+    Task.objects.filter(
+        id__in=[task.id for task in tasks],
+        **{field: now},
+    ).update(**{field: None})
+
+
+def send_reminders(kind, tasks):
+    reminder = REMINDERS[kind]
+    tasks_by_assignee = defaultdict(list)
+    for task in tasks:
+        tasks_by_assignee[task.assigned_to.email].append(task)
+
+    messages = [
+        (
+            reminder['title'],
+            reminder['message'].format('\n'.join(
+                REMINDER_TASK_LINE.format(
+                    task.title,
+                    task.category,
+                    timezone.localtime(task.due_date).strftime('%Y-%m-%d %H:%M'),
+                )
+                for task in assignee_tasks
+            )),
+            settings.EMAIL_HOST_USER,
+            [email],
+        )
+        for email, assignee_tasks in tasks_by_assignee.items()
+    ]
+    return send_mass_mail(messages, fail_silently=False)
+
+
+def sweep(kind, now=None, batch_size=None, time_budget=None):
+    """
+    Send reminders of one kind batch by batch until there are no tasks
+    left or the time budget is spent. Return the number of reminded tasks.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    deadline = time.monotonic() + (time_budget or settings.REMINDER_TIME_BUDGET)
+    start, end = get_window(kind, now)
+
+    reminded = 0
+    for shard in sharding.get_shards():
+        after = None
+        with sharding.use_shard(shard):
+            while time.monotonic() < deadline:
+                tasks = claim_batch(kind, start, end, after, batch_size, now)
+                if not tasks:
+                    break
+                try:
+                    send_reminders(kind, tasks)
+                except Exception:
+                    release_batch(kind, tasks, now)
+                    raise
+                reminded += len(tasks)
+                after = tasks[-1].due_date, tasks[-1].id
+                if len(tasks) < batch_size:
+                    break
+    return reminded
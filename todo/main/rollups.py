@@ -0,0 +1,203 @@
+"""
+Daily rollups of completed tasks.
+
+A completed task adds to the row of its finish day, category, assignee and
+creator. Saving or deleting a task moves its contribution between rows in
+the same transaction, so analytics never have to read the tasks. The
+`backfill_completion_rollups` command rebuilds the rows from the tasks,
+archived ones included.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import sharding
+from .models import ArchivedTask, CompletionRollup, Task
+
+
+PERIODS = {
+    'day': F('date'),
+    'week': TruncWeek('date'),
+    'month': TruncMonth('date'),
+}
+
+KEY_FIELDS = ('date', 'category_id', 'assigned_to_id', 'creator_id')
+COUNT_FIELDS = ('completed_count', 'overdue_count', 'cycle_time_total')
+
+ROLLUP_FIELDS = (
+    'is_completed',
+    'finish_date',
+    'due_date',
+    'created_at',
+    'category',
+    'assigned_to',
+    'creator',
+)
+
+
+def get_contribution(values):
+    """ Return the rollup key of the task with its overdue flag and cycle time. """
+
+    if values is None or not values['is_completed'] or not values['finish_date']:
+        return None
+    key = (
+        timezone.localdate(values['finish_date']),
+        values['category'],
+        values['assigned_to'],
+        values['creator'],
+    )
+    return (
+        key,
+        int(values['finish_date'] > values['due_date']),
+        values['finish_date'] - values['created_at'],
+    )
+
+
+def add(key, overdue, cycle_time, sign):
+    date, category_id, assigned_to_id, creator_id = key
+    rows = CompletionRollup.objects.filter(
+        date=date,
+        category_id=category_id,
+        assigned_to_id=assigned_to_id,
+        creator_id=creator_id,
+    )
+    changes = {
+        'completed_count': F('completed_count') + sign,
+        'overdue_count': F('overdue_count') + sign * overdue,
+        'cycle_time_total': F('cycle_time_total') + sign * cycle_time,
+    }
+    if sign < 0:
+        # A row that is out of sync with the tasks is left for the backfill
+        # instead of going negative.
+        rows.filter(
+            completed_count__gte=1,
+            overdue_count__gte=overdue,
+        ).update(**changes)
+        return
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            CompletionRollup.objects.create(
+                date=date,
+                category_id=category_id,
+                assigned_to_id=assigned_to_id,
+                creator_id=creator_id,
+                completed_count=1,
+                overdue_count=overdue,
+                cycle_time_total=cycle_time,
+            )
+    except IntegrityError:
+        # Created by a concurrent transaction in the meantime.
+        rows.update(**changes)
+
+
+def record_change(previous, task):
+    """
+    Move the contribution of the task from its `previous` values to the
+    current ones, `task` is None when it was deleted.
+    """
+    current = None
+    if task is not None:
+        current = {
+            field: getattr(task, task._meta.get_field(field).attname)
+            for field in ROLLUP_FIELDS
+        }
+    before = get_contribution(previous)
+    after = get_contribution(current)
+    if before == after:
+        return
+    if before:
+        add(*before, sign=-1)
+    if after:
+        add(*after, sign=1)
+
+
+def get_day_bounds(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def get_completed_rows(model, date_from, date_to):
+    """ Rollup rows of the tasks of the model finished between the dates inclusive. """
+
+    # Tasks of a creator share a shard, so the rows of the shards never
+    # fall into the same group.
+    return sharding.on_all_shards(
+        model.objects.filter(
+            is_completed=True,
+            finish_date__gte=get_day_bounds(date_from),
+            finish_date__lt=get_day_bounds(date_to + timedelta(days=1)),
+        )
+        .annotate(date=TruncDate('finish_date'))
+        .values(*KEY_FIELDS)
+        .annotate(
+            completed_count=Count('id'),
+            overdue_count=Count('id', filter=Q(finish_date__gt=F('due_date'))),
+            cycle_time_total=Sum(ExpressionWrapper(
+                F('finish_date') - F('created_at'),
+                output_field=DurationField(),
+            )),
+        )
+        .order_by()
+    )
+
+
+def backfill(date_from, date_to):
+    """
+    Rebuild the rollups of tasks finished between the dates inclusive,
+    current and archived ones. Return the number of rollup rows.
+    """
+    with transaction.atomic():
+        CompletionRollup.objects.filter(
+            date__gte=date_from,
+            date__lte=date_to,
+        ).delete()
+        rows = {}
+        for model in (Task, ArchivedTask):
+            for row in get_completed_rows(model, date_from, date_to):
+                key = tuple(row[field] for field in KEY_FIELDS)
+                if key not in rows:
+                    rows[key] = row
+                    continue
+                # A group finished on the same day may be partly archived.
+                for field in COUNT_FIELDS:
+                    rows[key][field] += row[field]
+        rollups = CompletionRollup.objects.bulk_create(
+            CompletionRollup(**row) for row in rows.values()
+        )
+    return len(rollups)
+
+
+def get_timeline(rollups, period, date_from, date_to, group_by=(), category=None):
+    """
+    Aggregate the rollups per period starting on the returned `period`
+    date and optionally per category, assignee or creator.
+    """
+    rollups = rollups.filter(date__gte=date_from, date__lte=date_to)
+    if category is not None:
+        rollups = rollups.filter(category_id=category)
+    rows = (
+        rollups.annotate(period=PERIODS[period])
+        .values('period', *group_by)
+        .annotate(
+            completed=Sum('completed_count'),
+            overdue=Sum('overdue_count'),
+            cycle_time=Sum('cycle_time_total'),
+        )
+        .order_by('period', *group_by)
+    )
+    timeline = []
+    for row in rows:
+        completed = row['completed']
+        if not completed:
+            continue
+        cycle_time = row.pop('cycle_time')
+        timeline.append({
+            **row,
+            'overdue_rate': round(row['overdue'] / completed, 4),
+            'average_cycle_time': cycle_time / completed,
+        })
+    return timeline
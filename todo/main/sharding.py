@@ -0,0 +1,483 @@
+"""
+Horizontal sharding of tasks by their creator.
+
+With TASK_SHARDS set, the tasks a user created live on one of the listed
+databases together with their subtasks and archived copies, the first
+shard is the default database. A user is placed on their first task by
+rendezvous hashing of their id and stays on the shard until the
+`rebalance_task_shards` command moves them, so adding a shard moves only
+the users that hash to it. Users that were never placed keep their tasks
+on the default database.
+
+Every other model lives on the default database only. Users, categories
+and task templates are copied to the other shards as well, so foreign
+keys and joins of the tasks work there. `TaskAssignment` on the default
+database knows the shard of every task: lists of assigned tasks and
+lookups of a task by id start there. Tasks and subtasks on other shards
+take their ids from the sequences of the default database, so ids stay
+unique when tasks move between shards.
+"""
+import hashlib
+import heapq
+import itertools
+import operator
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import (
+    ArchivedSubtask,
+    ArchivedTask,
+    Category,
+    CustomUser,
+    Subtask,
+    Task,
+    TaskAssignment,
+    TaskTemplate,
+)
+from .utils import disabled_auto_now_add
+
+
+SHARDED_MODELS = (
+    'main.task',
+    'main.subtask',
+    'main.archivedtask',
+    'main.archivedsubtask',
+)
+
+REFERENCE_MODELS = (
+    CustomUser,
+    Category,
+    TaskTemplate,
+)
+
+current = ContextVar('shard', default=None)
+
+
+def is_enabled():
+    return bool(settings.TASK_SHARDS)
+
+
+def get_shards():
+    return list(settings.TASK_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def get_other_shards():
+    return [alias for alias in get_shards() if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def use_shard(alias):
+    """ Send queries of sharded models without an instance to the shard. """
+
+    token = current.set(alias)
+    try:
+        yield alias
+    finally:
+        current.reset(token)
+
+
+@contextmanager
+def atomic(using=None):
+    """
+    Transaction on the shard and, for a shard other than the default
+    database, one on the default database too. They commit one by one.
+    """
+    with transaction.atomic(using=using):
+        if using in (None, DEFAULT_DB_ALIAS):
+            yield
+        else:
+            with transaction.atomic():
+                yield
+
+
+def choose_shard(user_id, shards=None):
+    """ Shard with the highest hash of its alias and the user id. """
+
+    return max(
+        shards or get_shards(),
+        key=lambda alias: hashlib.md5(f'{alias}:{user_id}'.encode()).digest(),
+    )
+
+
+def get_shard(user):
+    """ Shard holding the tasks the user created. """
+
+    return user.task_shard or DEFAULT_DB_ALIAS
+
+
+def place(user):
+    """ Shard for a new task of the user, chosen with the first one. """
+
+    if user.task_shard:
+        return user.task_shard
+    shard = choose_shard(user.pk)
+    if shard != DEFAULT_DB_ALIAS and (
+            Task.objects.using(DEFAULT_DB_ALIAS).filter(creator_id=user.pk).exists()
+            or ArchivedTask.objects.using(DEFAULT_DB_ALIAS).filter(creator_id=user.pk).exists()
+    ):
+        # Tasks created before the sharding stay together until rebalanced.
+        shard = DEFAULT_DB_ALIAS
+    users = CustomUser.objects.filter(pk=user.pk)
+    if not users.filter(task_shard='').update(task_shard=shard):
+        shard = users.values_list('task_shard', flat=True).get()
+    user.task_shard = shard
+    return shard
+
+
+def locate(task_id):
+    """ Shard of the task, None when the tasks aren't sharded or it is unknown. """
+
+    if not is_enabled():
+        return None
+    return TaskAssignment.objects.filter(task_id=task_id).values_list(
+        'shard', flat=True,
+    ).first()
+
+
+def get_assigned_shards(user):
+    return list(
+        TaskAssignment.objects.filter(assigned_to=user)
+        .order_by('shard')
+        .values_list('shard', flat=True)
+        .distinct()
+    )
+
+
+def get_db(instance=None, **hints):
+    """ Database of a sharded model for the router. """
+
+    if instance is not None and instance._meta.label_lower in SHARDED_MODELS:
+        # Assigning a related object sets the database of a new one too.
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+        return get_new_shard(instance)
+    return current.get() or DEFAULT_DB_ALIAS
+
+
+def get_new_shard(instance):
+    if instance._meta.label_lower in ('main.task', 'main.archivedtask'):
+        if instance.creator_id is None:
+            return current.get() or DEFAULT_DB_ALIAS
+        return place(instance.creator)
+    # Subtasks live with their task.
+    if instance._meta.get_field('parent_task').is_cached(instance):
+        return instance.parent_task._state.db or DEFAULT_DB_ALIAS
+    return locate(instance.parent_task_id) or current.get() or DEFAULT_DB_ALIAS
+
+
+def allocate_ids(model, count):
+    """ Take ids for new rows of the model from its table on the default database. """
+
+    connection = connections[DEFAULT_DB_ALIAS]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, count],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    if connection.vendor == 'sqlite':
+        # AUTOINCREMENT continues after the largest value ever taken.
+        with transaction.atomic(using=DEFAULT_DB_ALIAS), connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s',
+                [count, table],
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) '
+                    f'SELECT %s, COALESCE(MAX(id), 0) + %s FROM {connection.ops.quote_name(table)}',
+                    [table, count],
+                )
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            last = cursor.fetchone()[0]
+        return list(range(last - count + 1, last + 1))
+    raise ImproperlyConfigured('Sharding supports PostgreSQL and SQLite only.')
+
+
+def allocate_id(instance, using, save_kwargs):
+    """ Give a new task or subtask going to another shard than the default one its id. """
+
+    if instance._state.adding and instance.pk is None and using != DEFAULT_DB_ALIAS:
+        instance.pk = allocate_ids(type(instance), 1)[0]
+        save_kwargs['force_insert'] = True
+
+
+def record_assignment(task, created):
+    values = {'assigned_to_id': task.assigned_to_id, 'shard': task._state.db}
+    if created or not TaskAssignment.objects.filter(task_id=task.pk).update(**values):
+        TaskAssignment.objects.create(task_id=task.pk, **values)
+
+
+def bulk_create_tasks(tasks, **kwargs):
+    """ `Task.objects.bulk_create()` on the shards of the creators of the tasks. """
+
+    if not is_enabled():
+        return Task.objects.bulk_create(tasks, **kwargs)
+    creators = CustomUser.objects.in_bulk({task.creator_id for task in tasks})
+    tasks_by_shard = defaultdict(list)
+    for task in tasks:
+        tasks_by_shard[place(creators[task.creator_id])].append(task)
+    for alias, shard_tasks in tasks_by_shard.items():
+        # Rows skipped because of a conflict are told apart by their ids.
+        for task, pk in zip(shard_tasks, allocate_ids(Task, len(shard_tasks))):
+            task.pk = pk
+        Task.objects.using(alias).bulk_create(shard_tasks, **kwargs)
+        TaskAssignment.objects.bulk_create(
+            [
+                TaskAssignment(task_id=pk, assigned_to_id=assigned_to_id, shard=alias)
+                for pk, assigned_to_id in Task.objects.using(alias).filter(
+                    pk__in=[task.pk for task in shard_tasks],
+                ).values_list('pk', 'assigned_to_id')
+            ],
+            ignore_conflicts=True,
+        )
+    return tasks
+
+
+def copy_to_shards(instance):
+    """ Copy a user, category or task template to the shards besides the default one. """
+
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    }
+    for alias in get_other_shards():
+        manager = model._base_manager.using(alias)
+        if not manager.filter(pk=instance.pk).update(**values):
+            manager.bulk_create([model(pk=instance.pk, **values)])
+
+
+def remove_from_shards(instance):
+    for alias in get_other_shards():
+        type(instance)._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def sync_references(alias, batch_size):
+    """ Copy all users, categories and task templates to the shard. """
+
+    for model in REFERENCE_MODELS:
+        fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        manager = model._base_manager.using(alias)
+        after = 0
+        while True:
+            objects = list(
+                model._base_manager.using(DEFAULT_DB_ALIAS)
+                .filter(pk__gt=after)
+                .order_by('pk')[:batch_size]
+            )
+            if not objects:
+                break
+            after = objects[-1].pk
+            existing = set(
+                manager.filter(pk__in=[obj.pk for obj in objects])
+                .values_list('pk', flat=True)
+            )
+            manager.bulk_create([obj for obj in objects if obj.pk not in existing])
+            manager.bulk_update([obj for obj in objects if obj.pk in existing], fields)
+
+
+def sync_assignments(alias, batch_size):
+    """ Add the missing and fix the wrong assignments of tasks on the shard, return their number. """
+
+    fixed = 0
+    for model in (Task, ArchivedTask):
+        after = 0
+        while True:
+            rows = list(
+                model._base_manager.using(alias)
+                .filter(pk__gt=after)
+                .order_by('pk')
+                .values_list('pk', 'assigned_to_id')[:batch_size]
+            )
+            if not rows:
+                break
+            after = rows[-1][0]
+            known = {
+                assignment.task_id: assignment
+                for assignment in TaskAssignment.objects.filter(
+                    task_id__in=[pk for pk, _ in rows],
+                )
+            }
+            missing = []
+            wrong = []
+            for pk, assigned_to_id in rows:
+                assignment = known.get(pk)
+                if assignment is None:
+                    missing.append(TaskAssignment(
+                        task_id=pk,
+                        assigned_to_id=assigned_to_id,
+                        shard=alias,
+                    ))
+                elif (assignment.assigned_to_id, assignment.shard) != (assigned_to_id, alias):
+                    assignment.assigned_to_id = assigned_to_id
+                    assignment.shard = alias
+                    wrong.append(assignment)
+            TaskAssignment.objects.bulk_create(missing)
+            TaskAssignment.objects.bulk_update(wrong, ['assigned_to', 'shard'])
+            fixed += len(missing) + len(wrong)
+    return fixed
+
+
+def get_user_rows(user, alias):
+    """ Tasks of the user on the shard with their subtasks, parents first. """
+
+    return [
+        (Task, Task.objects.using(alias).filter(creator=user)),
+        (Subtask, Subtask.objects.using(alias).filter(parent_task__creator=user)),
+        (ArchivedTask, ArchivedTask.objects.using(alias).filter(creator=user)),
+        (ArchivedSubtask, ArchivedSubtask.objects.using(alias).filter(parent_task__creator=user)),
+    ]
+
+
+def move(user, source, target):
+    """
+    Copy the tasks the user created with their subtasks and archived
+    copies to the target shard, place the user there and delete them from
+    the source. The tasks stay locked on the source meanwhile. Return the
+    number of moved tasks.
+    """
+    with transaction.atomic(using=source):
+        rows = [
+            (model, list(queryset.select_for_update().order_by('pk')))
+            for model, queryset in get_user_rows(user, source)
+        ]
+        with transaction.atomic(using=target), disabled_auto_now_add(Task, 'created_at'):
+            for model, objects in reversed(rows):
+                # Leftovers of an interrupted move are replaced.
+                leftovers = model._base_manager.using(target).filter(
+                    pk__in=[obj.pk for obj in objects],
+                )
+                leftovers._raw_delete(target)
+            for model, objects in rows:
+                model._base_manager.using(target).bulk_create(objects)
+        CustomUser.objects.filter(pk=user.pk).update(task_shard=target)
+        TaskAssignment.objects.filter(
+            task_id__in=[obj.pk for model, objects in rows[::2] for obj in objects],
+        ).update(shard=target)
+        for model, queryset in reversed(get_user_rows(user, source)):
+            queryset._raw_delete(source)
+    user.task_shard = target
+    return len(rows[0][1]) + len(rows[2][1])
+
+
+def on_shards(queryset, shards):
+    """ The queryset on the shards, a plain one for a single shard. """
+
+    if not shards:
+        return queryset.none()
+    if len(shards) == 1:
+        return queryset.using(shards[0])
+    return ShardedQuerySet(queryset.using(alias) for alias in shards)
+
+
+def on_all_shards(queryset):
+    if not is_enabled():
+        return queryset
+    return on_shards(queryset, get_shards())
+
+
+def split(queryset):
+    if isinstance(queryset, ShardedQuerySet):
+        return queryset.querysets
+    return [queryset]
+
+
+class SortKey:
+    """ Comparison of rows, model instances or dicts, by `(field, descending)` pairs. """
+
+    def __init__(self, row, fields):
+        self.values = [
+            (row[name] if isinstance(row, dict) else getattr(row, name), descending)
+            for name, descending in fields
+        ]
+
+    def __lt__(self, other):
+        for (value, descending), (other_value, _) in zip(self.values, other.values):
+            if value != other_value:
+                return value > other_value if descending else value < other_value
+        return False
+
+
+class ShardedQuerySet:
+    """
+    The same query on several shards. Counts and aggregates add up the
+    shards, a slice merges the ordered rows of every shard reading at most
+    up to its end from each. Iteration goes shard by shard.
+    """
+
+    ordered = True
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self.model = self.querysets[0].model
+
+    def map(self, function):
+        return ShardedQuerySet(function(queryset) for queryset in self.querysets)
+
+    def filter(self, *args, **kwargs):
+        return self.map(lambda queryset: queryset.filter(*args, **kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return self.map(lambda queryset: queryset.exclude(*args, **kwargs))
+
+    def order_by(self, *fields):
+        return self.map(lambda queryset: queryset.order_by(*fields))
+
+    def values_list(self, *fields, **kwargs):
+        return self.map(lambda queryset: queryset.values_list(*fields, **kwargs))
+
+    def get_ordering(self):
+        query = self.querysets[0].query
+        ordering = list(
+            query.order_by
+            or (self.model._meta.ordering if query.default_ordering else ())
+        )
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering.append('-id')
+        return ordering
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def aggregate(self, **aggregates):
+        """ Aggregates of the shards added up, only right for sums and counts. """
+
+        results = [queryset.aggregate(**aggregates) for queryset in self.querysets]
+        totals = {}
+        for name in aggregates:
+            values = [result[name] for result in results if result[name] is not None]
+            totals[name] = reduce(operator.add, values) if values else None
+        return totals
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.querysets)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ordering = self.get_ordering()
+        fields = [
+            (field.lstrip('-').replace('pk', 'id'), field.startswith('-'))
+            for field in ordering
+        ]
+        rows = heapq.merge(
+            *(queryset.order_by(*ordering)[:index.stop] for queryset in self.querysets),
+            key=lambda row: SortKey(row, fields),
+        )
+        return list(itertools.islice(rows, index.start, index.stop))
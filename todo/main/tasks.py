@@ -1,28 +1,157 @@
+from smtplib import SMTPException
+
 from celery import shared_task
+from celery.utils.time import get_exponential_backoff_interval
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection, send_mail
 
 from . import models
+from .celery_signals import phase
 from .messages import NOTIFICATION_EMAIL
 
 
-@shared_task
+NOTIFICATION_TITLE = 'Для Вас есть новая задача!'
+
+
+def get_notification_message(task):
+    return NOTIFICATION_EMAIL.format(
+        task.title,
+        task.category,
+        task.description,
+        task.created_at,
+        task.due_date,
+        task.get_priority_display(),
+        task.creator
+    )
+
+
+@shared_task(
+    autoretry_for=(SMTPException, ConnectionError),
+    retry_backoff=True,
+    max_retries=3,
+)
 def send_notification(task_id):
-    task = models.Task.objects.filter(id=task_id).first()
-    email_title = 'Для Вас есть новая задача!'
+    with phase('db'):
+        task = models.Task.objects.on_shard_of(task_id).select_related(
+            'category',
+            'creator',
+            'assigned_to',
+        ).filter(id=task_id).first()
     if task:
-        send_mail(
-            email_title,
-            NOTIFICATION_EMAIL.format(
-                task.title,
-                task.category,
-                task.description,
-                task.created_at,
-                task.due_date,
-                task.get_priority_display(),
-                task.creator
-            ),
-            settings.EMAIL_HOST_USER,
-            [task.assigned_to.email],
-            fail_silently=False,
+        with phase('smtp'):
+            send_mail(
+                NOTIFICATION_TITLE,
+                get_notification_message(task),
+                settings.EMAIL_HOST_USER,
+                [task.assigned_to.email],
+                fail_silently=False,
+            )
+
+
+@shared_task(bind=True, max_retries=3)
+def send_notifications(self, task_ids):
+    """
+    Notify assignees of many tasks over a single SMTP connection. When it
+    fails, only the tasks that weren't notified yet are retried.
+    """
+    from .sharding import on_all_shards
+
+    with phase('db'):
+        tasks = list(on_all_shards(models.Task.objects.select_related(
+            'category',
+            'creator',
+            'assigned_to',
+        ).filter(id__in=task_ids)).order_by('id'))
+    if tasks:
+        sent = 0
+        with phase('smtp'):
+            try:
+                with get_connection(fail_silently=False) as connection:
+                    for task in tasks:
+                        connection.send_messages([EmailMessage(
+                            NOTIFICATION_TITLE,
+                            get_notification_message(task),
+                            settings.EMAIL_HOST_USER,
+                            [task.assigned_to.email],
+                        )])
+                        sent += 1
+            except (SMTPException, ConnectionError) as exc:
+                raise self.retry(
+                    args=([task.id for task in tasks[sent:]],),
+                    exc=exc,
+                    countdown=get_exponential_backoff_interval(
+                        factor=1,
+                        retries=self.request.retries,
+                        maximum=600,
+                        full_jitter=True,
+                    ),
+                )
+
+
+@shared_task
+def send_reminders():
+    from .reminders import DUE_SOON, OVERDUE, sweep
+
+    return {kind: sweep(kind) for kind in (OVERDUE, DUE_SOON)}
+
+
+@shared_task
+def generate_recurring_tasks():
+    from .recurrence import generate_occurrences
+
+    task_ids = generate_occurrences()
+    for start in range(0, len(task_ids), settings.TASK_TEMPLATE_BATCH_SIZE):
+        send_notifications.delay(
+            task_ids[start:start + settings.TASK_TEMPLATE_BATCH_SIZE]
         )
+    return len(task_ids)
+
+
+@shared_task
+def refresh_category_stats():
+    from .category_stats import refresh
+
+    return refresh()
+
+
+@shared_task
+def archive_tasks():
+    from .archive import archive
+
+    return archive()
+
+
+@shared_task
+def run_deletion_job(job_id):
+    from .deletion import run
+
+    job = models.DeletionJob.objects.select_related('content_type').filter(
+        id=job_id,
+        status__in=(models.DeletionJob.PENDING, models.DeletionJob.RUNNING),
+    ).first()
+    if job and not run(job):
+        job.refresh_from_db(fields=('status',))
+        # A blocked job is left pending to the scheduled runs.
+        if job.status == models.DeletionJob.RUNNING:
+            run_deletion_job.delay(job_id)
+
+
+@shared_task
+def run_deletion_jobs():
+    from .deletion import run_pending
+
+    run_pending()
+
+
+@shared_task
+def advance_dashboard_counters():
+    from .dashboard import advance
+
+    return advance()
+
+
+@shared_task
+def repair_dashboard_counters():
+    from .dashboard import repair
+
+    return repair()
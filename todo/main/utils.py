@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """ Return a shared Redis client or None when Redis isn't configured. """
+
+    if not settings.REDIS_URL:
+        return None
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    )
+
+
+@contextmanager
+def disabled_auto_now_add(model, field_name):
+    """ Allow writing historical values into an `auto_now_add` field. """
+
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+@receiver(setting_changed)
+def reset_redis(setting, **kwargs):
+    if setting.startswith('REDIS_'):
+        get_redis.cache_clear()
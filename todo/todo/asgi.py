@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todo.settings')
 
+# Blocking code of async views and middleware runs in the bounded pool of
+# `api.concurrency`. The rest, Django's own sync middleware and signals,
+# shares the single sync thread of the process, so the number of threads
+# holding a database connection never grows with the number of requests.
 application = get_asgi_application()
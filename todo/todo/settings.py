@@ -1,4 +1,5 @@
 import os
+import sys
 from datetime import timedelta
 from distutils.util import strtobool
 from pathlib import Path
@@ -44,6 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.LoadSheddingMiddleware',
+    'api.middleware.ReplicaMiddleware',
+    'api.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,17 +82,66 @@ WSGI_APPLICATION = 'todo.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+DB_PGBOUNCER = bool(strtobool(os.getenv('DB_PGBOUNCER', 'False')))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'main.db.postgresql',
         'NAME': os.getenv('DB_NAME', default='pythondigest'),
         'USER': os.getenv('POSTGRES_USER', default='pythondigest'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='debug'),
         'HOST': os.getenv('DB_HOST', default='127.0.0.1'),
-        'PORT': os.getenv('DB_PORT', default=5432)
+        'PORT': os.getenv('DB_PORT', default=5432),
+        # Connections are returned to the pool at the end of every request.
+        'CONN_MAX_AGE': 0,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_SIZE', 4)),
+            'HEALTH_CHECK_INTERVAL': 30,
+            'PGBOUNCER': DB_PGBOUNCER,
+        },
     }
 }
 
+# Hot standbys of the primary with its credentials, comma separated hosts.
+DB_REPLICA_HOSTS = [
+    host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()
+]
+REPLICA_DATABASES = [f'replica_{number}' for number in range(1, len(DB_REPLICA_HOSTS) + 1)]
+for alias, host in zip(REPLICA_DATABASES, DB_REPLICA_HOSTS):
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        # Tests read their writes through the replicas.
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shards of the tasks besides the primary, comma separated hosts with
+# its credentials. See `main.sharding`.
+DB_SHARD_HOSTS = [
+    host.strip() for host in os.getenv('DB_SHARD_HOSTS', '').split(',') if host.strip()
+]
+for number, host in enumerate(DB_SHARD_HOSTS, 1):
+    DATABASES[f'shard_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'NAME': f"test_{DATABASES['default']['NAME']}_shard_{number}"},
+    }
+# The primary is the first shard. Empty when the tasks aren't sharded.
+TASK_SHARDS = (
+    ['default', *(f'shard_{number}' for number in range(1, len(DB_SHARD_HOSTS) + 1))]
+    if DB_SHARD_HOSTS else []
+)
+
+if sys.argv[1:2] == ['test']:
+    # Separate databases the replica and sharding tests route queries to,
+    # so that they can tell them apart from queries of the primary.
+    for alias in ('replica_test', 'shard_test'):
+        DATABASES[alias] = {
+            **DATABASES['default'],
+            'TEST': {'NAME': f"test_{DATABASES['default']['NAME']}_{alias}"},
+        }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -117,7 +171,10 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
-    'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S'
+    'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -166,6 +223,8 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+BENCHMARK_RESULTS_DIR = BASE_DIR / 'benchmarks'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -176,8 +235,231 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REDIS_HOST = os.getenv('REDIS_HOST')
 REDIS_PORT = os.getenv('REDIS_PORT')
+REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT or 6379}/1' if REDIS_HOST else None
+REDIS_SOCKET_TIMEOUT = 0.5
 
 CELERY_BROKER_URL = f'redis://{REDIS_HOST}:6379/0'
 CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
-CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:6379/0'
+# Nothing reads task results, don't keep them in Redis.
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_STORE_ERRORS_EVEN_IF_IGNORED = False
+CELERY_BEAT_SCHEDULE = {
+    'send-reminders': {
+        'task': 'main.tasks.send_reminders',
+        'schedule': timedelta(minutes=5),
+    },
+    'generate-recurring-tasks': {
+        'task': 'main.tasks.generate_recurring_tasks',
+        'schedule': timedelta(hours=1),
+    },
+    'refresh-category-stats': {
+        'task': 'main.tasks.refresh_category_stats',
+        'schedule': timedelta(minutes=15),
+    },
+    'archive-tasks': {
+        'task': 'main.tasks.archive_tasks',
+        'schedule': timedelta(days=1),
+    },
+    'run-deletion-jobs': {
+        'task': 'main.tasks.run_deletion_jobs',
+        'schedule': timedelta(minutes=1),
+    },
+    'advance-dashboard-counters': {
+        'task': 'main.tasks.advance_dashboard_counters',
+        'schedule': timedelta(minutes=1),
+    },
+    'repair-dashboard-counters': {
+        'task': 'main.tasks.repair_dashboard_counters',
+        'schedule': timedelta(hours=1),
+    },
+}
+
+
+# Reminders
+
+REMINDER_DUE_SOON = timedelta(hours=24)
+REMINDER_OVERDUE_LOOKBACK = timedelta(days=7)
+REMINDER_BATCH_SIZE = 500
+REMINDER_TIME_BUDGET = 60
+
+
+# Recurring tasks
+
+TASK_TEMPLATE_HORIZON = timedelta(days=14)
+TASK_TEMPLATE_BATCH_SIZE = 500
+
+
+# Category analytics
+
+# Reading older statistics queues a refresh before the scheduled one.
+CATEGORY_STATS_MAX_AGE = timedelta(minutes=5)
+
+
+# Archive
+
+# Completed tasks finished longer ago are moved to the archive tables.
+ARCHIVE_AFTER = timedelta(days=365)
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_TIME_BUDGET = 300
 
+
+# Background deletion
+
+DELETION_BATCH_SIZE = 500
+# Longest time in seconds a deletion batch may hold or wait for locks.
+DELETION_LOCK_BUDGET = 0.5
+# Seconds a deletion job runs before it is queued again.
+DELETION_TIME_BUDGET = 60
+# Runs in a row a single locked row may stop before the job fails.
+DELETION_MAX_BLOCKED_RUNS = 5
+
+
+# Metrics
+
+METRICS_BACKEND = (
+    'main.metrics.RedisBackend' if REDIS_URL else 'main.metrics.LocalBackend'
+)
+METRICS_REDIS_KEY = 'metrics'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+# Idempotency keys
+
+IDEMPOTENCY_BACKEND = (
+    'api.idempotency.RedisBackend' if REDIS_URL
+    else 'api.idempotency.LocalBackend'
+)
+IDEMPOTENCY_REDIS_PREFIX = 'idempotency'
+# Seconds a response is replayed for repeats of its key.
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# Seconds a key stays locked by a request that didn't finish.
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+# Seconds a concurrent duplicate waits for the response of the first request.
+IDEMPOTENCY_WAIT = 5
+
+
+# Cached fragments
+
+# Generations of the rows cached values are built from, see `main.generations`.
+GENERATIONS_BACKEND = (
+    'main.generations.RedisBackend' if REDIS_URL
+    else 'main.generations.LocalBackend'
+)
+GENERATIONS_REDIS_PREFIX = 'cache'
+# Seconds a generation is kept, longer than the values built with it.
+GENERATIONS_TTL = 7 * 24 * 60 * 60
+# Seconds a task rendered to JSON is kept, see `api.fragments`.
+TASK_FRAGMENT_TTL = 24 * 60 * 60
+
+
+# Task board
+
+# Tasks of every category shown at first and the most of them per request.
+BOARD_COLUMN_SIZE = 10
+BOARD_MAX_COLUMN_SIZE = 50
+
+
+# Batch retrieval
+
+# Tasks and subtasks one request to `batch/` may ask for.
+BATCH_RETRIEVE_MAX_IDS = 100
+
+
+# Calendar feed
+
+# Tasks read from the database at a time while the feed is streamed.
+CALENDAR_FEED_BATCH_SIZE = 500
+
+
+# Dashboard counters
+
+DASHBOARD_BACKEND = (
+    'main.dashboard.RedisBackend' if REDIS_URL
+    else 'main.dashboard.LocalBackend'
+)
+DASHBOARD_REDIS_PREFIX = 'dashboard'
+# Seconds of the time buckets due dates are scheduled in, a task is shown
+# as overdue at most a bucket and a run of `advance_dashboard_counters` late.
+DASHBOARD_BUCKET_SECONDS = 60
+# Users rebuilt at a time by `repair_dashboard_counters`.
+DASHBOARD_REPAIR_BATCH_SIZE = 500
+
+
+# Throttling
+
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'true').lower() == 'true'
+THROTTLE_BACKEND = (
+    'api.throttling.RedisBackend' if REDIS_URL
+    else 'api.throttling.LocalBackend'
+)
+THROTTLE_REDIS_PREFIX = 'throttle'
+# Bucket capacity and tokens added per second.
+THROTTLE_USER_BUCKET = (300, 5)
+THROTTLE_ANON_BUCKET = (60, 1)
+# Additional buckets of expensive endpoints per user, by `View.action`.
+THROTTLE_VIEW_BUCKETS = {
+    'TaskUpdateViewSet.statistics': (20, 0.5),
+    'TaskUpdateViewSet.timeline': (20, 0.5),
+    'TaskViewSet.timeline': (20, 0.5),
+    'CategoryViewSet.statistics': (20, 0.5),
+    'UserViewSet.list': (60, 1),
+}
+
+
+# Load shedding
+
+LOAD_SHEDDING_PATH_PREFIX = '/api/'
+LOAD_SHEDDING_BACKEND = (
+    'api.load_shedding.RedisBackend' if REDIS_URL
+    else 'api.load_shedding.LocalBackend'
+)
+LOAD_SHEDDING_REDIS_KEY = 'in-flight'
+# Seconds a request may wait for a worker before it is rejected.
+LOAD_SHEDDING_MAX_QUEUE_TIME = float(os.getenv('LOAD_SHEDDING_MAX_QUEUE_TIME', 10))
+# Requests in progress across all workers, not limited when unset.
+LOAD_SHEDDING_MAX_IN_FLIGHT = (
+    int(os.getenv('LOAD_SHEDDING_MAX_IN_FLIGHT'))
+    if os.getenv('LOAD_SHEDDING_MAX_IN_FLIGHT') else None
+)
+# Requests in progress longer than this are counted as lost.
+LOAD_SHEDDING_REQUEST_TIMEOUT = 30
+LOAD_SHEDDING_RETRY_AFTER = 1
+
+
+# Read replicas
+
+# Tasks and subtasks are read from the primaries of their shards.
+DATABASE_ROUTERS = [
+    'main.db.router.ShardRouter',
+    'main.db.router.ReplicaRouter',
+]
+# Seconds a client reads from the primary after a request that may have
+# written. Should be longer than REPLICA_MAX_LAG to read its own writes.
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'primary_until'
+# Seconds a replica may lag behind the primary and still be read from.
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+
+# Slow queries
+
+SLOW_QUERY_BACKEND = (
+    'api.slow_queries.RedisBackend' if REDIS_URL
+    else 'api.slow_queries.LocalBackend'
+)
+SLOW_QUERY_REDIS_KEY = 'slow-queries'
+SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_QUERY_REPEAT_THRESHOLD = 5
+SLOW_QUERY_BUFFER_SIZE = 200
+
+
+# Async views
+
+# Threads per process running the blocking part of async views and
+# middleware under ASGI, 0 runs it in the thread of the request. Django
+# runs its own sync middleware and signals in one more thread, which keeps
+# the last connection of the pool. See `api.concurrency`.
+ASYNC_VIEW_THREADS = int(
+    os.getenv('ASYNC_VIEW_THREADS', max(DATABASES['default']['POOL']['MAX_SIZE'] - 1, 0))
+)